@@ -52,24 +52,6 @@ os.environ["CC"] = "gcc"
 cmdclass = {}
 ext_modules = []
 
-# detrended kriging
-loc = 'smrf/spatial/dk'  # location of the dk folder
-mname = os.path.join(loc, 'detrended_kriging')
-mname = mname.replace('/', '.')
-
-ext_modules += [
-                Extension(mname,
-                          sources=[os.path.join(loc, val) for val in [
-                              "detrended_kriging.pyx",
-                              "krige.c",
-                              "lusolv.c",
-                              "array.c"
-                              ]],
-                          include_dirs=[numpy.get_include()],
-                          extra_compile_args=['-fopenmp', '-O3'],
-                          extra_link_args=['-fopenmp', '-O3']
-                          ),
-                ]
 cmdclass.update({'build_ext': build_ext})
 
 # envphys core c functions
@@ -153,5 +135,6 @@ setup(
     scripts=['scripts/update_configs',
              'scripts/run_smrf',
 	     'scripts/mk_project',
-	     'scripts/gen_maxus']
+	     'scripts/gen_maxus',
+	     'scripts/bench_output']
 )
@@ -1,11 +1,13 @@
 
 from smrf import ipw
+from smrf.envphys import radiation
+import copy
+import hashlib
 import numpy as np
 from netCDF4 import Dataset
-import subprocess as sp
-from multiprocessing import Process
 import os
 import logging
+import tempfile
 
 
 class topo():
@@ -31,7 +33,10 @@ class topo():
         veg_height: numpy array for the veg height
         veg_k: numpy array for the veg K
         veg_tau: numpy array for the veg transmissivity
-        sky_view:
+        sky_view: numpy array for the sky view factor
+        horizon: numpy array [azimuth, y, x] of the cosine of the horizon
+            angle when ``cast_shadows`` is set, otherwise None
+        horizon_azimuths: azimuths of the horizons in degrees
         ny: number of columns in DEM
         nx: number of rows in DEM
         u,v: location of upper left corner
@@ -41,11 +46,18 @@ class topo():
         x,y: position vectors
         X,Y: position grid
         stoporad_in: numpy array for the sky view factor
+        active: flat index of the cells in the mask when ``active_cells`` is
+            set, otherwise None
+        grid_shape: shape of the full grid (ny, nx)
 
     """
 
     images = ['dem', 'mask', 'veg_type', 'veg_height', 'veg_k', 'veg_tau']
 
+    # changed whenever the contents of the topo cache change, so caches
+    # written by an older version are not read
+    cache_version = '2'
+
     def __init__(self, topoConfig, calcInput=True, tempDir=None):
         self.topoConfig = topoConfig
 
@@ -68,6 +80,108 @@ class topo():
             self.stoporadInput()
         else:
             self.stoporad_in_file = None
+            self.horizon = None
+            self.horizon_azimuths = None
+
+        # only calculate the cells in the mask
+        self.grid_shape = (self.ny, self.nx)
+        self.active = None
+        if self.topoConfig.get('active_cells', False):
+            self.setActive()
+
+    def setActive(self):
+        """
+        Find the flat index of the cells in the mask for the active cells
+        mode. The distribution then works on a (1, nactive) grid of only the
+        cells in the mask, from
+        :mod:`~smrf.data.loadTopo.topo.compressed`, and the full grid is only
+        filled in when the variables are output.
+        """
+
+        if self.mask is None:
+            self._logger.warning('No mask was given, active_cells will '
+                                 'use the full grid')
+            return
+
+        self.active = np.flatnonzero(np.asarray(self.mask).ravel() > 0)
+        if len(self.active) == 0:
+            raise ValueError('active_cells requires at least one cell in '
+                             'the mask')
+
+        self._logger.info('Using {} active cells out of {} ({:.0%})'
+                          .format(len(self.active), self.nx * self.ny,
+                                  len(self.active) / (self.nx * self.ny)))
+
+    def compress(self, data):
+        """
+        Take the active cells from a full grid, any leading dimensions are
+        kept. Anything that is not a full grid is returned as is.
+
+        Args:
+            data: numpy array with the last two dimensions the full grid
+
+        Returns:
+            numpy array with the last two dimensions (1, nactive)
+        """
+
+        if self.active is None or data is None or np.ndim(data) < 2 or \
+                np.shape(data)[-2:] != self.grid_shape:
+            return data
+
+        lead = data.shape[:-2]
+        d = data.reshape(lead + (-1,))[..., self.active]
+        return d.reshape(lead + (1, len(self.active)))
+
+    def expand(self, data, fill=np.nan):
+        """
+        Scatter the active cells back to the full grid, anything that is not
+        an active cells grid is returned as is.
+
+        Args:
+            data: numpy array with the last two dimensions (1, nactive)
+            fill: value for the cells outside of the mask
+
+        Returns:
+            numpy array with the last two dimensions the full grid
+        """
+
+        if self.active is None or data is None or np.ndim(data) < 2 or \
+                np.shape(data)[-2:] != (1, len(self.active)):
+            return data
+
+        lead = data.shape[:-2]
+        dtype = data.dtype
+        if not np.issubdtype(dtype, np.floating):
+            dtype = np.float64
+
+        d = np.full(lead + (self.grid_shape[0] * self.grid_shape[1],), fill,
+                    dtype=dtype)
+        d[..., self.active] = data.reshape(lead + (-1,))
+        return d.reshape(lead + self.grid_shape)
+
+    def compressed(self):
+        """
+        A copy of the topo with every full grid image compressed to the
+        active cells, with ``ny`` and ``nx`` of the compressed grid. The
+        position vectors ``x`` and ``y`` are still for the full grid.
+
+        Returns:
+            topo instance for the distribution, itself if there are no
+            active cells
+        """
+
+        if self.active is None:
+            return self
+
+        t = copy.copy(self)
+        for k, v in self.__dict__.items():
+            if isinstance(v, np.ndarray):
+                setattr(t, k, self.compress(v))
+
+        t.ny = 1
+        t.nx = len(self.active)
+
+        return t
 
     def readImages(self):
         """
@@ -79,12 +193,14 @@ class topo():
         # read in the images
         for v in self.images:
             if v in self.topoConfig:
-                i = ipw.IPW(self.topoConfig[v])
+                # decode the band straight to double, only the first band
+                # is read from the file
+                i = ipw.IPW(self.topoConfig[v], dtype=np.float64)
 
                 if v == 'veg_type':
                     setattr(self, v, i.bands[0].data.astype(int))
                 else:
-                    setattr(self, v, i.bands[0].data.astype(np.float64))
+                    setattr(self, v, i.bands[0].data)
 
                 if v == 'dem':
                     # get some general information about the model
@@ -150,92 +266,200 @@ class topo():
 
         f.close()
 
-    def stoporadInput(self):
+    def cacheFile(self):
         """
-        Calculate the necessary input file for stoporad
-        The IPW and WORKDIR environment variables must be set
-        """
-        if self.topoConfig['type'] != 'ipw':
+        File name of the cached topographic derivatives in ``topo_cache_dir``,
+        named by a hash of the DEM, the grid locations and the
+        ``cache_version`` so a changed DEM or an older cache is never read.
 
-            f = os.path.abspath(os.path.expanduser(os.path.join(self.tempDir,
-                                                                'dem.ipw')))
-            i = ipw.IPW()
-            i.new_band(self.dem)
+        Returns:
+            path to the NetCDF file or None if there is no cache directory
+        """
 
-            i.add_geo_hdr([self.x[0], self.y[0]],
-                          [np.mean(np.diff(self.x)), np.mean(np.diff(self.y))],
-                          'm', 'UTM')
-            i.write(f, 16)
+        directory = self.topoConfig.get('topo_cache_dir')
+        if directory is None:
+            return None
 
-            self.topoConfig['dem'] = f
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
 
-        # calculate the skyview
-        svfile = os.path.abspath(os.path.expanduser(
-            os.path.join(self.tempDir, 'sky_view.ipw')
-            ))
-        self._logger.debug('sky view file - %s' % svfile)
+        h = hashlib.sha1(self.cache_version.encode())
+        for v in [self.dem, self.x, self.y]:
+            h.update(np.ascontiguousarray(v, dtype=np.float64).tobytes())
+        h.update(str(self.topoConfig.get('gradient_dtype')).encode())
+        h.update(str(self.topoConfig.get('horizon_azimuths')).encode())
+        h.update(str(self.topoConfig.get('cast_shadows', False)).encode())
 
-#         _viewf(self.topoConfig['dem'], svfile)
-        ts = Process(target=self._viewf, args=(self.topoConfig['dem'], svfile))
-        ts.start()
+        return os.path.join(directory, 'topo_{}.nc'.format(h.hexdigest()))
 
-        # calculate the gradient
-        gfile = os.path.abspath(os.path.expanduser(
-            os.path.join(self.tempDir, 'gradient.ipw')
-            ))
-        self._logger.debug('gradient file - %s' % gfile)
+    def readCache(self, cache_file):
+        """
+        Read the slope, aspect, sky view and horizons from the cache and
+        write the stoporad input file back to the temporary directory
 
-#         _gradient(self.topoConfig['dem'], gfile)
-        tg = Process(target=self._gradient,
-                     args=(self.topoConfig['dem'], gfile))
-        tg.start()
+        Args:
+            cache_file: path to the cached NetCDF file
+        """
 
-        # wait for the processes to stop
-        tg.join()
-        ts.join()
+        self._logger.info('Reading the topographic derivatives from {}'
+                          .format(cache_file))
 
-        # combine into a value
         sfile = os.path.abspath(os.path.expanduser(
             os.path.join(self.tempDir, 'stoporad_in.ipw')
             ))
-        self._logger.debug('stoporad in file - %s' % sfile)
 
-        cmd = 'mux %s %s %s > %s' % (self.topoConfig['dem'],
-                                     gfile,
-                                     svfile,
-                                     sfile)
-        proc = sp.Popen(cmd, shell=True).wait()
+        with Dataset(cache_file, 'r') as f:
+            self.slope = f.variables['slope'][:].astype(np.float64)
+            self.aspect = f.variables['aspect'][:].astype(np.float64)
+            self.sky_view = f.variables['sky_view'][:].astype(np.float64)
 
-        if proc != 0:
-            raise OSError('mux for stoporad_in.ipw failed')
+            self.horizon_azimuths = f.variables['azimuth'][:]
+            self.horizon = None
+            if self.topoConfig.get('cast_shadows', False):
+                self.horizon = f.variables['horizon'][:].astype(np.float32)
+
+            with open(sfile, 'wb') as fid:
+                fid.write(f.variables['stoporad_in'][:].tobytes())
+
+        self.readStoporadIn(sfile)
+
+    def writeCache(self, cache_file, H):
+        """
+        Save the slope, aspect, sky view, horizons and the bytes of the
+        stoporad input file to the cache
+
+        Args:
+            cache_file: path to the cached NetCDF file
+            H: numpy array of the horizons, None if they are not kept
+        """
+
+        self._logger.info('Saving the topographic derivatives to {}'
+                          .format(cache_file))
+
+        with open(self.stoporad_in_file, 'rb') as fid:
+            stoporad_in = np.frombuffer(fid.read(), dtype=np.uint8)
+
+        # write to a unique temporary file so a partial file is never read
+        # and concurrent runs don't write to the same file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(cache_file),
+                                   suffix='.nc')
+        os.close(fd)
+        try:
+            with Dataset(tmp, 'w') as f:
+                f.createDimension('y', self.ny)
+                f.createDimension('x', self.nx)
+                f.createDimension('azimuth', len(self.horizon_azimuths))
+                f.createDimension('stoporad_in_bytes', len(stoporad_in))
+
+                f.createVariable('y', 'f8', ('y',))[:] = self.y
+                f.createVariable('x', 'f8', ('x',))[:] = self.x
+                f.createVariable('azimuth', 'f8', ('azimuth',))[:] = \
+                    self.horizon_azimuths
+
+                for v in ['slope', 'aspect', 'sky_view']:
+                    f.createVariable(v, 'f8', ('y', 'x'), zlib=True)[:] = \
+                        getattr(self, v)
+
+                if H is not None:
+                    f.createVariable('horizon', 'f4', ('azimuth', 'y', 'x'),
+                                     zlib=True,
+                                     chunksizes=(1, self.ny, self.nx))[:] = H
+
+                f.createVariable('stoporad_in', 'u1',
+                                 ('stoporad_in_bytes',))[:] = stoporad_in
+
+            os.replace(tmp, cache_file)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def readStoporadIn(self, sfile):
+        """
+        Read the stoporad input file and decode every band, as the IPW
+        bands are memory mapped and the file is written again in place by
+        later runs with the same temporary directory
+
+        Args:
+            sfile: path to the stoporad input file
+        """
 
-        # read in the stoporad file to store in memory
         self.stoporad_in = ipw.IPW(sfile)
+        for b in self.stoporad_in.bands:
+            b.data
+
         self.stoporad_in_file = sfile
-        self.slope = self.stoporad_in.bands[1].data.astype(np.float64)
-        self.aspect = self.stoporad_in.bands[2].data.astype(np.float64)
-        self.sky_view = self.stoporad_in.bands[3].data.astype(np.float64)
 
-        # clean up the WORKDIR
-        os.remove(gfile)
-        os.remove(svfile)
+    def stoporadInput(self):
+        """
+        Calculate the necessary input file for stoporad
 
-        if self.topoConfig['type'] != 'ipw':
-            os.remove(self.topoConfig['dem'])
-            self.topoConfig.pop('dem', None)
+        The slope and aspect come from
+        :mod:`smrf.envphys.radiation.gradient` and the sky view from the
+        horizons in ``horizon_azimuths`` directions from
+        :mod:`smrf.envphys.radiation.horizon`, which are written together
+        with the DEM and the terrain configuration factor to the stoporad
+        input file. The horizons are kept for
+        the cast shadows if ``cast_shadows`` is set, otherwise the sky view
+        is summed one azimuth at a time and the horizons are not stored.
+
+        If ``topo_cache_dir`` is set, the slope, aspect, sky view, horizons
+        and stoporad input are read from the cache for the same DEM instead.
+        """
 
-    def _gradient(self, demFile, gradientFile):
-        # calculate the gradient
-        cmd = 'gradient %s > %s' % (demFile, gradientFile)
-        proc = sp.Popen(cmd, shell=True, env=os.environ.copy()).wait()
+        cache_file = self.cacheFile()
+        if cache_file is not None and os.path.isfile(cache_file):
+            self.readCache(cache_file)
+            return
+
+        dx = np.mean(np.diff(self.x))
+        dy = np.mean(np.diff(self.y))
+
+        self._logger.debug('Calculating the slope and aspect')
+        self.slope, self.aspect = radiation.gradient(
+            self.dem, dx, dy,
+            dtype=np.dtype(self.topoConfig.get('gradient_dtype', 'float64')),
+            nthreads=self.topoConfig.get('gradient_nthreads', 1))
+
+        # calculate the horizons and the sky view
+        n = self.topoConfig.get('horizon_azimuths', 36)
+        self._logger.debug('Calculating the horizons in {} azimuths'
+                           .format(n))
+        self.horizon_azimuths = np.linspace(-180, 180, n, endpoint=False)
+        nthreads = self.topoConfig.get('horizon_nthreads', 1)
+
+        # only keep every azimuth for the cast shadows
+        if self.topoConfig.get('cast_shadows', False):
+            H = radiation.horizon(self.dem, dx, dy, self.horizon_azimuths,
+                                  nthreads=nthreads)
+        else:
+            H = radiation.iter_horizon(self.dem, dx, dy,
+                                       self.horizon_azimuths,
+                                       nthreads=nthreads)
+
+        self.sky_view = radiation.sky_view_factor(H, self.horizon_azimuths,
+                                                  self.slope, self.aspect)
+
+        self.horizon = None
+        if self.topoConfig.get('cast_shadows', False):
+            self.horizon = H
+
+        # combine into the stoporad input
+        sfile = os.path.abspath(os.path.expanduser(
+            os.path.join(self.tempDir, 'stoporad_in.ipw')
+            ))
+        self._logger.debug('stoporad in file - %s' % sfile)
 
-        if proc != 0:
-            raise OSError('gradient failed')
+        # the same bands as the IPW gradient and viewf output
+        i = ipw.IPW()
+        for v in [self.dem, self.slope, self.aspect, self.sky_view,
+                  radiation.terrain_config(self.slope, self.sky_view)]:
+            i.new_band(v)
+        # the geo header is the origin and spacing of the image lines then
+        # samples, the IPW version passed x first for the DEM file
+        i.add_geo_hdr([self.y[0], self.x[0]], [dy, dx], 'm', 'UTM')
+        i.write(sfile, 16)
 
-    def _viewf(self, demFile, viewfFile):
-        # calculate the sky view file
-        cmd = 'viewf %s > %s' % (demFile, viewfFile)
-        proc = sp.Popen(cmd, shell=True, env=os.environ.copy()).wait()
+        self.readStoporadIn(sfile)
 
-        if proc != 0:
-            raise OSError('viewf failed')
+        if cache_file is not None:
+            self.writeCache(cache_file, self.horizon)
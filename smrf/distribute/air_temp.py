@@ -59,8 +59,11 @@ class ta(image_data.image_data):
 
     def initialize(self, topo, data):
         """
-        Initialize the distribution, soley calls
-        :mod:`smrf.distribute.image_data.image_data._initialize`.
+        Initialize the distribution, calls
+        :mod:`smrf.distribute.image_data.image_data._initialize`,
+        :mod:`smrf.distribute.image_data.image_data._initialize_trend` and
+        :mod:`smrf.distribute.image_data.image_data._initialize_batch` as
+        air temperature does not depend on the previous time step.
 
         Args:
             topo: :mod:`smrf.data.loadTopo.topo` instance contain topographic
@@ -72,6 +75,8 @@ class ta(image_data.image_data):
 
         self._logger.debug('Initializing distribute.air_temp')
         self._initialize(topo, data.metadata)
+        self._initialize_trend(data.air_temp)
+        self._initialize_batch(data.air_temp)
 
     def distribute(self, data):
         """
@@ -108,3 +113,4 @@ class ta(image_data.image_data):
             self.distribute(data.loc[t])
 
             queue[self.variable].put([t, self.air_temp])
+            self._put_variance(queue, t)
@@ -1,5 +1,5 @@
 import numpy as np
-from smrf.spatial import idw, dk, grid, kriging
+from smrf.spatial import idw, dk, grid, kriging, regrid, trend
 import logging
 
 
@@ -38,6 +38,8 @@ class image_data():
             :mod:`smrf.spatial.idw.IDW`
         dk: Detrended kriging instance from :mod:`smrf.spatial.dk.dk.DK`
         grid: Gridded interpolation instance from :mod:`smrf.spatial.grid.GRID`
+        regrid: Bilinear regridding instance from
+            :mod:`smrf.spatial.regrid.REGRID`
 
     """
 
@@ -48,6 +50,20 @@ class image_data():
 
         self.gridded = False
 
+        # calculate the kriging variance, set when it is output
+        self.output_variance = False
+        self.variance_variables = []
+        setattr(self, '{}_variance'.format(variable), None)
+
+        # blocks of time steps distributed at once
+        self.batch_data = None
+        self.batch = None
+        self.batch_index = {}
+
+        # elevational trend for all time steps
+        self.trend = None
+        self.trend_data = None
+
         self._base_logger = logging.getLogger(__name__)
 
     def getConfig(self, cfg):
@@ -64,7 +80,7 @@ class image_data():
         # check of gridded interpolation
         self.gridded = False
         if 'distribution' in cfg.keys():
-            if cfg['distribution'] == 'grid':
+            if cfg['distribution'] in ['grid', 'regrid']:
                 self.gridded = True          
 
         self.getStations(cfg)
@@ -100,7 +116,7 @@ class image_data():
 
         Raises:
             Exception: If the distribution method could not be determined, must
-                be idw, dk, or grid
+                be idw, idw_knn, dk, grid, regrid or kriging
 
         To do:
             - make a single call to the distribution initialization
@@ -136,25 +152,197 @@ class image_data():
         if self.config['distribution'] == 'idw':
             # inverse distance weighting
             self.idw = idw.IDW(self.mx, self.my, topo.X, topo.Y, mz=self.mz,
-                               GridZ=topo.dem, power=self.config['power'])
+                               GridZ=topo.dem, power=self.config['power'],
+                               cache_size=self.config['idw_cache_size'])
+
+        elif self.config['distribution'] == 'idw_knn':
+            # inverse distance weighting of the nearest stations
+            self.idw = idw.KNNIDW(self.mx, self.my, topo.X, topo.Y,
+                                  mz=self.mz, GridZ=topo.dem,
+                                  power=self.config['power'],
+                                  cache_size=self.config['idw_cache_size'],
+                                  k=self.config['idw_neighbors'],
+                                  radius=self.config['idw_radius'])
 
         elif self.config['distribution'] == 'dk':
             # detrended kriging
             self.dk = dk.DK(self.mx, self.my, self.mz, topo.X, topo.Y, topo.dem, self.config)
 
         elif self.config['distribution'] == 'grid':
-            # linear interpolation between points
+            # linear interpolation between points, the stations in the mask
+            # are found on the full grid for the active cells
             self.grid = grid.GRID(self.config, self.mx, self.my, topo.X, topo.Y, mz=self.mz,
-                                  GridZ=topo.dem, mask=topo.mask)
+                                  GridZ=topo.dem, mask=topo.expand(topo.mask, fill=0),
+                                  x=topo.x, y=topo.y,
+                                  cache_size=self.config['grid_cache_size'])
+
+        elif self.config['distribution'] == 'regrid':
+            # bilinear regridding of the gridded model data
+            self.regrid = regrid.REGRID(metadata.index, self.mx, self.my,
+                                        topo.X, topo.Y, mz=self.mz,
+                                        GridZ=topo.dem)
 
         elif self.config['distribution'] == 'kriging':
             # generic kriging
-            self.kriging = kriging.KRIGE(self.mx, self.my, self.mz, topo.X, topo.Y, topo.dem, self.config)
+            self.kriging = kriging.KRIGE(self.mx, self.my, self.mz, topo.X, topo.Y, topo.dem, self.config,
+                                         variance=self.output_variance)
 
         else:
             raise Exception("Could not determine the distribution method for "
                             "{}".format(self.variable))
 
+    def _initialize_batch(self, data):
+        """
+        Distribute blocks of time steps at once for a variable that does not
+        depend on the previous time step. Consecutive time steps with the same
+        stations with data, up to ``batch_size``, are distributed with a single
+        matrix multiply and held until
+        :mod:`~smrf.distribute.image_data.image_data._distribute` asks for
+        them. Only used for the idw, idw_knn, dk and regrid distributions.
+
+        Args:
+            data: Pandas dataframe for all the time steps of the variable
+        """
+
+        batch_size = self.config.get('batch_size')
+        if batch_size is None or batch_size <= 1 or \
+                self.config['distribution'] not in ['idw', 'idw_knn', 'dk',
+                                                    'regrid']:
+            return
+
+        self._base_logger.debug('Distributing {} in blocks of up to {} time '
+                                'steps'.format(self.variable, batch_size))
+        self.batch_size = int(batch_size)
+        self.batch_data = data[self.stations]
+
+    def _initialize_trend(self, data):
+        """
+        Calculate the elevational trend of every time step at once with
+        :mod:`smrf.spatial.trend.elevation_trend` so the spatial classes
+        don't refit the trend each time step. The trend for a time step is
+        only used if the data given to
+        :mod:`~smrf.distribute.image_data.image_data._distribute` is the same
+        as the data the trend was calculated from.
+
+        Args:
+            data: Pandas dataframe for all the time steps of the variable
+        """
+
+        if not self.config.get('detrend') or \
+                self.config['distribution'] not in ['idw', 'idw_knn', 'dk',
+                                                    'grid', 'regrid',
+                                                    'kriging']:
+            return
+
+        data = data[self.stations]
+        mask = np.ones(len(self.stations), dtype=bool)
+        flag = self.config['slope']
+
+        if self.config['distribution'] == 'grid':
+            mask = self.grid.mask
+        elif self.config['distribution'] == 'kriging':
+            # kriging has never applied the slope constraint
+            flag = 0
+
+        self._base_logger.debug('Calculating the elevational trend of {} for '
+                                'all time steps'.format(self.variable))
+        self.trend = trend.elevation_trend(self.mz[mask],
+                                           data.values[:, mask].T,
+                                           flag)
+        self.trend_data = data
+
+    def _get_trend(self, index, values):
+        """
+        Get the elevational trend for the time steps if the data has not
+        changed since :mod:`~smrf.distribute.image_data.image_data._initialize_trend`
+
+        Args:
+            index: date times of the time steps
+            values: (T, nsta) array of the data for the time steps
+
+        Returns:
+            (T, 2) array of the slope and intercept or None
+        """
+
+        if self.trend is None:
+            return None
+
+        i = self.trend_data.index.get_indexer(index)
+        if np.any(i < 0) or \
+                not np.array_equal(self.trend_data.values[i], values,
+                                   equal_nan=True):
+            return None
+
+        return self.trend[i]
+
+    def _use_batch(self, data, zeros=None):
+        """
+        Whether the time step can come from the block distribution, only if
+        the data is the same as the data the blocks are distributed from
+
+        Args:
+            data: Pandas series of the stations for a single time step
+            zeros: data values that should be treated as zeros
+
+        Returns:
+            bool
+        """
+
+        if self.batch_data is None or zeros is not None or \
+                data.name not in self.batch_data.index:
+            return False
+
+        return np.array_equal(self.batch_data.loc[data.name].values,
+                              data.values, equal_nan=True)
+
+    def _distribute_batch(self, t):
+        """
+        Get the distributed values for a time step, distributing the block of
+        time steps starting at ``t`` if it has not been distributed yet
+
+        Args:
+            t: the date time of the time step
+
+        Returns:
+            the distributed values for the time step
+        """
+
+        i = self.batch_index.get(t)
+        if i is not None:
+            return self.batch[i]
+
+        # consecutive time steps with the same stations with data
+        start = self.batch_data.index.get_loc(t)
+        values = self.batch_data.values[start:start + self.batch_size]
+        nan_val = np.isnan(values)
+        change = np.any(nan_val != nan_val[0], axis=1)
+        n = np.argmax(change) if np.any(change) else values.shape[0]
+        d = values[:n].T
+        pv = self._get_trend(self.batch_data.index[start:start+n], values[:n])
+
+        if self.config['distribution'] in ['idw', 'idw_knn']:
+            if self.config['detrend']:
+                self.batch = self.idw.detrendedIDWBlock(d,
+                                                        self.config['slope'],
+                                                        pv)
+            else:
+                self.batch = self.idw.calculateIDWBlock(d)
+
+        elif self.config['distribution'] == 'dk':
+            self.batch = self.dk.calculateBlock(d, pv)
+
+        elif self.config['distribution'] == 'regrid':
+            if self.config['detrend']:
+                self.batch = self.regrid.detrendedRegridBlock(
+                    d, self.config['slope'], pv)
+            else:
+                self.batch = self.regrid.calculateRegridBlock(d)
+
+        self.batch_index = dict((tb, j) for j, tb in
+                                enumerate(self.batch_data.index[start:start+n]))
+
+        return self.batch[0]
+
     def _distribute(self, data, other_attribute=None, zeros=None):
         """
         Distribute the data using the defined distribution method in
@@ -178,35 +366,82 @@ class image_data():
             raise Exception("{}: All data values are NaN"
                             "".format(self.variable))
 
-        if self.config['distribution'] == 'idw':
+        # elevational trend from the trend of all the time steps
+        pv = self._get_trend([data.name], data.values[np.newaxis])
+        if pv is not None:
+            pv = pv[0]
+
+        if self._use_batch(data, zeros):
+            v = self._distribute_batch(data.name)
+
+        elif self.config['distribution'] in ['idw', 'idw_knn']:
             if self.config['detrend']:
                 v = self.idw.detrendedIDW(data.values,
                                           self.config['slope'],
-                                          zeros=zeros)
+                                          zeros=zeros,
+                                          pv=pv)
             else:
                 v = self.idw.calculateIDW(data.values)
 
         elif self.config['distribution'] == 'dk':
-            v = self.dk.calculate(data.values)
+            v = self.dk.calculate(data.values, pv)
 
         elif self.config['distribution'] == 'grid':
             if self.config['detrend']:
                 v = self.grid.detrendedInterpolation(data.values,
                                                      self.config['slope'],
-                                                     self.config['grid_method'])
+                                                     self.config['grid_method'],
+                                                     pv)
             else:
                 v = self.grid.calculateInterpolation(data.values,
                                                      self.config['grid_method'])
 
+        elif self.config['distribution'] == 'regrid':
+            if self.config['detrend']:
+                v = self.regrid.detrendedRegrid(data.values,
+                                                self.config['slope'], pv)
+            else:
+                v = self.regrid.calculateRegrid(data.values)
+
         elif self.config['distribution'] == 'kriging':
-            v, ss = self.kriging.calculate(data.values)
-            setattr(self, '{}_variance'.format(self.variable), ss)
+            v, ss = self.kriging.calculate(data.values, data.name, pv)
+            if other_attribute is not None:
+                setattr(self, '{}_variance'.format(other_attribute), ss)
+            else:
+                setattr(self, '{}_variance'.format(self.variable), ss)
 
         if other_attribute is not None:
             setattr(self, other_attribute, v)
         else:
             setattr(self, self.variable, v)
 
+    def add_variance(self, name):
+        """
+        Calculate and output the kriging variance of a distributed variable
+
+        Args:
+            name: name of the variance, the distributed attribute followed
+                by ``_variance``
+        """
+
+        self.output_variance = True
+        if name not in self.variance_variables:
+            self.variance_variables.append(name)
+        setattr(self, name, None)
+
+    def _put_variance(self, queue, t):
+        """
+        Put the kriging variance that is output into the queue, used by the
+        distribute_thread functions
+
+        Args:
+            queue: queue dictionary for all variables
+            t: time stamp
+        """
+
+        for v in self.variance_variables:
+            queue[v].put([t, getattr(self, v)])
+
     def post_processor(self, output_func):
         """
         Each distributed variable has the oppurtunity to do post processing on
@@ -121,6 +121,8 @@ class ppt(image_data.image_data):
         self._logger.debug('Initializing distribute.precip')
 
         self._initialize(topo, data.metadata)
+        self._initialize_trend(data.precip)
+        self._initialize_batch(data.precip)
         self.percent_snow = np.zeros((topo.ny, topo.nx))
         self.snow_density = np.zeros((topo.ny, topo.nx))
         self.storm_days = np.zeros((topo.ny, topo.nx))
@@ -146,7 +148,8 @@ class ppt(image_data.image_data):
                     self.storm_days = np.zeros((topo.ny, topo.nx))
 
                 else:
-                    self.storm_days = f.variables['storm_days'][time_ind,:,:][0]
+                    self.storm_days = topo.compress(
+                        f.variables['storm_days'][time_ind,:,:][0])
             else:
                 self._logger.warning('Variable {} not in {}, setting to 0.0'.format('storm_days', self.config['storm_days_restart']))
                 self.storm_days = np.zeros((topo.ny, topo.nx))
@@ -197,7 +200,8 @@ class ppt(image_data.image_data):
         # if redistributing due to wind
         if self.config['distribute_drifts']:
             self._tbreak_file = nc.Dataset(self.config['tbreak_netcdf'], 'r')
-            self.tbreak = self._tbreak_file.variables['tbreak'][:]
+            self.tbreak = topo.compress(
+                self._tbreak_file.variables['tbreak'][:])
             self.tbreak_direction = self._tbreak_file.variables['direction'][:]
             self._tbreak_file.close()
             self._logger.debug('Read data from {}'
@@ -220,7 +224,8 @@ class ppt(image_data.image_data):
         self.mask = topo.mask
 
     def distribute(self, data, dpt, precip_temp, ta, time, wind, temp, az,
-                   dir_round_cell, wind_speed, cell_maxus, mask=None):
+                   dir_round_cell, wind_speed, cell_maxus, mask=None,
+                   context=None):
         """
         Distribute given a Panda's dataframe for a single time step. Calls
         :mod:`smrf.distribute.image_data.image_data._distribute`.
@@ -245,9 +250,17 @@ class ppt(image_data.image_data):
             temp:   station air temperature at time step
             mask:   basin mask to apply to the storm days for calculating the
                     last storm day for the basin
+            context: row of the time step context from
+                    :mod:`smrf.utils.utils.timestep_context`, if not given
+                    the water day is calculated from ``time``
         """
 
         self._logger.debug('%s Distributing all precip' % data.name)
+
+        if context is not None:
+            wy_day = context['wy_day']
+        else:
+            wy_day = utils.water_day(time)[0]
         # only need to distribute precip if there is any
         data = data[self.stations]
 
@@ -267,6 +280,7 @@ class ppt(image_data.image_data):
                                           precip_temp,
                                           ta,
                                           time,
+                                          wy_day,
                                           mask=mask)
 
         else:
@@ -279,7 +293,8 @@ class ppt(image_data.image_data):
                                                     self.config,
                                                     self.metadata)
 
-            self.distribute_for_susong1999(data, precip_temp, time, mask=mask)
+            self.distribute_for_susong1999(data, precip_temp, time, wy_day,
+                                           mask=mask)
 
         # redistribute due to wind to account for driftin
         if self.config['distribute_drifts']:
@@ -290,7 +305,8 @@ class ppt(image_data.image_data):
                                             self.tbreak_direction, self.veg_type,
                                             self.veg, self.config)
 
-    def distribute_for_marks2017(self, data, precip_temp, ta, time, mask=None):
+    def distribute_for_marks2017(self, data, precip_temp, ta, time, wy_day,
+                                 mask=None):
         """
         Specialized distribute function for working with the new accumulated
         snow density model Marks2017 requires storm total and a corrected
@@ -358,6 +374,7 @@ class ppt(image_data.image_data):
         else:
             self.storm_days += self.time_step/60.0/24.0
             self.precip = np.zeros(self.storm_days.shape)
+            self.precip_variance = None
             perc_snow = np.zeros(self.storm_days.shape)
             snow_den = np.zeros(self.storm_days.shape)
 
@@ -366,8 +383,7 @@ class ppt(image_data.image_data):
         self.snow_density = snow_den
 
         # day of last storm, this will be used in albedo
-        self.last_storm_day = utils.water_day(data.name)[0] - \
-            self.storm_days - 0.001
+        self.last_storm_day = wy_day - self.storm_days - 0.001
 
         # get the time since most recent storm
         if mask is not None:
@@ -376,7 +392,8 @@ class ppt(image_data.image_data):
             self.last_storm_day_basin = np.max(self.last_storm_day)
 
 
-    def distribute_for_susong1999(self, data, ppt_temp, time, mask=None):
+    def distribute_for_susong1999(self, data, ppt_temp, time, wy_day,
+                                  mask=None):
         """
         Docs for susong1999
         """
@@ -414,12 +431,12 @@ class ppt(image_data.image_data):
 
             # make everything else zeros
             self.precip = np.zeros(self.storm_days.shape)
+            self.precip_variance = None
             self.percent_snow = np.zeros(self.storm_days.shape)
             self.snow_density = np.zeros(self.storm_days.shape)
 
         # day of last storm, this will be used in albedo
-        self.last_storm_day = utils.water_day(data.name)[0] - \
-            self.storm_days - 0.001
+        self.last_storm_day = wy_day - self.storm_days - 0.001
 
         # get the time since most recent storm
         if mask is not None:
@@ -428,7 +445,7 @@ class ppt(image_data.image_data):
             self.last_storm_day_basin = np.max(self.last_storm_day)
 
 
-    def distribute_thread(self, queue, data, date, mask=None):
+    def distribute_thread(self, queue, data, date, mask=None, context=None):
         """
         Distribute the data using threading and queue. All data is provided and
         ``distribute_thread`` will go through each time step and call
@@ -444,6 +461,8 @@ class ppt(image_data.image_data):
         Args:
             queue: queue dictionary for all variables
             data: pandas dataframe for all data, indexed by date time
+            context: time step context from
+                :mod:`smrf.utils.utils.timestep_context`
         """
 
         for t in data.precip.index:
@@ -460,7 +479,8 @@ class ppt(image_data.image_data):
 
             self.distribute(data.precip.loc[t], dpt, precip_temp, ta, t,
                             data.wind_speed.loc[t],data.air_temp.loc[t],
-                            az, dir_round_cell, flatwind, cell_maxus, mask=mask)
+                            az, dir_round_cell, flatwind, cell_maxus, mask=mask,
+                            context=None if context is None else context.loc[t])
 
             queue[self.variable].put([t, self.precip])
 
@@ -476,6 +496,8 @@ class ppt(image_data.image_data):
             if self.nasde_model == "marks2017":
                 queue['storm_id'].put([t, self.storm_id])
 
+            self._put_variance(queue, t)
+
 
 
     def post_processor(self, main_obj, threaded=False):
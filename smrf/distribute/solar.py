@@ -2,6 +2,7 @@
 import numpy as np
 import logging, os
 import subprocess as sp
+from datetime import datetime, timedelta
 from multiprocessing import Process
 from smrf.distribute import image_data
 from smrf.envphys import radiation
@@ -28,6 +29,10 @@ class solar(image_data.image_data):
     the atmosphere :cite:`Dozier:1980` :cite:`Dozier&Frew:1981`
     :cite:`Dubayah:1994`. Terrain correction using the DEM adjusts for terrain
     shading and splits the clear sky radiation into beam and diffuse radiation.
+    Setting ``clear_sky_method = native`` in the [solar] section performs the
+    same calculation in process with
+    :mod:`smrf.envphys.radiation.stoporad`, avoiding the ``stoporad``
+    subprocess and temporary files for every time step.
 
     The second step requires sites measuring solar radiation. The measured
     solar radiation is compared to the modeled clear sky radiation from
@@ -228,8 +233,9 @@ class solar(image_data.image_data):
 
     def initialize(self, topo, data):
         """
-        Initialize the distribution, soley calls
-        :mod:`smrf.distribute.image_data.image_data._initialize`. Sets the
+        Initialize the distribution, calls
+        :mod:`smrf.distribute.image_data.image_data._initialize`, and the
+        trend and blocks of time steps of the cloud factor. Sets the
         following attributes:
 
         * :py:attr:`veg_height`
@@ -247,12 +253,25 @@ class solar(image_data.image_data):
         self._logger.debug('Initializing distribute.solar')
 
         self._initialize(topo, data.metadata)
+        self._initialize_trend(data.cloud_factor)
+        self._initialize_batch(data.cloud_factor)
         self.veg_height = topo.veg_height
         self.veg_tau = topo.veg_tau
         self.veg_k = topo.veg_k
 
+        # stoporad calculates the full grid
+        self.compress = topo.compress
+
+        if self.config['clear_sky_method'] == 'native':
+            self.dem = topo.dem
+            self.slope = topo.slope
+            self.aspect = topo.aspect
+            self.sky_view = topo.sky_view
+            self.horizon = topo.horizon
+            self.horizon_azimuths = topo.horizon_azimuths
+
     def distribute(self, data, illum_ang, cosz, azimuth, min_storm_day,
-                   albedo_vis, albedo_ir):
+                   albedo_vis, albedo_ir, context=None):
         """
         Distribute air temperature given a Panda's dataframe for a single time
         step. Calls :mod:`smrf.distribute.image_data.image_data._distribute`.
@@ -283,6 +302,10 @@ class solar(image_data.image_data):
                 :mod:`smrf.distribute.albedo.albedo.albedo_vis`
             albedo_ir: numpy array for infrared albedo, from
                 :mod:`smrf.distribute.albedo.albedo.albedo_ir`
+            context: row of the time step context from
+                :mod:`smrf.utils.utils.timestep_context`, if not given the
+                dates are calculated with
+                :mod:`~smrf.distribute.solar.solar.radiation_dates`
 
         """
 
@@ -294,7 +317,8 @@ class solar(image_data.image_data):
         # only need to calculate solar if the sun is up
         if cosz > 0:
 
-            wy_day, wyear, tz_min_west = self.radiation_dates(data.name)
+            wy_day, wyear, tz_min_west = self.radiation_dates(data.name,
+                                                              context)
 
             # --------------------------------------------
             # calculate clear sky radiation
@@ -462,8 +486,9 @@ class solar(image_data.image_data):
 
             queue['net_solar'].put([t, self.net_solar])
             queue['cloud_factor'].put([t, self.cloud_factor])
+            self._put_variance(queue, t)
 
-    def distribute_thread_clear(self, queue, data, calc_type):
+    def distribute_thread_clear(self, queue, data, calc_type, context=None):
         """
         Distribute the data using threading and queue. All data is provided and
         ``distribute_thread`` will go through each time step and model clear sky
@@ -474,6 +499,13 @@ class solar(image_data.image_data):
         * :py:attr:`clear_ir_beam`
         * :py:attr:`clear_ir_diffuse`
 
+        Args:
+            queue: queue dictionary for all variables
+            data: pandas dataframe for all data, indexed by date time
+            calc_type: clear sky type to calculate, clear_vis or clear_ir
+            context: time step context from
+                :mod:`smrf.utils.utils.timestep_context`
+
         """
 
         # the variable names
@@ -491,7 +523,8 @@ class solar(image_data.image_data):
                 azimuth = queue['azimuth'].get(t)
                 min_storm_day = queue['last_storm_day_basin'].get(t)
 
-                wy_day, wyear, tz_min_west = self.radiation_dates(t)
+                wy_day, wyear, tz_min_west = self.radiation_dates(
+                    t, None if context is None else context.loc[t])
 
                 if calc_type == 'clear_ir':
                     val_beam, val_diffuse = self.calc_ir(min_storm_day, wy_day,
@@ -613,6 +646,10 @@ class solar(image_data.image_data):
         """
         self._logger.debug('Calculating clear sky radiation, ir')
 
+        if self.config['clear_sky_method'] == 'native':
+            return self.calc_native([0.7, 2.8], min_storm_day, wy_day, wyear,
+                                    cosz, azimuth)
+
         ir_cmd = 'stoporad -z %i -t %s -w %s -g %s -x 0.7,2.8 -s %s'\
             ' -d %s -f %i -y %i -A %f,%f -a %i -m %i -c %i -D %s > %s' \
             % (self.config['clear_opt_depth'],
@@ -642,8 +679,8 @@ class solar(image_data.image_data):
             raise Exception('Clear sky for IR failed')
 
         ir = ipw.IPW(self.ir_file)
-        clear_ir_beam = ir.bands[0].data
-        clear_ir_diffuse = ir.bands[1].data
+        clear_ir_beam = self.compress(ir.bands[0].data)
+        clear_ir_diffuse = self.compress(ir.bands[1].data)
 
         return clear_ir_beam, clear_ir_diffuse
 
@@ -667,6 +704,10 @@ class solar(image_data.image_data):
         """
         self._logger.debug('Calculating clear sky radiation, visible')
 
+        if self.config['clear_sky_method'] == 'native':
+            return self.calc_native([0.28, 0.7], min_storm_day, wy_day, wyear,
+                                    cosz, azimuth)
+
         vis_cmd = 'stoporad -z %i -t %s -w %s -g %s -x 0.28,0.7 -s %s'\
             ' -d %s -f %i -y %i -A %f,%f -a %i -m %i -c %i -D %s > %s' \
             % (self.config['clear_opt_depth'],
@@ -698,17 +739,60 @@ class solar(image_data.image_data):
 
         # load clear sky files back in
         vis = ipw.IPW(self.vis_file)
-        clear_vis_beam = vis.bands[0].data
-        clear_vis_diffuse = vis.bands[1].data
+        clear_vis_beam = self.compress(vis.bands[0].data)
+        clear_vis_diffuse = self.compress(vis.bands[1].data)
 
         return clear_vis_beam, clear_vis_diffuse
 
-    def radiation_dates(self, date_time):
+    def calc_native(self, w, min_storm_day, wy_day, wyear, cosz, azimuth):
+        """
+        Model the clear sky radiation in process with
+        :mod:`smrf.envphys.radiation.stoporad` using the same inputs as the
+        ``stoporad`` command line
+
+        Args:
+            w: wavelength band in micrometers
+            min_storm_day: decimal day of last storm for the entire basin, from
+                :mod:`smrf.distribute.precip.ppt.last_storm_day_basin`
+            wy_day: day of water year, from
+                :mod:`~smrf.distirbute.solar.solar.radiation_dates`
+            wyear: water year, from
+                :mod:`~smrf.distirbute.solar.solar.radiation_dates`
+            cosz: cosine of the zenith angle for the basin, from
+                :mod:`smrf.envphys.radiation.sunang`
+            azimuth: azimuth to the sun for the basin, from
+                :mod:`smrf.envphys.radiation.sunang`
+
+        Returns:
+            tuple: clear sky beam and diffuse radiation
+        """
+
+        # date from the water year day, as stoporad does
+        date_time = datetime(int(wyear) - 1, 10, 1) + timedelta(days=wy_day)
+
+        return radiation.stoporad(date_time, w, cosz, azimuth,
+                                  self.dem, self.slope, self.aspect,
+                                  self.sky_view,
+                                  wy_day - min_storm_day,
+                                  tau_elevation=self.config['clear_opt_depth'],
+                                  tau=self.config['clear_tau'],
+                                  omega=self.config['clear_omega'],
+                                  g=self.config['clear_gamma'],
+                                  gsize=self.albedoConfig['grain_size'],
+                                  maxgsz=self.albedoConfig['max_grain'],
+                                  dirt=self.albedoConfig['dirt'],
+                                  horizon=self.horizon,
+                                  horizon_azimuths=self.horizon_azimuths)
+
+    def radiation_dates(self, date_time, context=None):
         """
-        Calculate some times based on the date for ``stoporad``
+        Calculate some times based on the date for ``stoporad``, or take them
+        from the precomputed time step context if given
 
         Args:
             date_time: date time object
+            context: row of the time step context from
+                :mod:`smrf.utils.utils.timestep_context`
 
         Returns:
             (tuple): tuple containing:
@@ -718,6 +802,10 @@ class solar(image_data.image_data):
                 * **tz_min_west** - minutes west of UTC for timezone
         """
 
+        if context is not None:
+            return context['wy_day'], int(context['wyear']), \
+                context['tz_min_west']
+
         # get the current day of water year
         wy_day, wyear = utils.water_day(date_time)
 
@@ -354,6 +354,7 @@ class th(image_data.image_data):
             queue['thermal_clear'].put([t, self.thermal_clear])
 
             queue['thermal'].put([t, self.thermal])
+            self._put_variance(queue, t)
 
     def distribute_thermal(self, data, air_temp):
         """
@@ -416,3 +417,4 @@ class th(image_data.image_data):
             queue['thermal_clear'].put([t, self.thermal_clear])
 
             queue['thermal'].put([t, self.thermal])
+            self._put_variance(queue, t)
@@ -94,6 +94,8 @@ class vp(image_data.image_data):
 
         self._logger.debug('Initializing distribute.vapor_pressure')
         self._initialize(topo, data.metadata)
+        self._initialize_trend(data.vapor_pressure)
+        self._initialize_batch(data.vapor_pressure)
 
         # get dem to pass to wet_bulb
         self.dem = topo.dem
@@ -184,3 +186,4 @@ class vp(image_data.image_data):
             queue[self.variable].put([t, self.vapor_pressure])
             queue['precip_temp'].put([t, self.precip_temp])
             queue['dew_point'].put([t, self.dew_point])
+            self._put_variance(queue, t)
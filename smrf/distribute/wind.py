@@ -123,7 +123,7 @@ class wind(image_data.image_data):
             tempDir = os.environ['WORKDIR']
         self.tempDir = tempDir
 
-        if windConfig['distribution'] == 'grid':
+        if windConfig['distribution'] in ['grid', 'regrid']:
             self.gridded = True
             self.distribute_drifts = False
 
@@ -166,8 +166,10 @@ class wind(image_data.image_data):
     def initialize(self, topo, data):
         """
         Initialize the distribution, calls
-        :mod:`smrf.distribute.image_data.image_data._initialize`. Checks for
-        the enhancement factors for the stations and vegetation.
+        :mod:`smrf.distribute.image_data.image_data._initialize` and
+        :mod:`smrf.distribute.image_data.image_data._initialize_batch` for
+        the wind speed. Checks for the enhancement factors for the stations
+        and vegetation.
 
         Args:
             topo: :mod:`smrf.data.loadTopo.topo` instance contain topographic
@@ -181,6 +183,7 @@ class wind(image_data.image_data):
         if type(self.config['peak']) != list:
             self.config['peak'] = [self.config['peak']]
         self._initialize(topo, data.metadata)
+        self._initialize_batch(data.wind_speed)
 
         # meshgrid points
         self.X = topo.X
@@ -189,6 +192,15 @@ class wind(image_data.image_data):
         if not self.gridded:
             self.veg_type = topo.veg_type
 
+            # maxus library at the station pixels, then only keep the cells
+            # of the topo
+            self.station_maxus = {}
+            for m in self.metadata.index:
+                self.station_maxus[m] = self.maxus[:,
+                                                   self.metadata.loc[m, 'yi'],
+                                                   self.metadata.loc[m, 'xi']]
+            self.maxus = topo.compress(self.maxus)
+
             # get the enhancements for the stations
             if 'enhancement' not in self.metadata.columns:
                 self.metadata['enhancement'] = \
@@ -364,6 +376,7 @@ class wind(image_data.image_data):
             queue['flatwind'].put([t, self.flatwind])
             queue['cellmaxus'].put([t,self.cellmaxus])
             queue['dir_round_cell'].put([t,self.dir_round_cell])
+            self._put_variance(queue, t)
 
     def simulateWind(self, data_speed):
         """
@@ -492,15 +505,12 @@ class wind(image_data.image_data):
         self.nstep = 360/self.nbins
 
         for m in self.metadata.index:
-            # pixel locations
-            xi = self.metadata.loc[m, 'xi']
-            yi = self.metadata.loc[m, 'yi']
             e = self.metadata.loc[m, 'enhancement']
 
             # maxus value at the station
             if not pd.isnull(data_direction[m]):
                 if m.upper() in self.config['peak']:
-                    val_maxus = np.min(self.maxus[:, yi, xi] + e)
+                    val_maxus = np.min(self.station_maxus[m] + e)
 
                 else:
                     idx = int(np.ceil((data_direction[m] - self.nstep/2) /
@@ -509,7 +519,7 @@ class wind(image_data.image_data):
                         idx = 0  # special case when 360=0
                     ind = self.maxus_direction == idx
 
-                    val_maxus = self.maxus[ind, yi, xi] + e
+                    val_maxus = self.station_maxus[m][ind] + e
 
                 # correct unreasonable values
                 if val_maxus > 35:
@@ -549,6 +559,12 @@ class wind(image_data.image_data):
         Convert the WindNinja ascii grids back to the SMRF grids and into the
         SMRF data streamself.
 
+        The ascii rows are flipped to south to north before interpolating,
+        to match the WindNinja y locations. Before this, the interpolated
+        SMRF grid was flipped instead, which is only the same when the
+        WindNinja grid has the same north south extent as the topo, so the
+        wind field was misplaced whenever the extents differed.
+
         Args:
             t:              datetime of timestep
 
@@ -577,15 +593,15 @@ class wind(image_data.image_data):
         if not os.path.isfile(fp_vel):
             raise ValueError('{} in windninja convert module does not exist!'.format(fp_vel))
 
-        data_vel = np.loadtxt(fp_vel, skiprows=6)
+        # flip the ascii rows from north to south to match the y of the
+        # WindNinja grid from utils.get_asc_stats
+        data_vel = np.flipud(np.loadtxt(fp_vel, skiprows=6))
         data_vel_int = data_vel.flatten()
 
         # # interpolate to the SMRF grid from the WindNinja grid
         g_vel = utils.grid_interpolate(data_vel_int, self.vtx,
                                        self.wts, self.X.shape)
 
-        # flip because it comes out upsidedown
-        g_vel = np.flipud(g_vel)
         # log law scale
         g_vel = g_vel * self.ln_wind_scale
 
@@ -601,14 +617,12 @@ class wind(image_data.image_data):
             if not os.path.isfile(fp_ang):
                 raise ValueError('{} in windninja convert module does not exist!'.format(fp_ang))
 
-            data_ang = np.loadtxt(fp_ang, skiprows=6)
+            data_ang = np.flipud(np.loadtxt(fp_ang, skiprows=6))
             data_ang_int = data_ang.flatten()
 
             g_ang = utils.grid_interpolate(data_ang_int, self.vtx,
                                            self.wts, self.X.shape)
 
-            g_ang = np.flipud(g_ang)
-
         else:
             g_ang = None
 
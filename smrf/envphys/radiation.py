@@ -11,6 +11,7 @@ import os
 import datetime
 import logging
 import pytz
+from concurrent.futures import ThreadPoolExecutor
 from smrf.utils import utils
 from smrf.utils.io import isint
 
@@ -272,7 +273,7 @@ def decay_alb_hardy(litter, veg_type, storm_day, alb_v, alb_ir):
 def ihorizon(x, y, Z, azm, mu=0, offset=2, ncores=0):
     """
     Calculate the horizon values for an entire DEM image
-    for the desired azimuth
+    for the desired azimuth with :mod:`~smrf.envphys.radiation.horizon`
 
     Assumes that the step size is constant
 
@@ -286,91 +287,275 @@ def ihorizon(x, y, Z, azm, mu=0, offset=2, ncores=0):
 
     Returns:
         H   - if mask=0 cosine of the local horizonal angles
-            - if mask=1 index along line to the point
+            - if mask=1 whether the point can see the sun
 
     20150602 Scott Havens
     """
 
-    # check inputs
-    azm = azm*np.pi/180  # degress to radians
-    m, n = Z.shape
-
-    # transform the x,y into the azm direction xr,yr
-    xi, yi = np.arange(-n/2, n/2), np.arange(-m/2, m/2)
-    X, Y = np.meshgrid(xi, yi)
-    xr = X*np.cos(azm) -  Y*np.sin(azm)
-    yr = X*np.sin(azm) + Y*np.cos(azm)
-
-    # xr is the "new" column index for the profiles
-    # yr is the distance along the profile
-    xr = xr.round().astype(int)
-    yr = (x[2] - x[1]) * yr
-
-    H = np.zeros(Z.shape)
-#     pbar = progressbar.ProgressBar(n).start()
-#     j = 0
-
-    # loop through the columns
-#     if ncores == 0:
-    for i in np.arange(-n/2, n/2):
-        find_horizon(i, H, xr, yr, Z, mu)
-
-#     else:
-#     shared_array_base = mp.Array(ctypes.c_double, m*n)
-#     sH = np.ctypeslib.as_array(shared_array_base.get_obj())
-#     sH = sH.reshape(m, n)
-#     sxr = np.ctypeslib.as_array(shared_array_base.get_obj())
-#     sxr = sxr.reshape(m, n)
-#     syr = np.ctypeslib.as_array(shared_array_base.get_obj())
-#     syr = syr.reshape(m, n)
-#     sZ = np.ctypeslib.as_array(shared_array_base.get_obj())
-#     sZ = sZ.reshape(m, n)
-#     def wrap_horizon(i, def_param1=sH, def_parm2=sxr, def_param3=syr, def_param4=sZ):
-#         find_horizon(i, sH, sxr, syr, sZ, 0.67)
-
-#     pool = mp.Pool(processes=4)
-#     [pool.apply(find_horizon, args=(i, shared_array, xr, yr, Z, mu, offset)) for i in range(-n/2,n/2)]
-#     pool.map(wrap_horizon, range(-n/2,n/2))
-
-#     print(shared_array)
+    H = horizon(Z, x[1] - x[0], y[1] - y[0], [azm], nthreads=ncores)[0]
+
+    # if we are making a mask
+    if mu > 0:
+        H = (H <= mu).astype(np.float64)
+
+    return H
+
+
+def horizon(dem, dx, dy, azimuths, nthreads=1):
+    """
+    Calculate the horizon for every cell in a DEM in each of the azimuths
+    with the method of Dozier et al. (1981) and Dozier & Frew (1990).
+
+    For each azimuth the DEM is sheared so that each line of cells in the
+    azimuth direction is a column, stepping one cell in the major direction
+    and the nearest cell in the minor direction. The horizon of each cell is
+    then found from the horizon of the cell after it on every profile at
+    once, walking the convex hull of the profile like the IPW ``hor1f``.
+    This is linear in the number of cells for each azimuth.
+
+    Args:
+        dem: numpy array of the elevations
+        dx: spacing of the columns, positive to the east
+        dy: spacing of the rows, negative when the first row is the north
+        azimuths: azimuths in degrees from south, positive to the east
+            (the same as :mod:`~smrf.envphys.radiation.sunang`)
+        nthreads: number of threads to calculate the azimuths
+
+    Returns:
+        numpy array [azimuths, y, x] of the cosine of the horizon angle
+        measured from the zenith, which is 0 for an unobstructed horizon
+    """
+
+    dem = np.asarray(dem, dtype=np.float64)
+    H = np.empty((len(azimuths),) + dem.shape, dtype=np.float32)
+
+    for i, h in enumerate(iter_horizon(dem, dx, dy, azimuths, nthreads)):
+        H[i] = h
 
     return H
 
 
-def find_horizon(i, H, xr, yr, Z, mu):
-    # index to profile and get the elevations
-    ind = xr == i
-    zi = Z[ind]
+def iter_horizon(dem, dx, dy, azimuths, nthreads=1):
+    """
+    Calculate the horizon one azimuth at a time, see
+    :mod:`~smrf.envphys.radiation.horizon`. Only ``nthreads`` azimuths are
+    held in memory at once, so the horizons can be reduced without keeping
+    every azimuth.
+
+    Args:
+        dem: numpy array of the elevations
+        dx: spacing of the columns, positive to the east
+        dy: spacing of the rows, negative when the first row is the north
+        azimuths: azimuths in degrees from south, positive to the east
+        nthreads: number of threads to calculate the azimuths
+
+    Yields:
+        numpy array [y, x] of the cosine of the horizon angle from the zenith
+        for each azimuth in order
+    """
+
+    dem = np.asarray(dem, dtype=np.float64)
+
+    def horizon_azimuth(azm):
+        return _horizon_azimuth(dem, dx, dy, azm).astype(np.float32)
+
+    if nthreads is None or nthreads <= 1:
+        for azm in azimuths:
+            yield horizon_azimuth(azm)
+    else:
+        with ThreadPoolExecutor(max_workers=nthreads) as executor:
+            for i in range(0, len(azimuths), nthreads):
+                for h in executor.map(horizon_azimuth,
+                                      azimuths[i:i + nthreads]):
+                    yield h
+
+
+def _horizon_azimuth(dem, dx, dy, azm):
+    """
+    Horizon of the DEM in one azimuth, see
+    :mod:`~smrf.envphys.radiation.horizon`
+    """
+
+    # direction of the azimuth in cells per meter
+    azm = np.radians(azm)
+    dc = np.sin(azm) / dx
+    dr = -np.cos(azm) / dy
+
+    # orient the DEM so the profiles step forward along the first axis
+    if abs(dc) >= abs(dr):
+        z = dem.T
+        if dc < 0:
+            z = z[::-1]
+        t = dr / abs(dc)
+        spacing = np.hypot(dx, t * dy)
+        transpose, flip = True, dc < 0
+    else:
+        z = dem
+        if dr < 0:
+            z = z[::-1]
+        t = dc / abs(dr)
+        spacing = np.hypot(dy, t * dx)
+        transpose, flip = False, dr < 0
+
+    # shear the cells onto the profiles
+    n, m = z.shape
+    shift = np.round(np.arange(n) * t).astype(int)
+    shift -= shift.min()
+    q = np.arange(m)[np.newaxis, :] + shift.max() - shift[:, np.newaxis]
+    k = np.arange(n)[:, np.newaxis]
+
+    zs = np.full((n, m + shift.max()), -np.inf)
+    zs[k, q] = z
+
+    h = hor2f(zs, spacing)[k, q]
+
+    # back to the orientation of the DEM
+    if flip:
+        h = h[::-1]
+    if transpose:
+        h = h.T
+
+    return h
+
+
+def hor2f(z, spacing):
+    """
+    Calculate the horizon looking forward along the first axis for all the
+    profiles in the second axis at once, the vectorized form of
+    :mod:`~smrf.envphys.radiation.hor1f`. Cells that are not on a profile
+    have an elevation of -inf.
+
+    Args:
+        z: numpy array [step, profile] of the elevations
+        spacing: distance between the steps
+
+    Returns:
+        numpy array of the cosine of the horizon angle from the zenith
+    """
+
+    n, m = z.shape
+
+    # index of the horizon cell on the profile and the slope to it
+    h = np.empty((n, m), dtype=np.int32)
+    s = np.full((n, m), -np.inf, dtype=np.float32)
+    h[n-1] = n-1
+
+    for i in range(n-2, -1, -1):
+        h[i] = i
+        p = np.flatnonzero(np.isfinite(z[i]))
+        zi = z[i, p]
+
+        # start with the adjacent cell and follow the horizons of the cells
+        # until the slope to the horizon of j is less than the slope to j
+        j = np.full(len(p), i + 1, dtype=np.int32)
+        sj = (z[i + 1, p] - zi) / spacing
+        a = np.arange(len(p))
+
+        while len(a) > 0:
+            ja = j[a]
+            pa = p[a]
+            k = h[ja, pa]
+            sk = (z[k, pa] - zi[a]) / ((k - i) * spacing)
+
+            walk = (k != ja) & (sk >= sj[a])
+            a = a[walk]
+            j[a] = k[walk]
+            sj[a] = sk[walk]
+
+        h[i, p] = j
+        s[i, p] = sj
+
+    # cosine of the horizon angle from the zenith, 0 if no cell is higher
+    s = np.maximum(s, 0)
+    return s / np.sqrt(1 + s**2)
+
+
+def sky_view_factor(H, azimuths, slope, aspect):
+    """
+    Calculate the sky view factor from the horizons following Dozier & Frew
+    (1990), the same as the IPW ``viewf`` command. The horizon in each
+    azimuth is limited by the plane of the slope.
+
+    Args:
+        H: numpy array [azimuths, y, x] of the cosine of the horizon angle
+            from :mod:`~smrf.envphys.radiation.horizon`, or the horizons one
+            azimuth at a time from
+            :mod:`~smrf.envphys.radiation.iter_horizon`
+        azimuths: azimuths of the horizons in degrees, evenly spaced around
+            the circle
+        slope: numpy array of the sine of the slope
+        aspect: numpy array of the aspect in radians from south
+
+    Returns:
+        numpy array of the sky view factor
+    """
+
+    cos_slope = np.sqrt((1 - slope) * (1 + slope))
+    tan_slope = slope / cos_slope
+
+    svf = np.zeros(slope.shape)
+    for azm, Hi in zip(azimuths, H):
+        cos_a = np.cos(np.radians(azm) - aspect)
+
+        # the horizon can't be below the plane of the slope
+        t = np.maximum(-tan_slope * cos_a, 0)
+        h = np.maximum(Hi, t / np.sqrt(1 + t**2))
+
+        # angle of the horizon from the zenith
+        hz = np.arccos(h)
+        svf += cos_slope * np.sin(hz)**2 + \
+            slope * cos_a * (hz - np.sin(hz) * h)
+
+    return svf / len(azimuths)
+
+
+def terrain_config(slope, sky_view):
+    """
+    Calculate the terrain configuration factor, the part of the hemisphere
+    over a slope that is filled by the adjacent terrain, as the second band
+    of the IPW ``viewf`` command
+
+    Args:
+        slope: numpy array of the sine of the slope
+        sky_view: numpy array of the sky view factor
+
+    Returns:
+        numpy array of the terrain configuration factor
+    """
 
-    # distance along the profile
-    di = yr[ind]
+    return np.maximum(
+        (1 + np.sqrt((1 - slope) * (1 + slope))) / 2 - sky_view, 0)
 
-    # sort the y values and get the cooresponding elevation
-    idx = np.argsort(di)
-    di = di[idx]
-    zi = zi[idx]
 
-    # if there are some values in the vector
-    # calculate the horizons
-    if len(zi) > 0:
-        # h2 = hor1f_simple(di, zi)
-        h = hor1f(di, zi)
+def cast_shadow(H, azimuths, azimuth, cosz):
+    """
+    Find the cells in the shadow of the terrain for the sun angle, where the
+    sun is below the horizon interpolated between the two closest azimuths
 
-        cz = _cosz(di, zi, di[h], zi[h])
+    Args:
+        H: numpy array [azimuths, y, x] of the cosine of the horizon angle
+            from :mod:`~smrf.envphys.radiation.horizon`
+        azimuths: increasing azimuths of the horizons in degrees
+        azimuth: azimuth to the sun in degrees -180..180
+        cosz: cosine of the solar zenith angle
 
-        # if we are making a mask
-        if mu > 0:
-            # iz = cz == 0    # points that are their own horizon
-            idx = cz > mu   # points sheltered from the sun
-            cz[idx] = 0
-            cz[~idx] = 1
-#                 cz[iz] = 1
+    Returns:
+        boolean numpy array that is True in the shadows
+    """
+
+    azimuths = np.asarray(azimuths)
+    n = len(azimuths)
+
+    i = np.searchsorted(azimuths, azimuth)
+    i0 = (i - 1) % n
+    i1 = i % n
 
-    H[ind] = cz
+    span = (azimuths[i1] - azimuths[i0]) % 360
+    w = (azimuth - azimuths[i0]) % 360 / span if span > 0 else 0
 
-#         j += 1
-#         pbar.update(j)
-#     pbar.finish()
+    h = (1 - w) * H[i0] + w * H[i1]
+
+    return h > cosz
 
 
 def hord(z):
@@ -467,30 +652,30 @@ def hor1f_simple(z):
 
 def hor1f(x, z, offset=1):
     """
-    BROKEN: Haven't quite figured this one out
-
     Calculate the horizon pixel for all x,z
     This mimics the algorthim from Dozier 1981 and the
     hor1f.c from IPW
 
     Works backwards from the end but looks forwards for
-    the horizon
-
-    xrange stops one index before [stop]
+    the horizon. The horizon of a point is found by following
+    the horizons of the points after it, which form the convex
+    hull of the profile, until the slope starts to decrease.
 
     Args:
         x - horizontal distances for points
         z - elevations for the points
+        offset - unused, kept for compatibility
 
     Returns:
-        h - index to the horizon point
+        h - index to the horizon point, the point itself if
+            no point in front of it is higher
 
     20150601 Scott Havens
     """
 
     N = len(x)  # number of points to look at
-    x = np.array(x)
-    z = np.array(z)
+    x = np.array(x, dtype=np.float64)
+    z = np.array(z, dtype=np.float64)
 
     # preallocate the h array
     h = np.zeros(N, dtype=int)
@@ -501,39 +686,21 @@ def hor1f(x, z, offset=1):
 
         zi = z[i]
 
-        # Start with next-to-adjacent point in either forward or backward
-        # direction, depending on which way loop is running. Note that we
-        # don't consider the adjacent point; this seems to help reduce noise.
-        k = i + offset
-
-        if k >= N:
-            k -= 1
+        # start with the adjacent point and follow the horizons until the
+        # slope to the horizon of j is less than the slope to j
+        j = i + 1
+        sij = _slope_all(x[i], zi, x[j], z[j])
 
-        # loop until horizon is found
-        # xrange will set the maximum number of iterations that can be
-        # performed based on the length of the vector
-        for t in range(k, N):
-            j = k
+        while h[j] != j:
             k = h[j]
-
-            sij = _slope(x[i], zi, x[j], z[j])
-            sihj = _slope(x[i], zi, x[k], z[k])
-
-            # if slope(i,j) >= slope(i,h[j]), horizon has been found; otherwise
-            # set j to k (=h[j]) and loop again
-            # or if we are at the end of the section
-            if sij > sihj:  # or k == N-1:
+            sik = _slope_all(x[i], zi, x[k], z[k])
+            if sik < sij:
                 break
+            j = k
+            sij = sik
 
-        # if slope(i,j) > slope(j,h[j]), j is i's horizon; else if slope(i,j)
-        # is zero, i is its own horizon; otherwise slope(i,j) = slope(i,h[j])
-        # so h[j] is i's horizon
-        if sij > sihj:
-            h[i] = j
-        elif sij == 0:
-            h[i] = i
-        else:
-            h[i] = k
+        # i is its own horizon if no point is higher
+        h[i] = j if sij > 0 else i
 
     return h
 
@@ -623,13 +790,17 @@ def sunang(date, lat, lon, zone=0, slope=0, aspect=0):
     return cosz, azimuth
 
 
-def sunang_thread(queue, date, lat, lon, zone=0, slope=0, aspect=0):
+def sunang_thread(queue, date, cosz, azimuth):
     """
-    See sunang for input descriptions
+    Serve the precomputed sun angles to the queue
 
     Args:
         queue: queue with cosz, azimuth
         date: loop through dates to accesss queue, must be same as rest of queues
+        cosz: array of the cosine of the zenith angle for each date, from
+            :mod:`~smrf.envphys.radiation.sunang_vector`
+        azimuth: array of the solar azimuth for each date, from
+            :mod:`~smrf.envphys.radiation.sunang_vector`
 
     20160325 Scott Havens
     """
@@ -641,15 +812,150 @@ def sunang_thread(queue, date, lat, lon, zone=0, slope=0, aspect=0):
 
     log = logging.getLogger(__name__)
 
-    for t in date:
+    for i, t in enumerate(date):
+
+        log.debug('%s Serving sun angle' % t)
+
+        queue['cosz'].put([t, cosz[i]])
+        queue['azimuth'].put([t, azimuth[i]])
+
+
+def sunang_vector(date, lat, lon):
+    """
+    Vectorized solar position for many dates at once, replacing the IPW
+    ``sunang`` wrapper. Uses the NOAA solar position equations (after Meeus,
+    1991) for the declination and equation of time, which are accurate to
+    within a small fraction of a degree.
 
-        log.debug('%s Calculating sun angle' % t)
+    Args:
+        date: list or array of datetime objects, time zone aware dates are
+            converted to UTC and naive dates are assumed to be UTC
+        lat: latitude in decimal degrees
+        lon: longitude in decimal degrees
 
-        cosz, azimuth = sunang(t.astimezone(pytz.utc), lat, lon,
-                               zone, slope, aspect)
+    Returns:
+        tuple:
 
-        queue['cosz'].put([t, cosz])
-        queue['azimuth'].put([t, azimuth])
+        - **cosz** - numpy array of the cosine of the zenith angle
+        - **azimuth** - numpy array of the solar azimuth in degrees from
+          south, positive to the east, range -180..180
+    """
+
+    t = pd.DatetimeIndex(date)
+    if t.tz is not None:
+        t = t.tz_convert('UTC').tz_localize(None)
+
+    # julian century from J2000
+    jc = (t.to_julian_date().values - 2451545.0) / 36525.0
+
+    # mean longitude, mean anomaly and eccentricity of the earth orbit
+    L = np.radians((280.46646 + jc * (36000.76983 + jc * 0.0003032)) % 360)
+    M = np.radians(357.52911 + jc * (35999.05029 - 0.0001537 * jc))
+    e = 0.016708634 - jc * (0.000042037 + 0.0000001267 * jc)
+
+    # apparent longitude of the sun
+    C = np.sin(M) * (1.914602 - jc * (0.004817 + 0.000014 * jc)) + \
+        np.sin(2 * M) * (0.019993 - 0.000101 * jc) + \
+        np.sin(3 * M) * 0.000289
+    omega = np.radians(125.04 - 1934.136 * jc)
+    app_long = np.radians(np.degrees(L) + C - 0.00569 -
+                          0.00478 * np.sin(omega))
+
+    # obliquity of the ecliptic and declination
+    obliq = 23 + (26 + (21.448 - jc * (46.815 + jc *
+                                       (0.00059 - jc * 0.001813))) / 60) / 60
+    obliq = np.radians(obliq + 0.00256 * np.cos(omega))
+    decl = np.arcsin(np.sin(obliq) * np.sin(app_long))
+
+    # equation of time in minutes
+    y = np.tan(obliq / 2)**2
+    eot = 4 * np.degrees(y * np.sin(2 * L) -
+                         2 * e * np.sin(M) +
+                         4 * e * y * np.sin(M) * np.cos(2 * L) -
+                         0.5 * y * y * np.sin(4 * L) -
+                         1.25 * e * e * np.sin(2 * M))
+
+    # hour angle from the true solar time
+    minutes = t.hour.values * 60 + t.minute.values + t.second.values / 60.0
+    tst = (minutes + eot + 4 * lon) % 1440
+    ha = np.radians(tst / 4 - 180)
+
+    rlat = np.radians(lat)
+    cosz = np.sin(rlat) * np.sin(decl) + \
+        np.cos(rlat) * np.cos(decl) * np.cos(ha)
+    cosz = np.clip(cosz, -1, 1)
+
+    azimuth = -np.degrees(np.arctan2(np.sin(ha),
+                                     np.cos(ha) * np.sin(rlat) -
+                                     np.tan(decl) * np.cos(rlat)))
+
+    return cosz, azimuth
+
+
+
+def gradient(dem, dx, dy, dtype=np.float64, nthreads=1, block_size=512):
+    """
+    Calculate the slope and aspect of a DEM with the same conventions as the
+    IPW gradient command, in process. The partial derivatives are central
+    differences in the interior and one sided differences on the edges,
+    the same as ``np.gradient``. The rows are calculated in blocks of
+    ``block_size`` rows with one row of overlap, on ``nthreads`` threads.
+
+    Slope is returned as sin(S) with range from 0 to 1. Aspect is returned
+    as radians from south (aspect 0 is toward the south) with range from
+    -pi to pi, with negative values to the west and positive values to the
+    east. Flat cells have an aspect of 0.
+
+    Args:
+        dem: numpy array of the elevations
+        dx: spacing of the columns, positive to the east
+        dy: spacing of the rows, negative when the first row is the north
+        dtype: numpy float type to calculate in and return
+        nthreads: number of threads to calculate the blocks of rows
+        block_size: number of rows in each block
+
+    Returns:
+        tuple: slope and aspect
+    """
+
+    dem = np.asarray(dem, dtype=dtype)
+    ny = dem.shape[0]
+
+    slope = np.empty(dem.shape, dtype=dtype)
+    aspect = np.empty(dem.shape, dtype=dtype)
+
+    def gradient_block(r0):
+        r1 = min(r0 + block_size, ny)
+
+        # one row of overlap for the central differences
+        b0 = max(r0 - 1, 0)
+        b1 = min(r1 + 1, ny)
+        z = dem[b0:b1]
+
+        if z.shape[0] > 1:
+            dzdy = np.gradient(z, dy, axis=0)[r0 - b0:r1 - b0]
+        else:
+            dzdy = np.zeros((r1 - r0, dem.shape[1]), dtype=dtype)
+        dzdx = np.gradient(z[r0 - b0:r1 - b0], dx, axis=1)
+
+        # sine of the slope from the tangent
+        tan_s = np.hypot(dzdx, dzdy)
+        slope[r0:r1] = tan_s / np.sqrt(1 + tan_s**2)
+
+        # direction that the slope faces from south, positive to the east
+        a = np.arctan2(-dzdx, dzdy)
+        a[tan_s == 0] = 0
+        aspect[r0:r1] = a
+
+    blocks = range(0, ny, block_size)
+    if nthreads is None or nthreads <= 1:
+        for r0 in blocks:
+            gradient_block(r0)
+    else:
+        with ThreadPoolExecutor(max_workers=nthreads) as executor:
+            list(executor.map(gradient_block, blocks))
+
+    return slope, aspect
 
 
 def shade(slope, aspect, azimuth, cosz=None, zenith=None):
@@ -665,7 +971,8 @@ def shade(slope, aspect, azimuth, cosz=None, zenith=None):
         S is slope in radians
         A is aspect in radians
 
-    Slope and aspect are expected to come from the IPW gradient command.
+    Slope and aspect are expected to come from the IPW gradient command or
+    :mod:`smrf.envphys.radiation.gradient`.
     Slope is stored as sin(S) with range from 0 to 1. Aspect is stored
     as radians from south (aspect 0 is toward the south) with range from
     -pi to pi, with negative values to the west and positive values to the east
@@ -729,13 +1036,17 @@ def shade(slope, aspect, azimuth, cosz=None, zenith=None):
     return mu
 
 
-def shade_thread(queue, date, slope, aspect, zenith=None):
+def shade_thread(queue, date, slope, aspect, zenith=None, horizon=None,
+                 horizon_azimuths=None):
     """
     See shade for input argument descriptions
 
     Args:
         queue: queue with illum_ang, cosz, azimuth
         date_time: loop through dates to accesss queue
+        horizon: horizons for the cast shadows from
+            :mod:`~smrf.envphys.radiation.horizon`, no shadows if None
+        horizon_azimuths: azimuths of the horizons
 
     20160325 Scott Havens
     """
@@ -760,6 +1071,9 @@ def shade_thread(queue, date, slope, aspect, zenith=None):
             azimuth = queue['azimuth'].get(t)
             mu = shade(slope, aspect, azimuth, cosz, zenith)
 
+            if horizon is not None:
+                mu[cast_shadow(horizon, horizon_azimuths, azimuth, cosz)] = 0
+
         queue['illum_ang'].put([t, mu])
 
 
@@ -946,6 +1260,308 @@ def solar_ipw(d, w=[0.28, 2.8]):
     return float(out.rstrip())
 
 
+# constants for the native clear sky radiation model
+SOLAR_CONSTANT = 1368.0  # solar constant (W/m^2)
+SUN_TEMP = 5778.0        # effective blackbody temperature of the sun (K)
+STD_AIRTMP = 288.15      # standard sea level air temperature (K)
+PLANCK = 6.6260755e-34   # Planck's constant (J s)
+SPEED_OF_LIGHT = 2.99792458e8  # speed of light (m/s)
+BOLTZMANN = 1.380658e-23  # Boltzmann constant (J/K)
+
+
+def radius_vector(d):
+    """
+    Earth-Sun distance relative to the mean distance, using the Fourier
+    series of Spencer (1971) for the eccentricity correction factor
+
+    Args:
+        d: date object
+
+    Returns:
+        r: Earth-Sun radius vector (AU)
+    """
+
+    gamma = 2 * np.pi * (d.timetuple().tm_yday - 1) / 365.0
+
+    e0 = 1.000110 + 0.034221 * np.cos(gamma) + 0.001280 * np.sin(gamma) + \
+        0.000719 * np.cos(2 * gamma) + 0.000077 * np.sin(2 * gamma)
+
+    return 1 / np.sqrt(e0)
+
+
+def solar_irradiance(d, w=[0.28, 2.8]):
+    """
+    Native replacement for :mod:`~smrf.envphys.radiation.solar_ipw`
+
+    Calculates the exoatmospheric direct solar irradiance integrated over the
+    wavelength band ``w``. The spectral distribution is taken as a blackbody
+    at the effective temperature of the sun, scaled so that the full spectrum
+    integrates to the solar constant, and the result is divided by the square
+    of the Earth-Sun radius vector for the date.
+
+    Args:
+        d: date object, used to calculate the solar radius vector
+        w: [um um2] wavelength band in micrometers
+
+    Returns:
+        s: direct solar irradiance in the band (W/m^2)
+    """
+
+    # blackbody spectral exitance over the band, trapezoidal integration
+    wl = np.linspace(w[0], w[1], 2001) * 1e-6
+    c1 = 2 * np.pi * PLANCK * SPEED_OF_LIGHT**2
+    c2 = PLANCK * SPEED_OF_LIGHT / BOLTZMANN
+    m = c1 / (wl**5 * (np.exp(c2 / (wl * SUN_TEMP)) - 1))
+    band = np.sum((m[1:] + m[:-1]) * np.diff(wl)) / 2
+
+    # fraction of the total exitance, scaled to the solar constant
+    frac = band / (STEF_BOLTZ * SUN_TEMP**4)
+
+    return SOLAR_CONSTANT * frac / radius_vector(d)**2
+
+
+def twostream_native(mu0, S0, tau=0.2, omega=0.85, g=0.3, R0=0.5, d=False):
+    """
+    Native replacement for :mod:`~smrf.envphys.radiation.twostream`
+
+    Two-stream solution for a single-layer atmosphere over a horizontal
+    surface with reflectance ``R0``, using the Eddington coefficients of
+    Meador & Weaver (1980), or the delta-Eddington scaling of Wiscombe &
+    Joseph (1977) if ``d`` is set. All inputs may be scalars or numpy arrays
+    that broadcast against each other, so an entire image can be solved in
+    one call.
+
+    Args:
+        mu0: cosine of the incidence angle
+        S0: direct beam irradiance at the top of the atmosphere
+        tau: optical depth
+        omega: single-scattering albedo
+        g: asymmetry factor
+        R0: reflectance of the substrate
+        d: use the delta-Eddington method
+
+    Returns:
+        R: list containing the same values as the IPW ``twostream``
+
+        - **R[0]** - reflectance
+        - **R[1]** - transmittance
+        - **R[2]** - direct transmittance
+        - **R[3]** - upwelling irradiance
+        - **R[4]** - total irradiance at bottom
+        - **R[5]** - direct irradiance normal to beam
+    """
+
+    mu0 = np.asarray(mu0, dtype=np.float64)
+    tau = np.asarray(tau, dtype=np.float64)
+    R0 = np.maximum(np.asarray(R0, dtype=np.float64), 0)
+
+    # the solution is singular for conservative scattering
+    omega = np.minimum(omega, 1 - 1e-6)
+
+    if d:
+        f = g * g
+        tau = (1 - omega * f) * tau
+        omega = (1 - f) * omega / (1 - omega * f)
+        g = g / (1 + g)
+
+    # Eddington coefficients
+    gam1 = 0.25 * (7 - omega * (4 + 3 * g))
+    gam2 = -0.25 * (1 - omega * (4 - 3 * g))
+    gam3 = 0.25 * (2 - 3 * g * mu0)
+    gam4 = 1 - gam3
+    k = np.sqrt((gam1 - gam2) * (gam1 + gam2))
+
+    # the particular solution is singular when k * mu0 = 1
+    mu0 = np.where(np.abs(k * mu0 - 1) < 1e-6, mu0 * (1 + 1e-5), mu0)
+    imu = 1 / mu0
+
+    # particular solution for the scattered direct beam
+    dp = k * k - imu * imu
+    cu = omega * S0 * (gam3 * (gam1 - imu) + gam2 * gam4) / dp
+    cd = omega * S0 * (gam4 * (gam1 + imu) + gam2 * gam3) / dp
+
+    # homogeneous solution written with decaying exponentials, apply the
+    # boundary conditions of no diffuse at the top and reflection at bottom
+    E = np.exp(-k * tau)
+    T = np.exp(-tau * imu)
+    a11 = (gam1 - k) * E
+    a12 = gam1 + k
+    b1 = -cd
+    a21 = gam2 - R0 * (gam1 - k)
+    a22 = E * (gam2 - R0 * (gam1 + k))
+    b2 = R0 * mu0 * S0 * T - (cu - R0 * cd) * T
+
+    det = a11 * a22 - a12 * a21
+    c1 = (b1 * a22 - a12 * b2) / det
+    c2 = (a11 * b2 - a21 * b1) / det
+
+    up = c1 * gam2 * E + c2 * gam2 + cu
+    down = c1 * (gam1 - k) + c2 * (gam1 + k) * E + cd * T
+
+    direct = mu0 * S0 * T
+    incident = mu0 * S0
+
+    return [up / incident,
+            (down + direct) / incident,
+            T,
+            up,
+            down + direct,
+            S0 * T]
+
+
+def pressure_ratio(elevation, z0=0.0):
+    """
+    Ratio of the standard atmosphere pressure at ``elevation`` to the
+    pressure at ``z0``
+
+    Args:
+        elevation: numpy array of elevations (m)
+        z0: reference elevation (m)
+
+    Returns:
+        ratio of the pressures
+    """
+
+    ex = -GRAVITY * MOL_AIR / (RGAS * STD_LAPSE_M)
+
+    p = (1 + STD_LAPSE_M * elevation / STD_AIRTMP)**ex
+    p0 = (1 + STD_LAPSE_M * z0 / STD_AIRTMP)**ex
+
+    return p / p0
+
+
+def elevrad(elevation, S0, cosz, tau_elevation=100.0, tau=0.2, omega=0.85,
+            g=0.3, R0=0.5):
+    """
+    Beam and diffuse irradiance on a horizontal surface as a function of
+    elevation, adapted from the IPW function ``elevrad``. The optical depth
+    measured at ``tau_elevation`` is scaled to each elevation by the ratio of
+    the standard atmosphere pressures and
+    :mod:`~smrf.envphys.radiation.twostream_native` is solved for every
+    pixel.
+
+    Args:
+        elevation: numpy array of elevations (m)
+        S0: exoatmospheric solar irradiance for the band
+        cosz: cosine of the solar zenith angle
+        tau_elevation: elevation of the optical depth measurement (m)
+        tau: optical depth at ``tau_elevation``
+        omega: single-scattering albedo
+        g: asymmetry factor
+        R0: reflectance of the substrate
+
+    Returns:
+        tuple:
+
+        - **beam** - direct irradiance normal to the beam
+        - **diffuse** - diffuse irradiance on a horizontal surface
+    """
+
+    tau_z = tau * pressure_ratio(elevation, tau_elevation)
+
+    R = twostream_native(cosz, S0, tau_z, omega, g, R0)
+
+    beam = R[5]
+    diffuse = R[4] - beam * cosz
+
+    return beam, diffuse
+
+
+def toporad(beam, diffuse, illum_ang, sky_view, terrain_config, cosz, albedo):
+    """
+    Terrain corrected beam and diffuse irradiance, adapted from the IPW
+    function ``toporad`` following Dozier (1980) and Dozier & Frew (1990).
+    The diffuse irradiance on the slope is the sky diffuse reduced by the sky
+    view factor plus the irradiance reflected from the adjacent terrain.
+
+    Args:
+        beam: direct irradiance normal to the beam from
+            :mod:`~smrf.envphys.radiation.elevrad`
+        diffuse: diffuse irradiance on a horizontal surface from
+            :mod:`~smrf.envphys.radiation.elevrad`
+        illum_ang: cosine of the local illumination angle from
+            :mod:`~smrf.envphys.radiation.shade`
+        sky_view: sky view factor
+        terrain_config: terrain configuration factor
+        cosz: cosine of the solar zenith angle
+        albedo: albedo of the adjacent terrain
+
+    Returns:
+        tuple:
+
+        - **beam** - beam irradiance on the slope
+        - **diffuse** - diffuse irradiance on the slope
+    """
+
+    # global irradiance on a horizontal surface
+    flat = beam * cosz + diffuse
+
+    topo_beam = beam * illum_ang
+    topo_diffuse = diffuse * sky_view + albedo * flat * terrain_config
+
+    return topo_beam, topo_diffuse
+
+
+def stoporad(date_time, w, cosz, azimuth, dem, slope, aspect, sky_view,
+             telapsed, tau_elevation=100.0, tau=0.2, omega=0.85, g=0.3,
+             gsize=100.0, maxgsz=500.0, dirt=2.0, horizon=None,
+             horizon_azimuths=None):
+    """
+    In process replacement for the IPW script ``stoporad`` that calculates
+    the terrain corrected clear sky beam and diffuse irradiance for a single
+    wavelength band and time step. The substrate reflectance is the snow
+    albedo for the band from :mod:`~smrf.envphys.radiation.albedo`. The
+    albedo is found once for the basin ``cosz``, which is the flat surface
+    illumination angle, and is used for every cell instead of the local
+    illumination angle of each slope.
+
+    Args:
+        date_time: date object for the time step
+        w: [um um2] wavelength band, [0.28, 0.7] for the visible and
+            [0.7, 2.8] for the infrared
+        cosz: cosine of the solar zenith angle
+        azimuth: solar azimuth in degrees -180..180
+        dem: numpy array of the elevations
+        slope: numpy array of the sine of the slope
+        aspect: numpy array of the aspect in radians from south
+        sky_view: numpy array of the sky view factor
+        telapsed: time since the last storm (decimal days)
+        tau_elevation: elevation of the optical depth measurement (m)
+        tau: optical depth at ``tau_elevation``
+        omega: single-scattering albedo
+        g: asymmetry factor
+        gsize: effective grain radius of snow after last storm (mu m)
+        maxgsz: maximum grain radius expected from grain growth (mu m)
+        dirt: effective contamination for adjustment to visible albedo
+        horizon: horizons for the cast shadows from
+            :mod:`~smrf.envphys.radiation.horizon`, no shadows if None
+        horizon_azimuths: azimuths of the horizons
+
+    Returns:
+        tuple:
+
+        - **beam** - clear sky beam irradiance over the DEM
+        - **diffuse** - clear sky diffuse irradiance over the DEM
+    """
+
+    # substrate reflectance for the band
+    alb_v, alb_ir = albedo(np.array([telapsed], dtype=np.float64),
+                           np.array([cosz], dtype=np.float64),
+                           gsize, maxgsz, dirt)
+    R0 = alb_v[0] if w[1] <= 0.7 else alb_ir[0]
+
+    S0 = solar_irradiance(date_time, w)
+
+    beam, diffuse = elevrad(dem, S0, cosz, tau_elevation, tau, omega, g, R0)
+
+    illum_ang = shade(slope, aspect, azimuth, cosz)
+    if horizon is not None:
+        illum_ang[cast_shadow(horizon, horizon_azimuths, azimuth, cosz)] = 0
+
+    return toporad(beam, diffuse, illum_ang, sky_view,
+                   terrain_config(slope, sky_view), cosz, R0)
+
+
 def model_solar(dt, lat, lon, tau=0.2, tzone=0):
     """
     Model solar radiation at a point
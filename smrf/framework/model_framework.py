@@ -34,7 +34,8 @@ import pytz
 from smrf import data, distribute, output, __core_config__, __recipes__
 from smrf.envphys import radiation
 from smrf.utils import queue, io
-from smrf.utils.utils import backup_input, getqotw, check_station_colocation
+from smrf.utils.utils import backup_input, getqotw, check_station_colocation, \
+    timestep_context
 from threading import Thread
 import shutil
 from inicheck.tools import get_user_config, check_config
@@ -233,6 +234,14 @@ class SMRF():
         self.date_time = [di.replace(tzinfo=tzinfo) for di in d]
         self.time_steps = len(self.date_time)
 
+        # values for every time step that are constant over the domain,
+        # calculated once for the whole run
+        cosz, azimuth = radiation.sunang_vector(
+            self.date_time,
+            self.config['topo']['basin_lat'],
+            self.config['topo']['basin_lon'])
+        self.context = timestep_context(self.date_time, cosz, azimuth)
+
         # need to align date time
         if self.config['albedo']['start_decay'] is not None:
             self.config['albedo']['start_decay'] = self.config['albedo']['start_decay'].replace(tzinfo=tzinfo)
@@ -268,6 +277,12 @@ class SMRF():
         Provide some logging info about when SMRF was closed
         """
 
+        # write anything left in the output buffers
+        if getattr(self, 'out_writer', None) is not None:
+            self.out_writer.close()
+        if hasattr(self, 'out_func'):
+            self.out_func.close()
+
         # clean up the WORKDIR
         if hasattr(self, 'topo'):
             if self.topo.stoporad_in_file is not None:
@@ -297,6 +312,9 @@ class SMRF():
                                        calcInput,
                                        tempDir=self.temp_dir)
 
+        # topo of only the cells in the mask for the distribution
+        self.active_topo = self.topo.compressed()
+
     def initializeDistribution(self):
         """
         This initializes the distirbution classes based on the configFile
@@ -448,6 +466,12 @@ class SMRF():
                                                                      self.topo.y,
                                                                                  'Y'), axis=1)
 
+        # output the station pixels if no points were given
+        if getattr(self, 'out_func', None) is not None and \
+                getattr(self.out_func, 'type', None) == 'points' and \
+                self.out_func.points is None:
+            self.out_func.set_points(self.data.metadata[['xi', 'yi']])
+
         # pre filter the data to only the desired stations
         if flag:
             try:
@@ -532,7 +556,18 @@ class SMRF():
         # -------------------------------------
         # Initialize the distibution
         for v in self.distribute:
-            self.distribute[v].initialize(self.topo, self.data)
+            self.distribute[v].initialize(self.active_topo, self.data)
+
+        # -------------------------------------
+        # Write the outputs in the background
+        self.out_writer = None
+        if hasattr(self, 'out_func') and \
+                self.config['output']['background_write']:
+            self.out_writer = queue.QueueBackgroundOutput(self.out_func,
+                                                          self.active_topo.nx,
+                                                          self.active_topo.ny,
+                                                          self.max_values)
+            self.out_writer.start()
 
         # -------------------------------------
         # Distribute the data
@@ -542,22 +577,27 @@ class SMRF():
             startTime = datetime.now()
 
             self._logger.info('Distributing time step %s' % t)
+            context = self.context.iloc[output_count]
+
             # 0.1 sun angle for time step
-            cosz, azimuth = radiation.sunang(t.astimezone(pytz.utc),
-                                             self.topo.topoConfig['basin_lat'],
-                                             self.topo.topoConfig['basin_lon'],
-                                             zone=0,
-                                             slope=0,
-                                             aspect=0)
+            cosz = context['cosz']
+            azimuth = context['azimuth']
 
             # 0.2 illumination angle
             illum_ang = None
             if cosz > 0:
-                illum_ang = radiation.shade(self.topo.slope,
-                                            self.topo.aspect,
+                illum_ang = radiation.shade(self.active_topo.slope,
+                                            self.active_topo.aspect,
                                             azimuth,
                                             cosz)
 
+                # cast shadows from the horizons
+                if self.active_topo.horizon is not None:
+                    illum_ang[radiation.cast_shadow(
+                        self.active_topo.horizon,
+                        self.active_topo.horizon_azimuths,
+                        azimuth, cosz)] = 0
+
             # 1. Air temperature
             self.distribute['air_temp'].distribute(self.data.air_temp.loc[t])
 
@@ -581,7 +621,8 @@ class SMRF():
                                                 self.distribute['wind'].wind_direction,
                                                 self.distribute['wind'].dir_round_cell,
                                                 self.distribute['wind'].wind_speed,
-                                                self.distribute['wind'].cellmaxus)
+                                                self.distribute['wind'].cellmaxus,
+                                                context=context)
 
             # 5. Albedo
             self.distribute['albedo'].distribute(t,
@@ -595,7 +636,8 @@ class SMRF():
                                                 azimuth,
                                                 self.distribute['precip'].last_storm_day_basin,
                                                 self.distribute['albedo'].albedo_vis,
-                                                self.distribute['albedo'].albedo_ir)
+                                                self.distribute['albedo'].albedo_ir,
+                                                context=context)
 
             # 7. thermal radiation
             if self.distribute['thermal'].gridded and \
@@ -619,6 +661,10 @@ class SMRF():
             self._logger.debug('{0:.2f} seconds for time step'
                                .format(telapsed.total_seconds()))
 
+        # wait for the last time steps to be written
+        if self.out_writer is not None:
+            self.out_writer.close()
+
         self.forcing_data = 1
 
     def distributeData_threaded(self):
@@ -644,8 +690,8 @@ class SMRF():
         t.append(queue.QueueOutput(q, self.date_time,
                                    self.out_func,
                                    self.config['output']['frequency'],
-                                   self.topo.nx,
-                                   self.topo.ny))
+                                   self.active_topo.nx,
+                                   self.active_topo.ny))
 
         # the cleaner
         t.append(queue.QueueCleaner(self.date_time, q))
@@ -673,7 +719,7 @@ class SMRF():
         # -------------------------------------
         # Initialize the distibutions
         for v in self.distribute:
-            self.distribute[v].initialize(self.topo, self.data)
+            self.distribute[v].initialize(self.active_topo, self.data)
 
         # -------------------------------------
         # Create Queues for all the variables
@@ -694,6 +740,10 @@ class SMRF():
         self.thread_variables += ['flatwind']
         self.thread_variables += ['cellmaxus', 'dir_round_cell']
 
+        # kriging variance that is output
+        for v in self.distribute:
+            self.thread_variables += self.distribute[v].variance_variables
+
         for v in self.thread_variables:
             q[v] = queue.DateQueue_Threading(self.max_values, self.time_out)
 
@@ -704,15 +754,18 @@ class SMRF():
         t.append(Thread(target=radiation.sunang_thread,
                         name='sun_angle',
                         args=(q, self.date_time,
-                              self.topo.topoConfig['basin_lat'],
-                              self.topo.topoConfig['basin_lon'],
-                              0, 0, 0)))
+                              self.context['cosz'].values,
+                              self.context['azimuth'].values)))
 
         # 0.2 illumination angle
         t.append(Thread(target=radiation.shade_thread,
                         name='illum_angle',
                         args=(q, self.date_time,
-                              self.topo.slope, self.topo.aspect)))
+                              self.active_topo.slope,
+                              self.active_topo.aspect),
+                        kwargs={'horizon': self.active_topo.horizon,
+                                'horizon_azimuths':
+                                    self.active_topo.horizon_azimuths}))
 
         # 1. Air temperature
         t.append(Thread(target=self.distribute['air_temp'].distribute_thread,
@@ -734,7 +787,7 @@ class SMRF():
         t.append(Thread(target=self.distribute['precip'].distribute_thread,
                         name='precipitation',
                         args=(q, self.data, self.date_time,
-                                self.topo.mask)))
+                                self.active_topo.mask, self.context)))
 
         # 5. Albedo
         t.append(Thread(target=self.distribute['albedo'].distribute_thread,
@@ -744,12 +797,14 @@ class SMRF():
         # 6.1 Clear sky visible
         t.append(Thread(target=self.distribute['solar'].distribute_thread_clear,
                         name='clear_vis',
-                        args=(q, self.data.cloud_factor, 'clear_vis')))
+                        args=(q, self.data.cloud_factor, 'clear_vis',
+                              self.context)))
 
         # 6.2 Clear sky ir
         t.append(Thread(target=self.distribute['solar'].distribute_thread_clear,
                         name='clear_ir',
-                        args=(q, self.data.cloud_factor, 'clear_ir')))
+                        args=(q, self.data.cloud_factor, 'clear_ir',
+                              self.context)))
 
         # 6.3 Net radiation
         t.append(Thread(target=self.distribute['solar'].distribute_thread,
@@ -826,12 +881,43 @@ class SMRF():
                                  'info': self.distribute[m].output_variables[v]}
                             variable_list[v] = d
 
+                        elif v.endswith('_variance') and \
+                                v[:-9] in self.distribute[m].output_variables.keys() and \
+                                self.distribute[m].config['distribution'] == 'kriging':
+
+                            # kriging variance of a distributed variable
+                            info = self.distribute[m].output_variables[v[:-9]]
+                            d = {'variable': v,
+                                 'module': m,
+                                 'out_location': os.path.join(self.config['output']['out_location'], v),
+                                 'info': {'units': '({})^2'.format(info['units']),
+                                          'standard_name': '{}_variance'.format(info['standard_name']),
+                                          'long_name': 'Kriging variance of {}'.format(info['long_name'].lower())}}
+                            variable_list[v] = d
+                            self.distribute[m].add_variance(v)
+
             # determine what type of file to output
             if self.config['output']['file_type'].lower() == 'netcdf':
                 self.out_func = output.output_netcdf(variable_list, self.topo,
                                                      self.config['time'],
                                                      self.config['output'])
 
+            elif self.config['output']['file_type'].lower() == 'netcdf_single':
+                self.out_func = output.output_netcdf_single(variable_list,
+                                                            self.topo,
+                                                            self.config['time'],
+                                                            self.config['output'])
+
+            elif self.config['output']['file_type'].lower() == 'zarr':
+                self.out_func = output.output_zarr(variable_list, self.topo,
+                                                   self.config['time'],
+                                                   self.config['output'])
+
+            elif self.config['output']['file_type'].lower() == 'points':
+                self.out_func = output.output_points(variable_list, self.topo,
+                                                     self.config['time'],
+                                                     self.config['output'])
+
             elif self.config['output']['file_type'].lower() == 'hru':
                 self.out_func = output.output_hru(variable_list, self.topo,
                                                   self.date_time,
@@ -845,6 +931,26 @@ class SMRF():
             if 'func' in self.config['output']:
                 self.out_func.func = self.config['output']['func']
 
+            # fill in the full grid from the active cells
+            if self.topo.active is not None:
+                self.out_func = output.output_active(self.out_func, self.topo)
+
+            # aggregate variables in time before they are output
+            if self.config['output']['aggregate'] is not None:
+                agg = output.output_aggregate.parse(
+                    self.config['output']['aggregate'], variable_list)
+
+                if getattr(self.out_func, 'type', None) in \
+                        ['netcdf_single', 'points'] and \
+                        (len(agg) != len(variable_list) or
+                         len(set(p for p, _ in agg.values())) > 1):
+                    raise ValueError('All variables must be aggregated over '
+                                     'the same period when '
+                                     'the file_type {} shares a time axis'
+                                     .format(self.config['output']['file_type']))
+
+                self.out_func = output.output_aggregate(self.out_func, agg)
+
         else:
             self._logger.info('No variables will be output')
             self.output_variables = None
@@ -860,7 +966,7 @@ class SMRF():
             var_name -
 
         """
-        output_count = self.date_time.index(current_time_step)
+        output_count = self.context.at[current_time_step, 'index']
 
         # Only output according to the user specified value,
         # or if it is the end.
@@ -888,11 +994,17 @@ class SMRF():
                 data = getattr(self.distribute[v['module']], v['variable'])
 
                 if data is None:
-                    data = np.zeros((self.topo.ny, self.topo.nx))
+                    data = np.zeros((self.active_topo.ny,
+                                     self.active_topo.nx))
 
                 # output the time step
                 self._logger.debug("Outputting {0}".format(v['module']))
-                self.out_func.output(v['variable'], data, current_time_step)
+                if getattr(self, 'out_writer', None) is not None:
+                    self.out_writer.put(v['variable'], data,
+                                        current_time_step)
+                else:
+                    self.out_func.output(v['variable'], data,
+                                         current_time_step)
 
     def post_process(self):
         """
@@ -68,6 +68,10 @@ class Band:
     """
     Represents a raster band of geospatial data
     """
+
+    # number of rows transformed at a time
+    decode_rows = 256
+
     def __init__(self, nlines, nsamps):
 
         # Using classes instead of dicts makes things faster
@@ -104,8 +108,40 @@ class Band:
         self.units = None
         self.transform = lambda x: (1.0 - 0.0) * (x / 255) + 0
 
+        # the integer values mapped from the file, decoded into data with
+        # the dtype when first accessed
+        self.dtype = np.float32
+        self._raw = None
         self.data = None
 
+    @property
+    def data(self):
+        """
+        The band as floating point values, decoded from the file when
+        first accessed
+        """
+        if self._data is None and self._raw is not None:
+            self._data = self._decode()
+            self._raw = None
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._raw = None
+
+    def _decode(self):
+        """
+        Transform the integer values to floats in blocks of rows so only a
+        block is held in double precision
+        """
+        data = np.empty((self.nlines, self.nsamps), dtype=self.dtype)
+        for i in range(0, self.nlines, self.decode_rows):
+            r = slice(i, i + self.decode_rows)
+            data[r] = self.transform(self._raw[r])
+
+        return data
+
     def _parse_geo_readline(self, L0, L1, L2, L3, L4, L5):
         """
         Get the geo header information from readline()
@@ -166,7 +202,7 @@ class IPW:
     """
     Represents a IPW file container
     """
-    def __init__(self, fname=None, epsg=32611):
+    def __init__(self, fname=None, epsg=32611, dtype=np.float32):
         """
         IPW(fname[, rescale=True])
 
@@ -199,12 +235,18 @@ class IPW:
             UTM Zone 18 Northern Hemisphere (WGS 84)  32618
             UTM Zone 19 Northern Hemisphere (WGS 84)  32619
 
+        dtype : numpy dtype (default = np.float32)
+            Floating point type of the band data. The pixel data is
+            memory mapped and each band is only decoded when its data
+            is accessed, so the file should not be changed until then
+
         """
         global in_db__vars, out_em__vars, out_snow__vars
 
         # this should just be stored as an attribute
         # it produces alot of book-keeping otherwise
         self.epsg = epsg
+        self.dtype = dtype
 
         # read a file or create an empty object
         if fname is not None:
@@ -226,7 +268,7 @@ class IPW:
     def read(self, fname):
         """
         Read the IPW file into the various bands
-        Turns the data into a numpy array of float32
+        Maps the data to be decoded into a numpy array of dtype
         """
 
         # read the data to a list of lines
@@ -330,10 +372,10 @@ class IPW:
         for b, name in zip(bands, varlist[:nbands]):
             b.name = name
 
-        # Unpack the binary data using numpy.fromfile
-        # because we have been reading line by line fid is at the
-        # first data byte, we will read it all as one big chunk
-        # and then put it into the appropriate bands
+        # Map the binary data in place of reading it, because we have been
+        # reading line by line fid is at the first data byte. Each band
+        # is a view of the memory map that is only decoded when the band
+        # data is accessed
         #
         # np.types allow you to define heterogenous arrays of mixed
         # types and reference them with keys, this helps us out here
@@ -343,19 +385,13 @@ class IPW:
         required_bytes = bip * nlines * nsamps
         assert (st_size - tell()) >= required_bytes
 
-        # this is way faster than looping with struct.unpack
-        # struct.unpack also starts assuming there are pad bytes
-        # when format strings with different types are supplied
-        data = np.fromfile(fid, dt, count=nlines*nsamps)
+        data = np.memmap(fname, dtype=dt, mode='r', offset=tell(),
+                         shape=(nlines, nsamps))
 
         # Separate into bands
-        data = data.reshape(nlines, nsamps)
         for b in bands:
-            b.data = np.array(b.transform(data[b.name]),
-                              dtype=np.float32)
-#             else:
-#                 b.data = np.array(data[b.name],
-#                                   dtype=np.dtype(b.frmt))
+            b.dtype = self.dtype
+            b._raw = data[b.name]
 
         # clean things up
         self.fname = fname
@@ -374,7 +410,7 @@ class IPW:
     def read3(self, fname):
         """
         Read the IPW file into the various bands
-        Turns the data into a numpy array of float32
+        Maps the data to be decoded into a numpy array of dtype
         This is meant for Python3 which has different ways
         of ready binary files than Python2
         """
@@ -479,10 +515,10 @@ class IPW:
         for b, name in zip(bands, varlist[:nbands]):
             b.name = name
 
-        # Unpack the binary data using numpy.fromfile
-        # because we have been reading line by line fid is at the
-        # first data byte, we will read it all as one big chunk
-        # and then put it into the appropriate bands
+        # Map the binary data in place of reading it, because we have been
+        # reading line by line fid is at the first data byte. Each band
+        # is a view of the memory map that is only decoded when the band
+        # data is accessed
         #
         # np.types allow you to define heterogenous arrays of mixed
         # types and reference them with keys, this helps us out here
@@ -492,19 +528,13 @@ class IPW:
         required_bytes = bip * nlines * nsamps
         assert (st_size - fid.tell()) >= required_bytes
 
-        # this is way faster than looping with struct.unpack
-        # struct.unpack also starts assuming there are pad bytes
-        # when format strings with different types are supplied
-        data = np.fromfile(fid, dt, count=nlines*nsamps)
+        data = np.memmap(fname, dtype=dt, mode='r', offset=fid.tell(),
+                         shape=(nlines, nsamps))
 
         # Separate into bands
-        data = data.reshape(nlines, nsamps)
         for b in bands:
-            b.data = np.array(b.transform(data[b.name]),
-                              dtype=np.float32)
-#             else:
-#                 b.data = np.array(data[b.name],
-#                                   dtype=np.dtype(b.frmt))
+            b.dtype = self.dtype
+            b._raw = data[b.name]
 
         # clean things up
         self.fname = fname
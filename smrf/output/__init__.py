@@ -1,3 +1,7 @@
 # -*- coding: utf-8 -*-
-from .output_netcdf import output_netcdf
+from .output_active import output_active
+from .output_aggregate import output_aggregate
+from .output_netcdf import output_netcdf, output_netcdf_single
 from .output_hru import output_hru
+from .output_points import output_points
+from .output_zarr import output_zarr
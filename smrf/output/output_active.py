@@ -0,0 +1,45 @@
+"""
+Functions to output the variables of the active cells on the full grid
+"""
+
+
+class output_active():
+    """
+    Class output_active() to fill in the full grid from the active cells
+    before the variables are passed to the output class. Used when
+    ``active_cells`` is set in the [topo] section, so the distribution only
+    holds the cells in the mask and the cells outside of the mask are NaN in
+    the output.
+    """
+
+    def __init__(self, out_func, topo):
+        """
+        Initialize the output_active() class
+
+        Args:
+            out_func: output class that the full grids are written to
+            topo: :mod:`smrf.data.loadTopo.topo` instance with the active
+                cells
+        """
+
+        self.out_func = out_func
+        self.topo = topo
+
+    def __getattr__(self, name):
+        """
+        Everything else comes from the wrapped output class
+        """
+
+        return getattr(self.__dict__['out_func'], name)
+
+    def output(self, variable, data, date_time):
+        """
+        Fill in the full grid and output the time step
+
+        Args:
+            variable: variable name that will index into variable list
+            data: the variable data for the active cells
+            date_time: the date time object for the time step
+        """
+
+        self.out_func.output(variable, self.topo.expand(data), date_time)
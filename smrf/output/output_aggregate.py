@@ -0,0 +1,189 @@
+"""
+Functions to aggregate the output variables in time
+"""
+
+import numpy as np
+import logging
+
+
+class output_aggregate():
+    """
+    Class output_aggregate() to aggregate variables in time before they are
+    passed to the output class. Each aggregated variable keeps a running
+    accumulator of a single grid (sum, min or max) and a count, and the
+    aggregate is written to the wrapped output class once the period has
+    ended with the date time of the first time step in the period, so a run
+    that starts part way through a period is never labelled before its start
+    date. Variables that are not aggregated are passed through for every
+    time step.
+
+    The aggregation is set with ``aggregate`` in the [output] section as
+    variable:period_stat, where period is daily or monthly and stat is sum,
+    mean, min or max, for example ``precip:daily_sum air_temp:daily_mean``.
+    The periods follow the time zone of the run.
+    """
+
+    periods = ['daily', 'monthly']
+    stats = ['sum', 'mean', 'min', 'max']
+
+    def __init__(self, out_func, aggregate):
+        """
+        Initialize the output_aggregate() class
+
+        Args:
+            out_func: output class that the aggregates are written to
+            aggregate: dict of variable name to (period, stat) tuple
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self.out_func = out_func
+        self.aggregate = aggregate
+
+        if out_func.out_frequency != 1:
+            self._logger.warning('Output frequency is {}, only the time '
+                                 'steps that are output will be aggregated'
+                                 .format(out_func.out_frequency))
+
+        self.accumulator = {}
+        for v, (period, stat) in self.aggregate.items():
+            self.accumulator[v] = {'period': period,
+                                   'stat': stat,
+                                   'key': None,
+                                   'date_time': None,
+                                   'data': None,
+                                   'count': 0}
+
+            self._logger.info('Outputting the {} {} of {}'
+                              .format(period, stat, v))
+
+    def __getattr__(self, name):
+        """
+        Everything else comes from the wrapped output class
+        """
+
+        return getattr(self.__dict__['out_func'], name)
+
+    @staticmethod
+    def parse(aggregate, variables):
+        """
+        Parse the ``aggregate`` option from the [output] section
+
+        Args:
+            aggregate: list of variable:period_stat strings
+            variables: the variables to be output
+
+        Returns:
+            dict of variable name to (period, stat) tuple
+        """
+
+        agg = {}
+        for a in aggregate:
+            a = a.split(':')
+            if len(a) != 2 or len(a[1].split('_')) != 2:
+                raise ValueError('aggregate must be given as '
+                                 'variable:period_stat')
+
+            v = a[0].strip()
+            period, stat = a[1].strip().lower().split('_')
+
+            if period not in output_aggregate.periods:
+                raise ValueError('aggregate period for {} must be one of {}'
+                                 .format(v, output_aggregate.periods))
+            if stat not in output_aggregate.stats:
+                raise ValueError('aggregate statistic for {} must be one of {}'
+                                 .format(v, output_aggregate.stats))
+            if v not in variables:
+                raise ValueError('Cannot aggregate {}, it is not an output '
+                                 'variable'.format(v))
+
+            agg[v] = (period, stat)
+
+        return agg
+
+    def period(self, period, date_time):
+        """
+        The period that a time step belongs to
+
+        Args:
+            period: daily or monthly
+            date_time: the date time object for the time step
+
+        Returns:
+            tuple: key for the period
+        """
+
+        if period == 'daily':
+            return (date_time.year, date_time.month, date_time.day)
+
+        return (date_time.year, date_time.month)
+
+    def output(self, variable, data, date_time):
+        """
+        Add the time step to the accumulator for the variable, writing the
+        aggregate for the last period when a new period starts
+
+        Args:
+            variable: variable name that will index into variable list
+            data: the variable data
+            date_time: the date time object for the time step
+        """
+
+        a = self.accumulator.get(variable)
+        if a is None:
+            self.out_func.output(variable, data, date_time)
+            return
+
+        key = self.period(a['period'], date_time)
+        if a['key'] != key:
+            self.write(variable)
+            a['key'] = key
+            a['date_time'] = date_time
+
+        if a['count'] == 0:
+            if a['data'] is None:
+                # sums are kept as float64 to limit the round off
+                a['data'] = np.empty(data.shape, dtype=np.float64)
+            a['data'][:] = data
+
+        elif a['stat'] in ['sum', 'mean']:
+            a['data'] += data
+        elif a['stat'] == 'min':
+            np.fmin(a['data'], data, out=a['data'])
+        else:
+            np.fmax(a['data'], data, out=a['data'])
+
+        a['count'] += 1
+
+    def write(self, variable):
+        """
+        Write the aggregate for the current period of a variable and reset
+        the accumulator
+
+        Args:
+            variable: variable name that will index into variable list
+        """
+
+        a = self.accumulator[variable]
+        if a['count'] == 0:
+            return
+
+        self._logger.debug('{} Writing {} {} of {}'
+                           .format(a['date_time'], a['period'], a['stat'],
+                                   variable))
+
+        if a['stat'] == 'mean':
+            a['data'] /= a['count']
+
+        self.out_func.output(variable, a['data'], a['date_time'])
+        a['count'] = 0
+
+    def close(self):
+        """
+        Write the aggregates for the last period and close the output class
+        """
+
+        for v in self.accumulator:
+            self.write(v)
+
+        self.out_func.close()
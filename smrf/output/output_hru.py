@@ -63,7 +63,7 @@ class output_hru():
         # process the time section
         self.out_frequency = int(config['frequency'])
         self.date_time = date_time
-        self.idx = 0
+        self.write_buffer = max(int(config['write_buffer']), 1)
 
         # read in the HRU file
         self._logger.debug('Reading HRU ascii {}'
@@ -76,41 +76,25 @@ class output_hru():
         self.hru = hru
         self.hru_max = hru_max
 
-        self.IND = {}
-        for h in range(hru_max):
-            self.IND[h] = hru == h+1
+        # flat index of the cells in a HRU and the zero based HRU label for
+        # each of those cells, used for the bincount reductions
+        labels = hru.ravel().astype(int)
+        self.hru_cells = np.flatnonzero((labels >= 1) & (labels <= hru_max))
+        self.hru_label = labels[self.hru_cells] - 1
 
         self.hru_idx = [str(i+1) for i in range(self.hru_max)]
 
-        # create an empty dataframe
+        # buffered rows for each variable before writing
+        for v in self.variable_list:
+            self.variable_list[v]['rows'] = \
+                np.empty((self.write_buffer, self.hru_max))
+            self.variable_list[v]['dates'] = []
+            self.variable_list[v]['header'] = not self.prms_flag
+
+        # lets start the output file
         if self.prms_flag:
-            cols = self.date_cols + self.hru_idx
-            hru_data = pd.DataFrame(index=range(len(self.date_time)),
-                                    columns=cols)
-
-            yrs = np.array([[y.year, y.month, y.day, y.hour, y.minute, y.second]
-                            for y in self.date_time])
-            hru_data['year'] = yrs[:, 0]
-            hru_data['month'] = yrs[:, 1]
-            hru_data['day'] = yrs[:, 2]
-            hru_data['hour'] = yrs[:, 3]
-            hru_data['minute'] = yrs[:, 4]
-            hru_data['second'] = yrs[:, 5]
-
-            hru_data.loc[:, self.hru_idx] = \
-                hru_data.loc[:, self.hru_idx].apply(pd.to_numeric)
-
-            # lets start the output file
             self.generate_prms_header()
 
-        else:
-            cols = ["date_time"] + self.hru_idx
-            hru_data = pd.DataFrame(index=range(len(self.date_time)),
-                                    columns=cols)
-            hru_data['date_time'] = self.date_time
-
-        self.hru_data = hru_data
-
 #     def generate_csv_header(self, hru_data):
 #         """
 #         Generate the header for the csv file
@@ -138,9 +122,31 @@ class output_hru():
                 f.write("########################################\n")
                 f.close()
 
+    def hru_mean(self, data):
+        """
+        Mean of the data in each HRU, ignoring NaN values
+
+        Args:
+            data: the variable data
+
+        Returns:
+            numpy array of the mean for each HRU
+        """
+
+        d = np.asarray(data, dtype=np.float64).ravel()[self.hru_cells]
+        ind = ~np.isnan(d)
+
+        total = np.bincount(self.hru_label[ind], weights=d[ind],
+                            minlength=self.hru_max)
+        count = np.bincount(self.hru_label[ind], minlength=self.hru_max)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return total / count
+
     def output(self, variable, data, date_time):
         """
-        Output a time step
+        Output a time step, the rows are buffered and written once
+        ``write_buffer`` time steps have been collected
 
         Args:
             variable: variable name that will index into variable list
@@ -151,38 +157,58 @@ class output_hru():
         self._logger.debug('{} Writing variable {} to {} file'
                            .format(date_time, variable, self.config['output_type']))
 
-        # loop through the HRU
-        m_hru = np.zeros((self.hru_max,))
-        for h in range(self.hru_max):
-            m_hru[h] = np.nanmean(data[self.IND[h]])
-
-#             self.hru_data.loc[self.idx, (str(h+1))] = m_hru[h]
+        m_hru = self.hru_mean(data)
 
         if self.func == 'mm2in':
             m_hru /= 25.4
         elif self.func == 'C2F':
             m_hru = m_hru * 9/5 + 32
 
-        self.hru_data.loc[self.idx, self.hru_idx] = m_hru
+        f = self.variable_list[variable]
+        f['rows'][len(f['dates'])] = m_hru
+        f['dates'].append(date_time)
+
+        if len(f['dates']) == self.write_buffer:
+            self.flush(variable)
+
+    def flush(self, variable):
+        """
+        Write the buffered rows for a variable to the file
+
+        Args:
+            variable: variable name that will index into variable list
+        """
+
+        f = self.variable_list[variable]
+        n = len(f['dates'])
+        if n == 0:
+            return
 
-        # open the file and write the row of data
-        with open(self.variable_list[variable]['file_name'], 'a') as f:
+        rows = pd.DataFrame(f['rows'][:n], columns=self.hru_idx)
 
-            row = self.hru_data.iloc[self.idx].to_frame().T
+        if self.prms_flag:
+            dates = pd.DataFrame([[y.year, y.month, y.day,
+                                   y.hour, y.minute, y.second]
+                                  for y in f['dates']],
+                                 columns=self.date_cols)
+        else:
+            dates = pd.DataFrame({'date_time': f['dates']})
 
-            # change the dates columns back to int
-            if self.prms_flag:
-                row[self.date_cols] = row[self.date_cols].astype(int)
+        rows = pd.concat([dates, rows], axis=1)
 
-            hdr = None
-            if (self.idx == 0) & (not self.prms_flag):
-                hdr = True
+        with open(f['file_name'], 'a') as fp:
+            rows.to_csv(fp, sep=self.delimiter,
+                        header=f['header'],
+                        index=False,
+                        float_format='%.3f')
 
-            row.to_csv(f, sep=self.delimiter,
-                       header=hdr,
-                       index=False,
-                       float_format='%.3f')
+        f['header'] = False
+        f['dates'] = []
 
-            f.close()
+    def close(self):
+        """
+        Write any buffered rows to the files
+        """
 
-        self.idx += 1
+        for v in self.variable_list:
+            self.flush(v)
@@ -13,9 +13,47 @@ from smrf.utils import utils
 
 from smrf import __version__
 
+
+def parse_least_significant_digit(values):
+    """
+    Parse the ``least_significant_digit`` option of the [output] section
+
+    Args:
+        values: list of variable:digits strings or None
+
+    Returns:
+        dict of the number of decimal digits to keep for each variable
+    """
+
+    lsd = {}
+    if values is None:
+        return lsd
+
+    for v in values:
+        v = v.split(':')
+        if len(v) != 2:
+            raise ValueError('least_significant_digit must be given'
+                             ' as variable:digits')
+        try:
+            lsd[v[0].strip()] = int(v[1])
+        except ValueError:
+            raise ValueError('least_significant_digit for {} must be an'
+                             ' integer'.format(v[0].strip()))
+
+    return lsd
+
+
 class output_netcdf():
     """
     Class output_netcdf() to output values to a netCDF file
+
+    The NetCDF files are kept open for the entire run and the time index for
+    each file is tracked in memory. Each variable holds ``write_buffer`` time
+    steps in memory and writes them as a single (k, ny, nx) slab. Call
+    :mod:`~smrf.output.output_netcdf.output_netcdf.close` at the end of the
+    run, or use the class as a context manager, to write any buffered time
+    steps and close the files. The files are also closed when the instance
+    is garbage collected.
     """
 
     type = 'netcdf'
@@ -33,126 +71,215 @@ class output_netcdf():
 
         self._logger = logging.getLogger(__name__)
 
+        # process the time section
+        self.run_time_step = int(time['time_step'])
+        self.out_frequency = int(outConfig['frequency'])
+        self.write_buffer = max(int(outConfig['write_buffer']), 1)
+        self.outConfig = outConfig
+
         # go through the variable list and make full file names
         for v in variable_list:
-            variable_list[v]['file_name'] = \
-                variable_list[v]['out_location'] + '.nc'
+            variable_list[v]['file_name'] = self.file_name(variable_list[v])
 
         self.variable_list = variable_list
 
-        # process the time section
-        self.run_time_step = int(time['time_step'])
-        self.out_frequency = int(outConfig['frequency'])
-        self.outConfig = outConfig
+        # chunk shape, which can not be larger than the grid
+        cs = outConfig['chunk_size']
+        if cs is None:
+            cs = self.cs
+        self.cs = (int(cs[0]),
+                   min(int(cs[1]), topo.y.shape[0]),
+                   min(int(cs[2]), topo.x.shape[0]))
+
+        # quantize variables to a number of decimal digits, variable:digits
+        self.least_significant_digit = parse_least_significant_digit(
+            outConfig['least_significant_digit'])
 
         # determine the x,y vectors for the netCDF file
         x = topo.x
         y = topo.y
         self.mask = topo.mask
-#         dimensions = ('Time','dateStrLen','y','x')
-        dimensions = ('time', 'y', 'x')
         self.date_time = {}
 
+        # open files, variables that share a file share the handle
+        self.files = {}
         for v in self.variable_list:
 
             f = self.variable_list[v]
 
-            if os.path.isfile(f['file_name']):
-                self._logger.warning('Opening {}, data may be overwritten!'
-                                  .format(f['file_name']))
-                s = nc.Dataset(f['file_name'], 'a')
-#                 h = getattr(s, 'history')
-                h = '[{}] Data added or updated'.format(
-                    datetime.now().strftime(self.fmt))
-                setattr(s, 'last_modified', h)
-
-            else:
-                self._logger.debug('Creating %s' % f['file_name'])
-                s = nc.Dataset(f['file_name'], 'w',
-                               format='NETCDF4', clobber=False)
-
-                # add dimensions
-                s.createDimension(dimensions[0], None)
-    #             s.createDimension(dimensions[1], 19)
-                s.createDimension(dimensions[1], y.shape[0])
-                s.createDimension(dimensions[2], x.shape[0])
-
-                # create the variables
-                s.createVariable('time', 'f', (dimensions[0]))
-                s.createVariable('y', 'f', dimensions[1])
-                s.createVariable('x', 'f', dimensions[2])
-                s.createVariable(f['variable'], 'f',
-                                 (dimensions[0], dimensions[1], dimensions[2]),
-                                 chunksizes=self.cs)
-
-                # define some attributes
-                s.variables['time'].setncattr(
-                        'units',
-                        'hours since {}'.format(time['start_date']))
-                s.variables['time'].setncattr(
-                        'calendar',
-                        'standard')
-                s.variables['time'].setncattr(
-                        'time_zone',
-                        time['time_zone'])
-                s.variables['time'].setncattr(
-                        'long_name',
-                        'time')
-
-                # the y variable attributes
-                s.variables['y'].setncattr(
-                        'units',
-                        'meters')
-                s.variables['y'].setncattr(
-                        'description',
-                        'UTM, north south')
-                s.variables['y'].setncattr(
-                        'long_name',
-                        'y coordinate')
-
-                # the x variable attributes
-                s.variables['x'].setncattr(
-                        'units',
-                        'meters')
-                s.variables['x'].setncattr(
-                        'description',
-                        'UTM, east west')
-                s.variables['x'].setncattr(
-                        'long_name',
-                        'x coordinate')
-
-                # the variable attributes
-                s.variables[f['variable']].setncattr(
-                        'module',
-                        f['module'])
-                s.variables[f['variable']].setncattr(
-                        'units',
-                        f['info']['units'])
-                s.variables[f['variable']].setncattr(
-                        'long_name',
-                        f['info']['long_name'])
-
-                # define some global attributes
-                s.setncattr_string('Conventions', 'CF-1.6')
-                s.setncattr_string('dateCreated', datetime.now().strftime(self.fmt))
-                s.setncattr_string('title', 'Distirbuted {0} data from SMRF'.format(f['info']['long_name']))
-                s.setncattr_string('history', '[{}] Create netCDF4 file'.format(datetime.now().strftime(self.fmt)))
-                s.setncattr_string('institution',
-                        'USDA Agricultural Research Service, Northwest Watershed Research Center')
-
-                s.setncattr_string('references',
-                        'Online documentation smrf.readthedocs.io; https://doi.org/10.1016/j.cageo.2017.08.016')
-
-                s.variables['y'][:] = y
-                s.variables['x'][:] = x
-
-            s.setncattr_string('source',
-                    'SMRF {}'.format(utils.getgitinfo()))
-            s.close()
+            if f['file_name'] not in self.files:
+                self.files[f['file_name']] = self.open_file(f, x, y, time)
+            f['nc'] = self.files[f['file_name']]
+
+            s = f['nc']['nc_file']
+            if f['variable'] not in s.variables:
+                self.create_variable(s, f)
+
+            # buffer for the time steps before writing
+            f['buffer'] = np.empty((self.write_buffer, y.shape[0],
+                                    x.shape[0]), dtype=np.float32)
+            f['buffer_time'] = []
+            f['buffer_index'] = []
+
+    def file_name(self, f):
+        """
+        File name for a variable, each variable has its own file
+
+        Args:
+            f: variable dict from the variable list
+        """
+
+        return f['out_location'] + '.nc'
+
+    def title(self, f):
+        """
+        Title attribute for a new file
+
+        Args:
+            f: variable dict from the variable list
+        """
+
+        return 'Distirbuted {0} data from SMRF'.format(f['info']['long_name'])
+
+    def open_file(self, f, x, y, time):
+        """
+        Open an existing NetCDF file or create a new one with the time, y and
+        x dimensions, and read the time index into memory
+
+        Args:
+            f: variable dict from the variable list
+            x: x coordinate vector
+            y: y coordinate vector
+            time: configuration from the [time] section
+
+        Returns:
+            dict: the open file and the time index for the file
+        """
+
+        dimensions = ('time', 'y', 'x')
+
+        if os.path.isfile(f['file_name']):
+            self._logger.warning('Opening {}, data may be overwritten!'
+                              .format(f['file_name']))
+            s = nc.Dataset(f['file_name'], 'a')
+            h = '[{}] Data added or updated'.format(
+                datetime.now().strftime(self.fmt))
+            setattr(s, 'last_modified', h)
+
+        else:
+            self._logger.debug('Creating %s' % f['file_name'])
+            s = nc.Dataset(f['file_name'], 'w',
+                           format='NETCDF4', clobber=False)
+
+            # add dimensions
+            s.createDimension(dimensions[0], None)
+            s.createDimension(dimensions[1], y.shape[0])
+            s.createDimension(dimensions[2], x.shape[0])
+
+            # create the variables
+            s.createVariable('time', 'f', (dimensions[0]))
+            s.createVariable('y', 'f', dimensions[1])
+            s.createVariable('x', 'f', dimensions[2])
+
+            # define some attributes
+            s.variables['time'].setncattr(
+                    'units',
+                    'hours since {}'.format(time['start_date']))
+            s.variables['time'].setncattr(
+                    'calendar',
+                    'standard')
+            s.variables['time'].setncattr(
+                    'time_zone',
+                    time['time_zone'])
+            s.variables['time'].setncattr(
+                    'long_name',
+                    'time')
+
+            # the y variable attributes
+            s.variables['y'].setncattr(
+                    'units',
+                    'meters')
+            s.variables['y'].setncattr(
+                    'description',
+                    'UTM, north south')
+            s.variables['y'].setncattr(
+                    'long_name',
+                    'y coordinate')
+
+            # the x variable attributes
+            s.variables['x'].setncattr(
+                    'units',
+                    'meters')
+            s.variables['x'].setncattr(
+                    'description',
+                    'UTM, east west')
+            s.variables['x'].setncattr(
+                    'long_name',
+                    'x coordinate')
+
+            # define some global attributes
+            s.setncattr_string('Conventions', 'CF-1.6')
+            s.setncattr_string('dateCreated', datetime.now().strftime(self.fmt))
+            s.setncattr_string('title', self.title(f))
+            s.setncattr_string('history', '[{}] Create netCDF4 file'.format(datetime.now().strftime(self.fmt)))
+            s.setncattr_string('institution',
+                    'USDA Agricultural Research Service, Northwest Watershed Research Center')
+
+            s.setncattr_string('references',
+                    'Online documentation smrf.readthedocs.io; https://doi.org/10.1016/j.cageo.2017.08.016')
+
+            s.variables['y'][:] = y
+            s.variables['x'][:] = x
+
+        s.setncattr_string('source',
+                'SMRF {}'.format(utils.getgitinfo()))
+
+        # keep the file open and track the time index in memory
+        times = s.variables['time']
+        nf = {'nc_file': s,
+              'time_units': times.units,
+              'calendar': times.calendar,
+              'time_index': dict((float(tv), i)
+                                 for i, tv in enumerate(times[:])),
+              'ntimes': len(times),
+              'nwritten': len(times)}
+
+        return nf
+
+    def create_variable(self, s, f):
+        """
+        Create the variable in the NetCDF file with the chunking and
+        compression options from the [output] section
+
+        Args:
+            s: open NetCDF file
+            f: variable dict from the variable list
+        """
+
+        lsd = self.least_significant_digit.get(f['variable'])
+        s.createVariable(f['variable'], 'f',
+                         ('time', 'y', 'x'),
+                         chunksizes=self.cs,
+                         zlib=self.outConfig['zlib'],
+                         complevel=self.outConfig['complevel'],
+                         shuffle=self.outConfig['shuffle'],
+                         least_significant_digit=lsd)
+
+        # the variable attributes
+        s.variables[f['variable']].setncattr(
+                'module',
+                f['module'])
+        s.variables[f['variable']].setncattr(
+                'units',
+                f['info']['units'])
+        s.variables[f['variable']].setncattr(
+                'long_name',
+                f['info']['long_name'])
 
     def output(self, variable, data, date_time):
         """
-        Output a time step
+        Output a time step, the data is buffered and written once
+        ``write_buffer`` time steps have been collected
 
         Args:
             variable: variable name that will index into variable list
@@ -163,36 +290,121 @@ class output_netcdf():
         self._logger.debug('{0} Writing variable {1} to netCDF'
                            .format(date_time, variable))
 
-#         f = self.variable_list[variable]['nc_file']
-        f = nc.Dataset(self.variable_list[variable]['file_name'],
-                       'a', 'NETCDF4')
+        f = self.variable_list[variable]
+        nf = f['nc']
 
         # the current time integer
-        times = f.variables['time']
-        t = nc.date2num(date_time.replace(tzinfo=None),
-                        times.units,
-                        times.calendar)
-
-        if len(times) != 0:
-            index = np.where(times[:] == t)[0]
-            if index.size == 0:
-                index = len(times)
-            else:
-                index = index[0]
+        t = float(nc.date2num(date_time.replace(tzinfo=None),
+                              nf['time_units'],
+                              nf['calendar']))
+
+        index = nf['time_index'].get(t)
+        if index is None:
+            index = nf['ntimes']
+            nf['time_index'][t] = index
+            nf['ntimes'] += 1
+
+        # overwrite a time step that is already in the buffer
+        if index in f['buffer_index']:
+            n = f['buffer_index'].index(index)
         else:
-            index = len(times)
-
-#         self.date_time[variable] = np.append(self.date_time[variable], pd.to_datetime(date_time))
-
-            # insert the time
-        f.variables['time'][index] = t
+            n = len(f['buffer_index'])
+            f['buffer_index'].append(index)
+            f['buffer_time'].append(t)
 
         # insert the data
         if self.outConfig['mask']:
-            f.variables[variable][index, :] = data*self.mask
+            f['buffer'][n] = data*self.mask
+        else:
+            f['buffer'][n] = data
+
+        if len(f['buffer_index']) == self.write_buffer:
+            self.flush(variable)
+
+    def flush(self, variable):
+        """
+        Write the buffered time steps for a variable to the NetCDF file
+
+        Args:
+            variable: variable name that will index into variable list
+        """
+
+        f = self.variable_list[variable]
+        n = len(f['buffer_index'])
+        if n == 0:
+            return
+
+        nf = f['nc']
+        s = nf['nc_file']
+        index = np.array(f['buffer_index'])
+
+        # only write the times that are not already in the file
+        new_time = index >= nf['nwritten']
+
+        if np.all(np.diff(index) == 1):
+            # contiguous time steps are written as one slab
+            if np.any(new_time):
+                s.variables['time'][index[0]:index[0] + n] = f['buffer_time']
+            s.variables[variable][index[0]:index[0] + n, :] = f['buffer'][:n]
+
         else:
-            f.variables[variable][index, :] = data
+            for i, idx in enumerate(index):
+                if new_time[i]:
+                    s.variables['time'][idx] = f['buffer_time'][i]
+                s.variables[variable][idx, :] = f['buffer'][i]
+
+        nf['nwritten'] = max(nf['nwritten'], index.max() + 1)
+
+        f['buffer_index'] = []
+        f['buffer_time'] = []
+
+    def close(self):
+        """
+        Write any buffered time steps and close all the NetCDF files
+        """
+
+        for v, f in self.variable_list.items():
+            if 'buffer_index' in f and f['nc']['nc_file'] is not None:
+                self.flush(v)
+
+        for nf in self.files.values():
+            if nf['nc_file'] is not None:
+                nf['nc_file'].close()
+                nf['nc_file'] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        # don't lose the buffered time steps if close was never called
+        if hasattr(self, 'files'):
+            self.close()
+
+
+class output_netcdf_single(output_netcdf):
+    """
+    Class output_netcdf_single() to output all the variables to a single
+    netCDF file, ``smrf.nc`` in the output location, that shares the time,
+    y and x coordinate variables. See
+    :mod:`~smrf.output.output_netcdf.output_netcdf` for the buffering.
+    """
+
+    type = 'netcdf_single'
+    file = 'smrf.nc'
+
+    def file_name(self, f):
+        """
+        All variables are in the same file
+        """
+
+        return os.path.join(self.outConfig['out_location'], self.file)
+
+    def title(self, f):
+        """
+        Title attribute for the file
+        """
 
-        # synce the data to disk to that it can be viewed immediately
-#         f.sync()
-        f.close()
+        return 'Distributed data from SMRF'
@@ -0,0 +1,229 @@
+"""
+Functions to output the gridded data at points
+"""
+
+import netCDF4 as nc
+import numpy as np
+import logging
+import os
+import pandas as pd
+from datetime import datetime
+from smrf.utils import utils
+
+
+class output_points():
+    """
+    Class output_points() to output the values at a set of points to a
+    single CF timeSeries NetCDF file, ``smrf_points.nc`` in the output
+    location. The points are the nearest pixels to the x, y locations in
+    the ``points_file`` CSV with columns id, x, y. If no ``points_file`` is
+    given, the station pixel locations ``xi`` and ``yi`` from the metadata
+    are used once :mod:`smrf.framework.model_framework.SMRF.loadData` has
+    found them.
+    """
+
+    type = 'points'
+    fmt = '%Y-%m-%d %H:%M:%S'
+    file = 'smrf_points.nc'
+
+    def __init__(self, variable_list, topo, time, outConfig):
+        """
+        Initialize the output_points() class
+
+        Args:
+            variable_list: list of dicts, one for each variable
+            topo: loadTopo instance
+            time: configuration from the [time] section
+            outConfig: configuration from the [output] section
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self.variable_list = variable_list
+        self.outConfig = outConfig
+        self.time = time
+        self.out_frequency = int(outConfig['frequency'])
+        self.write_buffer = max(int(outConfig['write_buffer']), 1)
+        self.file_name = os.path.join(outConfig['out_location'], self.file)
+        for v in variable_list:
+            variable_list[v]['file_name'] = self.file_name
+
+        self.x = topo.x
+        self.y = topo.y
+
+        self.points = None
+        self.nc_file = None
+
+        if outConfig['points_file'] is not None:
+            p = pd.read_csv(outConfig['points_file'], index_col=0)
+            p.columns = [c.lower() for c in p.columns]
+            self.set_points(p)
+
+    def set_points(self, points):
+        """
+        Set the points to output and create the NetCDF file
+
+        Args:
+            points: Pandas dataframe indexed by the point id with either the
+                pixel locations ``xi`` and ``yi`` or the coordinates ``x``
+                and ``y``
+        """
+
+        points = points.copy()
+        if 'xi' not in points.columns or 'yi' not in points.columns:
+            points['xi'] = [np.argmin(np.abs(self.x - v)) for v in points['x']]
+            points['yi'] = [np.argmin(np.abs(self.y - v)) for v in points['y']]
+
+            outside = (points['x'] < np.min(self.x)) | \
+                (points['x'] > np.max(self.x)) | \
+                (points['y'] < np.min(self.y)) | \
+                (points['y'] > np.max(self.y))
+            if np.any(outside):
+                self._logger.warning('Points {} are outside of the model '
+                                     'domain, using the nearest pixel'
+                                     .format(points.index[outside].tolist()))
+
+        self.points = points
+        self.xi = points['xi'].values.astype(int)
+        self.yi = points['yi'].values.astype(int)
+        self.npoints = len(points)
+
+        self._logger.info('Outputting {} points to {}'
+                          .format(self.npoints, self.file_name))
+
+        self.create_file()
+
+    def create_file(self):
+        """
+        Create the CF timeSeries NetCDF file for the points
+        """
+
+        if os.path.isfile(self.file_name):
+            self._logger.warning('Overwriting {}'.format(self.file_name))
+
+        s = nc.Dataset(self.file_name, 'w', format='NETCDF4')
+
+        s.createDimension('time', None)
+        s.createDimension('station', self.npoints)
+
+        s.createVariable('time', 'f', ('time',))
+        s.variables['time'].setncattr(
+                'units',
+                'hours since {}'.format(self.time['start_date']))
+        s.variables['time'].setncattr('calendar', 'standard')
+        s.variables['time'].setncattr('time_zone', self.time['time_zone'])
+        s.variables['time'].setncattr('long_name', 'time')
+
+        s.createVariable('station_name', str, ('station',))
+        s.variables['station_name'].setncattr('cf_role', 'timeseries_id')
+        s.variables['station_name'].setncattr('long_name', 'point id')
+        s.variables['station_name'][:] = \
+            np.array([str(i) for i in self.points.index], dtype=object)
+
+        s.createVariable('x', 'f', ('station',))
+        s.variables['x'].setncattr('units', 'meters')
+        s.variables['x'].setncattr('description', 'UTM, east west')
+        s.variables['x'].setncattr('long_name', 'x coordinate of the pixel')
+        s.variables['x'][:] = self.x[self.xi]
+
+        s.createVariable('y', 'f', ('station',))
+        s.variables['y'].setncattr('units', 'meters')
+        s.variables['y'].setncattr('description', 'UTM, north south')
+        s.variables['y'].setncattr('long_name', 'y coordinate of the pixel')
+        s.variables['y'][:] = self.y[self.yi]
+
+        for v in self.variable_list:
+            f = self.variable_list[v]
+            s.createVariable(v, 'f', ('time', 'station'))
+            s.variables[v].setncattr('module', f['module'])
+            s.variables[v].setncattr('units', f['info']['units'])
+            s.variables[v].setncattr('long_name', f['info']['long_name'])
+            s.variables[v].setncattr('coordinates', 'time y x station_name')
+
+            f['buffer'] = np.empty((self.write_buffer, self.npoints),
+                                   dtype=np.float32)
+            f['buffer_index'] = []
+
+        s.setncattr_string('Conventions', 'CF-1.6')
+        s.setncattr_string('featureType', 'timeSeries')
+        s.setncattr_string('dateCreated', datetime.now().strftime(self.fmt))
+        s.setncattr_string('title', 'Distributed data from SMRF at points')
+        s.setncattr_string('institution',
+                'USDA Agricultural Research Service, Northwest Watershed Research Center')
+        s.setncattr_string('source', 'SMRF {}'.format(utils.getgitinfo()))
+
+        self.nc_file = s
+        self.time_index = {}
+        self.ntimes = 0
+
+    def output(self, variable, data, date_time):
+        """
+        Output a time step at the points, the values are buffered and
+        written once ``write_buffer`` time steps have been collected
+
+        Args:
+            variable: variable name that will index into variable list
+            data: the variable data
+            date_time: the date time object for the time step
+        """
+
+        if self.nc_file is None:
+            raise Exception('Points to output have not been set')
+
+        f = self.variable_list[variable]
+
+        t = float(nc.date2num(date_time.replace(tzinfo=None),
+                              self.nc_file.variables['time'].units,
+                              'standard'))
+
+        index = self.time_index.get(t)
+        if index is None:
+            index = self.ntimes
+            self.time_index[t] = index
+            self.ntimes += 1
+            self.nc_file.variables['time'][index] = t
+
+        if index in f['buffer_index']:
+            n = f['buffer_index'].index(index)
+        else:
+            n = len(f['buffer_index'])
+            f['buffer_index'].append(index)
+
+        f['buffer'][n] = data[self.yi, self.xi]
+
+        if len(f['buffer_index']) == self.write_buffer:
+            self.flush(variable)
+
+    def flush(self, variable):
+        """
+        Write the buffered time steps for a variable
+
+        Args:
+            variable: variable name that will index into variable list
+        """
+
+        f = self.variable_list[variable]
+        n = len(f['buffer_index'])
+        if n == 0:
+            return
+
+        index = np.array(f['buffer_index'])
+        if np.all(np.diff(index) == 1):
+            self.nc_file.variables[variable][index[0]:index[0] + n, :] = \
+                f['buffer'][:n]
+        else:
+            for i, idx in enumerate(index):
+                self.nc_file.variables[variable][idx, :] = f['buffer'][i]
+
+        f['buffer_index'] = []
+
+    def close(self):
+        """
+        Write any buffered time steps and close the file
+        """
+
+        if self.nc_file is not None:
+            for v in self.variable_list:
+                self.flush(v)
+            self.nc_file.close()
+            self.nc_file = None
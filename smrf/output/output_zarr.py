@@ -0,0 +1,266 @@
+"""
+Functions to output as a zarr store
+"""
+
+import numpy as np
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from smrf.output.output_netcdf import parse_least_significant_digit
+from smrf.utils import utils
+
+try:
+    import zarr
+    from numcodecs import Blosc, Quantize
+except ImportError:
+    zarr = None
+
+
+class output_zarr():
+    """
+    Class output_zarr() to output values to a zarr store on the local file
+    system, with the same interface as
+    :mod:`~smrf.output.output_netcdf.output_netcdf`.
+
+    Each variable is written to its own store with a time dimension that
+    covers the whole run, so the position of a time step is known without
+    reading the store. Time steps are buffered in memory until a time chunk
+    is full and the whole chunk is then compressed with Blosc and written by
+    a pool of threads. Since every write covers complete chunks that no other
+    write touches, the writes run concurrently without a lock and the
+    compression scales with the number of threads. Blosc only uses its own
+    threads when it is called from the main thread, so each chunk is
+    compressed single threaded by the pool.
+
+    The chunks are compressed with the Blosc zlib codec when ``zlib`` is set
+    and the faster lz4 codec otherwise, at ``complevel`` and with ``shuffle``.
+
+    zarr is an optional dependency and must be installed to use this output.
+    """
+
+    type = 'zarr'
+    fmt = '%Y-%m-%d %H:%M:%S'
+    cs = (6, 10, 10)
+
+    def __init__(self, variable_list, topo, time, outConfig):
+        """
+        Initialize the output_zarr() class
+
+        Args:
+            variable_list: list of dicts, one for each variable
+            topo: loadTopo instance
+            time: configuration from the [time] section
+            outConfig: configuration from the [output] section
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        if zarr is None:
+            raise ImportError('zarr must be installed for file_type = zarr')
+
+        # go through the variable list and make full file names
+        for v in variable_list:
+            variable_list[v]['file_name'] = \
+                variable_list[v]['out_location'] + '.zarr'
+
+        self.variable_list = variable_list
+        self.outConfig = outConfig
+        self.mask = topo.mask
+
+        # the time steps for the whole run
+        self.run_time_step = int(time['time_step'])
+        self.out_frequency = int(outConfig['frequency'])
+        self.start_date = pd.to_datetime(time['start_date'])
+        end_date = pd.to_datetime(time['end_date'])
+        self.time_step = pd.Timedelta(minutes=self.run_time_step)
+        ntimes = int((end_date - self.start_date) / self.time_step) + 1
+        hours = np.arange(ntimes) * self.run_time_step / 60.0
+
+        # chunk shape, which can not be larger than the grid
+        cs = outConfig['chunk_size']
+        if cs is None:
+            cs = self.cs
+        self.cs = (int(cs[0]),
+                   min(int(cs[1]), topo.ny),
+                   min(int(cs[2]), topo.nx))
+
+        # quantize variables to a number of decimal digits, variable:digits
+        lsd = parse_least_significant_digit(
+            outConfig['least_significant_digit'])
+
+        # the NetCDF compression options map to the Blosc codec
+        shuffle = Blosc.SHUFFLE if outConfig['shuffle'] else Blosc.NOSHUFFLE
+        compressor = Blosc(cname='zlib' if outConfig['zlib'] else 'lz4',
+                           clevel=int(outConfig['complevel']),
+                           shuffle=shuffle)
+
+        nthreads = max(int(outConfig['zarr_nthreads']), 1)
+        self.pool = ThreadPoolExecutor(max_workers=nthreads)
+        self.max_pending = 2 * nthreads
+        self.pending = []
+
+        for v in self.variable_list:
+
+            f = self.variable_list[v]
+
+            if os.path.isdir(f['file_name']):
+                self._logger.warning('Opening {}, data may be overwritten!'
+                                     .format(f['file_name']))
+            else:
+                self._logger.debug('Creating %s' % f['file_name'])
+
+            s = zarr.open_group(f['file_name'], mode='a')
+
+            filters = None
+            if v in lsd:
+                filters = [Quantize(digits=lsd[v], dtype='f4')]
+
+            s.require_dataset('time', shape=(ntimes,), dtype='f8',
+                              chunks=(ntimes,), overwrite=False)
+            s['time'][:] = hours
+            s['time'].attrs.update({
+                '_ARRAY_DIMENSIONS': ['time'],
+                'units': 'hours since {}'.format(
+                    self.start_date.strftime(self.fmt)),
+                'calendar': 'standard',
+                'time_zone': time['time_zone'],
+                'long_name': 'time'})
+
+            s.require_dataset('y', shape=(topo.ny,), dtype='f8')
+            s['y'][:] = topo.y
+            s['y'].attrs.update({'_ARRAY_DIMENSIONS': ['y'],
+                                 'units': 'meters',
+                                 'description': 'UTM, north south',
+                                 'long_name': 'y coordinate'})
+
+            s.require_dataset('x', shape=(topo.nx,), dtype='f8')
+            s['x'][:] = topo.x
+            s['x'].attrs.update({'_ARRAY_DIMENSIONS': ['x'],
+                                 'units': 'meters',
+                                 'description': 'UTM, east west',
+                                 'long_name': 'x coordinate'})
+
+            s.require_dataset(v,
+                              shape=(ntimes, topo.ny, topo.nx),
+                              chunks=self.cs,
+                              dtype='f4',
+                              compressor=compressor,
+                              filters=filters,
+                              fill_value=np.nan)
+            s[v].attrs.update({'_ARRAY_DIMENSIONS': ['time', 'y', 'x'],
+                               'module': f['module'],
+                               'units': f['info']['units'],
+                               'long_name': f['info']['long_name']})
+
+            s.attrs.update({
+                'Conventions': 'CF-1.6',
+                'dateCreated': datetime.now().strftime(self.fmt),
+                'title': 'Distirbuted {0} data from SMRF'.format(
+                    f['info']['long_name']),
+                'institution': 'USDA Agricultural Research Service, '
+                               'Northwest Watershed Research Center',
+                'source': 'SMRF {}'.format(utils.getgitinfo())})
+
+            f['zarr'] = s[v]
+
+            # buffer for the time chunk currently being filled
+            f['chunk'] = None
+            f['filled'] = set()
+            f['buffer'] = np.full(self.cs[:1] + (topo.ny, topo.nx),
+                                  np.nan, dtype=np.float32)
+
+    def output(self, variable, data, date_time):
+        """
+        Output a time step, the data is buffered until the time chunk is full
+
+        Args:
+            variable: variable name that will index into variable list
+            data: the variable data
+            date_time: the date time object for the time step
+        """
+
+        self._logger.debug('{0} Writing variable {1} to zarr'
+                           .format(date_time, variable))
+
+        f = self.variable_list[variable]
+
+        index = int(round((pd.to_datetime(date_time.replace(tzinfo=None)) -
+                           self.start_date) / self.time_step))
+        if index < 0 or index >= f['zarr'].shape[0]:
+            raise ValueError('{} is outside of the output time range'
+                             .format(date_time))
+
+        chunk = index // self.cs[0]
+        if f['chunk'] is not None and chunk != f['chunk']:
+            self.flush(variable)
+        f['chunk'] = chunk
+
+        n = index % self.cs[0]
+        if self.outConfig['mask']:
+            f['buffer'][n] = data*self.mask
+        else:
+            f['buffer'][n] = data
+        f['filled'].add(n)
+
+        if len(f['filled']) == self.cs[0]:
+            self.flush(variable)
+
+    def flush(self, variable):
+        """
+        Hand the buffered time chunk to the thread pool to be compressed and
+        written
+
+        Args:
+            variable: variable name that will index into variable list
+        """
+
+        f = self.variable_list[variable]
+        if f['chunk'] is None or len(f['filled']) == 0:
+            return
+
+        start = f['chunk'] * self.cs[0]
+        end = min(start + self.cs[0], f['zarr'].shape[0])
+        buf = f['buffer']
+
+        if len(f['filled']) == end - start:
+            # whole chunk, no other write touches it
+            self.pending.append(self.pool.submit(self._write, f['zarr'],
+                                                 start, buf[:end - start]))
+        else:
+            # partial chunk, only write the time steps that were output once
+            # any earlier write of the chunk has finished
+            for p in self.pending:
+                p.result()
+            self.pending = []
+            for n in sorted(f['filled']):
+                f['zarr'][start + n] = buf[n]
+
+        # the pool owns the old buffer until it is written
+        f['buffer'] = np.full_like(buf, np.nan)
+        f['filled'] = set()
+        f['chunk'] = None
+
+        # limit the number of chunks waiting to be written
+        while len(self.pending) > self.max_pending:
+            self.pending.pop(0).result()
+
+    def _write(self, arr, start, data):
+        arr[start:start + data.shape[0]] = data
+
+    def close(self):
+        """
+        Write any buffered time steps and wait for the writes to finish
+        """
+
+        for v in self.variable_list:
+            self.flush(v)
+
+        for p in self.pending:
+            p.result()
+        self.pending = []
+
+        self.pool.shutdown(wait=True)
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
 from . import idw
 from . import grid
+from . import regrid
 from .dk import dk
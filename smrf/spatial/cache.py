@@ -0,0 +1,148 @@
+"""
+Least recently used cache for the interpolation weights of each pattern of
+stations with data
+"""
+
+import hashlib
+import logging
+import numpy as np
+import os
+import tempfile
+from collections import OrderedDict
+
+
+class WeightCache():
+    """
+    Least recently used cache of the weights for each pattern of stations
+    with data, limited to ``cache_size`` MB. The weights can also be saved to
+    ``directory`` so that they are reused in a later run, the file names are a
+    hash of the ``geometry`` and the station pattern so weights from a
+    different domain or set of stations are never used.
+    """
+
+    def __init__(self, cache_size=512, directory=None, geometry=None,
+                 name='weights'):
+        """
+        Args:
+            cache_size: memory limit in MB for the cached weights
+            directory: directory to save the weights to, None to only keep
+                the weights in memory
+            geometry: list of arrays that the weights depend on, used to name
+                the saved weights
+            name: prefix for the saved weight files
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self.cache = OrderedDict()
+        self.cache_size = cache_size * 1024**2
+        self.nbytes = 0
+
+        self.directory = directory
+        self.name = name
+        self.geometry = hashlib.sha1()
+        if geometry is not None:
+            for g in geometry:
+                self.geometry.update(np.ascontiguousarray(g).tobytes())
+
+        if self.directory is not None and not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def __len__(self):
+        return len(self.cache)
+
+    @staticmethod
+    def size(w):
+        """
+        Memory used by the weights, either an array or a tuple of arrays
+        """
+
+        if isinstance(w, tuple):
+            return sum([getattr(a, 'nbytes', 0) for a in w])
+        return w.nbytes
+
+    def file_name(self, key):
+        """
+        File name of the saved weights for a station pattern
+        """
+
+        h = self.geometry.copy()
+        h.update(key)
+        return os.path.join(self.directory,
+                            '{}_{}.npz'.format(self.name, h.hexdigest()))
+
+    def get(self, nan_val):
+        """
+        Get the weights for a station pattern from memory or from the saved
+        weights
+
+        Args:
+            nan_val: boolean array of the station pattern
+
+        Returns:
+            the weights or None if they have not been calculated
+        """
+
+        key = nan_val.tobytes()
+        w = self.cache.get(key)
+        if w is not None:
+            self.cache.move_to_end(key)
+            return w
+
+        if self.directory is not None:
+            fname = self.file_name(key)
+            if os.path.isfile(fname):
+                self._logger.debug('Loading weights from {}'.format(fname))
+                with np.load(fname) as f:
+                    w = [f['arr_{}'.format(i)] for i in range(len(f.files))]
+                w = w[0] if len(w) == 1 else tuple(w)
+                self.add(key, w)
+
+        return w
+
+    def put(self, nan_val, w):
+        """
+        Add the weights for a station pattern to the cache and save them if
+        there is a directory
+
+        Args:
+            nan_val: boolean array of the station pattern
+            w: the weights, an array or tuple of arrays
+        """
+
+        key = nan_val.tobytes()
+        self.add(key, w)
+
+        if self.directory is not None:
+            fname = self.file_name(key)
+            self._logger.debug('Saving weights to {}'.format(fname))
+
+            # write to a unique temporary file so a partial file is never
+            # read and concurrent runs don't write to the same file
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.npz')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    if isinstance(w, tuple):
+                        np.savez(f, *w)
+                    else:
+                        np.savez(f, w)
+                os.replace(tmp, fname)
+            except BaseException:
+                os.remove(tmp)
+                raise
+
+    def add(self, key, w):
+        """
+        Add the weights to the memory cache, removing the least recently
+        used weights to stay under the memory limit
+        """
+
+        nbytes = self.size(w)
+
+        while self.cache and self.nbytes + nbytes > self.cache_size:
+            _, old = self.cache.popitem(last=False)
+            self.nbytes -= self.size(old)
+
+        if nbytes <= self.cache_size:
+            self.cache[key] = w
+            self.nbytes += nbytes
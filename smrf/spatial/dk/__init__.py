@@ -1,3 +1,2 @@
 # -*- coding: utf-8 -*-
 from . import dk
-from . import detrended_kriging
@@ -5,16 +5,27 @@ Distributed forcing data over a grid using detrended kriging
 """
 
 import numpy as np
-from . import detrended_kriging
 import logging
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from scipy.linalg import lu_factor, lu_solve
+
+from smrf.spatial.cache import WeightCache
+from smrf.spatial.trend import elevation_trend
 
 
 class DK:
     """
     Detrended kriging class
+
+    The kriging weights for each pattern of stations with data are kept in
+    a least recently used cache limited to ``dk_cache_size`` MB and are saved
+    to ``dk_cache_dir`` to be reused in later runs if it is set.
     """
 
+    # number of grid cells solved together
+    block_size = 65536
+
     def __init__(self, mx, my, mz, GridX, GridY, GridZ, config):
 
         """
@@ -58,13 +69,20 @@ class DK:
 
         self._logger = logging.getLogger(__name__)
 
-    def calculate(self, data):
+        # kriging weights for each station pattern
+        self.cache = WeightCache(config['dk_cache_size'],
+                                 config['dk_cache_dir'],
+                                 geometry=[mx, my, mz, GridX, GridY],
+                                 name='dk')
+
+    def calculate(self, data, pv=None):
         """
         Calcluate the deternded kriging for the data and config
 
         Arg:
             data: numpy array same length as m*
             config: configuration for dk
+            pv: slope and intercept of the trend, calculated if None
 
         Returns:
             v: returns the distributed and calculated value
@@ -72,19 +90,11 @@ class DK:
 
         nan_val = pd.isnull(data)
 
-        # only calcualte if the stations involved have changed
-        # if np.sum(np.array_equal(nan_val,self.nan_val)) != len(self.mx):
-        if not np.array_equal(nan_val, self.nan_val):
-
-            self.nan_val = nan_val
-            nsta = np.sum(~nan_val)
-            self._logger.debug('''Recalculating detrended kriging weights
-                                for {} stations ...'''.format(nsta))
-
-            self.calculateWeights()
+        # only change the weights if the stations involved have changed
+        self.setWeights(nan_val)
 
         # now calculate the trend and the residuals
-        self.detrendData(data)
+        self.detrendData(data, pv)
 
         # distribute the risduals
         r = np.nansum(self.weights * self.residuals, 2)
@@ -156,63 +166,192 @@ class DK:
 
         return v
 
+    def calculateBlock(self, data, pv=None):
+        """
+        Calculate the detrended kriging for a block of time steps that have the
+        same stations with data as a single matrix multiply
+
+        Arg:
+            data: (nsta, T) array of the data at the stations
+            pv: (T, 2) array of the slope and intercept for each time step,
+                calculated from the data if not given
+
+        Returns:
+            v: (T, ny, nx) array of the distributed values
+        """
+
+        nan_val = np.isnan(data[:, 0])
+        self.setWeights(nan_val)
+
+        # trend and residuals for all the time steps
+        d = data[~nan_val]
+        if pv is None:
+            pv = elevation_trend(self.mz, data, self.config['slope'])
+        residuals = d - (np.outer(self.mz[~nan_val], pv[:, 0]) + pv[:, 1])
+
+        # distribute the residuals
+        w = self.weights.reshape((-1, self.weights.shape[2]))
+        v = np.dot(w, residuals).T.reshape((data.shape[1],) +
+                                           self.GridX.shape)
+
+        # retrend the residuals
+        v += pv[:, 0, np.newaxis, np.newaxis] * self.GridZ
+        v += pv[:, 1, np.newaxis, np.newaxis]
+        self.pv = pv[-1]
+
+        return v
+
+    def setWeights(self, nan_val):
+        """
+        Set the weights for the stations with data, from the cache if the
+        same stations have been used before
+
+        Args:
+            nan_val: boolean array of the stations without data
+        """
+
+        if np.array_equal(nan_val, self.nan_val):
+            return
+
+        self.nan_val = nan_val
+        self.weights = self.cache.get(nan_val)
+
+        if self.weights is None:
+            nsta = np.sum(~nan_val)
+            self._logger.debug('''Recalculating detrended kriging weights
+                                for {} stations ...'''.format(nsta))
+
+            self.calculateWeights()
+            self.cache.put(nan_val, self.weights)
+
     def calculateWeights(self):
         """
         Calculate the weights given those stations with nan values for data
+
+        The station matrix is the same for every grid cell, so it is factored
+        once and all the grid cells are solved together. Cells with negative
+        weights have the highest station with a negative weight removed and
+        are solved again, grouped by the stations that are left, until all
+        the weights are positive. The grid cells are split into blocks that
+        are solved on ``dk_nthreads`` threads.
         """
 
         nsta = np.sum(~self.nan_val)
         mx = self.mx[~self.nan_val]
         my = self.my[~self.nan_val]
-        mz = self.mz[~self.nan_val]
+        mz = self.mz[~self.nan_val].astype(np.double)
 
         # calculate the distances between stations
-        ad = np.zeros((nsta, nsta))
-        for i in range(nsta):
-            ad[i, i] = 0
-            for j in range(i+1, nsta):
-                ad[i, j] = np.sqrt((mx[i] - mx[j])**2 + (my[i] - my[j])**2)
-                ad[j, i] = np.sqrt((mx[i] - mx[j])**2 + (my[i] - my[j])**2)
-
-        self.ad = ad
+        self.ad = np.sqrt((mx[:, np.newaxis] - mx)**2 +
+                          (my[:, np.newaxis] - my)**2)
 
         # calculate the distances from the grid to the station
-        dgrid = np.zeros((self.ngrid, nsta))
         Xa = self.GridX.ravel()
         Ya = self.GridY.ravel()
-        for i in range(nsta):
-            dgrid[:, i] = np.sqrt((Xa - mx[i])**2 + (Ya - my[i])**2)
-
-        self.dgrid = dgrid
-
-        # calculate the weights
-        wg = np.zeros_like(dgrid)
-        detrended_kriging.call_grid(self.ad, self.dgrid, mz.astype(np.double),
-                                    wg, self.config['dk_nthreads'])
+        self.dgrid = np.sqrt((Xa[:, np.newaxis] - mx)**2 +
+                             (Ya[:, np.newaxis] - my)**2)
 
-        # reshape the weights
+        # the weights are written directly into the grid layout
         self.weights = np.zeros((self.GridX.shape[0],
                                  self.GridX.shape[1],
                                  nsta))
-        for v in range(nsta):
-            self.weights[:, :, v] = wg[:, v].reshape(self.GridX.shape)
+        wg = self.weights.reshape((self.ngrid, nsta))
+
+        nthreads = max(int(self.config['dk_nthreads']), 1)
+        blocks = np.array_split(np.arange(self.ngrid),
+                                max(nthreads, self.ngrid // self.block_size))
+
+        def solve_block(idx):
+            wg[idx[0]:idx[-1] + 1] = self.solveCells(self.ad,
+                                                     self.dgrid[idx],
+                                                     mz)
+
+        blocks = [b for b in blocks if len(b) > 0]
+        if nthreads == 1:
+            for b in blocks:
+                solve_block(b)
+        else:
+            with ThreadPoolExecutor(max_workers=nthreads) as executor:
+                list(executor.map(solve_block, blocks))
+
+    @staticmethod
+    def solveCells(ad, dgrid, elevations):
+        """
+        Solve the kriging system for a block of grid cells
+
+        Args:
+            ad: [nsta x nsta] matrix of distances between stations
+            dgrid: [ncells x nsta] matrix of distances between the grid cells
+                and stations
+            elevations: [nsta] array of station elevations
+
+        Returns:
+            [ncells x nsta] matrix of kriging weights
+        """
+
+        ncells, nsta = dgrid.shape
+        w = np.zeros((ncells, nsta))
+
+        # cells that use the same stations share the factorization, start
+        # with all the stations for all the cells. Removing a station makes
+        # a group with one less station, so all the cells that end up with
+        # the same stations are found before that group is solved
+        groups = {np.ones(nsta, dtype=bool).tobytes(): [np.arange(ncells)]}
+
+        for ns in range(nsta, 0, -1):
+            smaller = {}
+
+            for key, cells in groups.items():
+                use = np.frombuffer(key, dtype=bool)
+                sidx = np.flatnonzero(use)
+                cells = np.concatenate(cells)
+
+                a = np.ones((ns + 1, ns + 1))
+                a[:ns, :ns] = ad[np.ix_(sidx, sidx)]
+                a[ns, ns] = 0
+
+                b = np.ones((ns + 1, len(cells)))
+                b[:ns] = dgrid[np.ix_(cells, sidx)].T
+
+                wcalc = lu_solve(lu_factor(a), b)[:ns].T
+
+                # throw out the highest station with a negative weight
+                negative = np.where(wcalc < 0, elevations[sidx], 0)
+                msave = np.argmax(negative, axis=1)
+                remove = negative[np.arange(len(cells)), msave] > 0
+
+                w[np.ix_(cells[~remove], sidx)] = wcalc[~remove]
+
+                # solve again without the station that was thrown out
+                sta = sidx[msave[remove]]
+                for m in np.unique(sta):
+                    u = use.copy()
+                    u[m] = False
+                    smaller.setdefault(u.tobytes(), []).append(
+                        cells[remove][sta == m])
+
+            groups = smaller
+
+        return w
 
-    def detrendData(self, data):
+    def detrendData(self, data, pv=None):
         """
         Detrend the data in val using the heights zmeas
         data    - is the same size at mx,my
         flag     - 1 for positive, -1 for negative, 0 for any trend imposed
+        pv      - slope and intercept of the trend, calculated if None
         """
 
-        # calculate the trend on any real data
-        if self.config['regression_method'] == 1:
-            pv = np.polyfit(self.mz[~self.nan_val], data[~self.nan_val], 1)
+        if pv is None:
+            # calculate the trend on any real data
+            if self.config['regression_method'] == 1:
+                pv = np.polyfit(self.mz[~self.nan_val], data[~self.nan_val], 1)
 
-        # apply trend constraints
-        if self.config['slope'] == 1 and pv[0] < 0:
-            pv = np.array([0, 0])
-        elif (self.config['slope'] == -1 and pv[0] > 0):
-            pv = np.array([0, 0])
+            # apply trend constraints
+            if self.config['slope'] == 1 and pv[0] < 0:
+                pv = np.array([0, 0])
+            elif (self.config['slope'] == -1 and pv[0] > 0):
+                pv = np.array([0, 0])
 
         self.pv = pv
 
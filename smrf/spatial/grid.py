@@ -4,17 +4,30 @@
 Distributed forcing data over a grid using interpolation
 '''
 
+import logging
 import numpy as np
-from scipy.interpolate import griddata
+from scipy.interpolate import CloughTocher2DInterpolator
+from scipy.spatial import cKDTree, Delaunay
+
+from smrf.spatial.cache import WeightCache
+from smrf.utils import utils
 
 
 class GRID:
     '''
-    Inverse distance weighting class
-    - Standard IDW
-    - Detrended IDW
+    Gridded interpolation class
+    - Standard interpolation
+    - Detrended interpolation
+
+    The interpolation follows scipy.interpolate.griddata but the Delaunay
+    triangulation, the vertices and barycentric weights of each grid cell
+    (or the nearest point) are found once for each pattern of points with
+    data and cached, so each time step is a gather of the point values. The
+    cubic method only caches the triangulation, which is given to
+    scipy.interpolate.CloughTocher2DInterpolator each time step.
     '''
-    def __init__(self, config, mx, my, GridX, GridY, mz=None, GridZ=None, mask=None):
+    def __init__(self, config, mx, my, GridX, GridY, mz=None, GridZ=None,
+                 mask=None, x=None, y=None, cache_size=512):
 
         """
         Args:
@@ -27,9 +40,16 @@ class GRID:
             GridZ: z locations in grid to interpolate over
             mask: mask for those points to include in the detrending
                 will be ignored if config['mask'] is false
+            x: x position vector of the mask, from GridX if None
+            y: y position vector of the mask, from GridY if None. The mask
+                is given on the full grid with x and y when only the active
+                cells are distributed
+            cache_size: memory limit in MB for the cached weights of each
+                grid_method
         """
 
         self.config = config
+        self._logger = logging.getLogger(__name__)
 
         # measurement point locations
         self.mx = mx
@@ -46,11 +66,14 @@ class GRID:
         self.mask = np.zeros_like(self.mx, dtype=bool)
         if config['mask']:
 
-            assert(mask.shape == GridX.shape)
+            if x is None:
+                x = GridX[0, :]
+            if y is None:
+                y = GridY[:, 0]
+
+            assert(mask.shape == (len(y), len(x)))
             mask = mask.astype(bool)
 
-            x = GridX[0, :]
-            y = GridY[:, 0]
             for i, v in enumerate(mx):
                 xi = np.argmin(np.abs(x - mx[i]))
                 yi = np.argmin(np.abs(y - my[i]))
@@ -59,23 +82,32 @@ class GRID:
         else:
             self.mask = np.ones_like(self.mx, dtype=bool)
 
-    def detrendedInterpolation(self, data, flag=0, grid_method='linear'):
+        # the vertices and weights for each method and station pattern
+        self.cells = np.column_stack((GridX.ravel(), GridY.ravel()))
+        self.cache_size = cache_size
+        self.cache = {}
+
+    def detrendedInterpolation(self, data, flag=0, grid_method='linear',
+                               pv=None):
         """
         Interpolate using a detrended approach
 
         Args:
             data: data to interpolate
             grid_method: scipy.interpolate.griddata interpolation method
+            pv: slope and intercept of the trend, calculated if None
         """
 
-        # get the trend, ensure it's positive
-        pv = np.polyfit(self.mz[self.mask].astype(float), data[self.mask], 1)
+        if pv is None:
+            # get the trend, ensure it's positive
+            pv = np.polyfit(self.mz[self.mask].astype(float),
+                            data[self.mask], 1)
 
-        # apply trend constraints
-        if flag == 1 and pv[0] < 0:
-            pv = np.array([0, 0])
-        elif (flag == -1 and pv[0] > 0):
-            pv = np.array([0, 0])
+            # apply trend constraints
+            if flag == 1 and pv[0] < 0:
+                pv = np.array([0, 0])
+            elif (flag == -1 and pv[0] > 0):
+                pv = np.array([0, 0])
 
         self.pv = pv
 
@@ -84,10 +116,7 @@ class GRID:
         dtrend = data - el_trend
 
         # interpolate over the DEM grid
-        idtrend = griddata((self.mx, self.my),
-                           dtrend,
-                           (self.GridX, self.GridY),
-                           method=grid_method)
+        idtrend = self.calculateInterpolation(dtrend, grid_method)
 
         # retrend the data
         rtrend = idtrend + pv[0]*self.GridZ + pv[1]
@@ -162,15 +191,68 @@ class GRID:
 
         Args:
             data: data to interpolate
-            mx: x locations for the points
-            my: y locations for the points
-            X: x locations in grid to interpolate over
-            Y: y locations in grid to interpolate over
+            grid_method: scipy.interpolate.griddata interpolation method
+        """
+
+        nan_val = ~np.isnan(data)
+        w = self.patternWeights(nan_val, grid_method)
+        values = data[nan_val]
+
+        if grid_method == 'nearest':
+            g = values[w[0]]
+
+        elif grid_method == 'linear':
+            g = utils.grid_interpolate(values, w[0], w[1],
+                                       self.GridX.shape)
+
+        elif grid_method == 'cubic':
+            # the triangulation is reused for the gradients and the cubic
+            g = CloughTocher2DInterpolator(w[0], values)(self.cells)
+
+        else:
+            raise ValueError('Unknown grid_method {}'.format(grid_method))
+
+        return g.reshape(self.GridX.shape)
+
+    def patternWeights(self, nan_val, grid_method):
+        """
+        Find the interpolation weights for the points with data, taken from
+        the cache if the same points have been used before
+
+        Args:
+            nan_val: boolean array of the points with data
+            grid_method: scipy.interpolate.griddata interpolation method
+
+        Returns:
+            tuple of the arrays needed by the interpolation method
         """
 
-        g = griddata((self.mx, self.my),
-                     data,
-                     (self.GridX, self.GridY),
-                     method=grid_method)
+        if grid_method not in self.cache:
+            self.cache[grid_method] = WeightCache(self.cache_size)
+        cache = self.cache[grid_method]
+
+        w = cache.get(nan_val)
+        if w is not None:
+            return w
+
+        self._logger.debug('Calculating {} interpolation weights for {} '
+                           'points'.format(grid_method, np.sum(nan_val)))
+
+        xy = np.column_stack((self.mx[nan_val], self.my[nan_val]))
+
+        if grid_method == 'nearest':
+            _, idx = cKDTree(xy).query(self.cells)
+            w = (idx,)
+
+        elif grid_method == 'linear':
+            w = utils.interp_weights(xy, self.cells)
+
+        elif grid_method == 'cubic':
+            w = (Delaunay(xy),)
+
+        else:
+            raise ValueError('Unknown grid_method {}'.format(grid_method))
+
+        cache.put(nan_val, w)
 
-        return g
+        return w
@@ -6,7 +6,13 @@ updated 2015-12-31 Scott Havens
 Distributed forcing data over a grid using different methods
 '''
 
+import logging
 import numpy as np
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+from smrf.spatial.cache import WeightCache
+from smrf.spatial.trend import elevation_trend
 
 
 class IDW:
@@ -17,10 +23,14 @@ class IDW:
     * Standard IDW
     * Detrended IDW
 
+    The normalized weights for each pattern of available stations are
+    cached in a least recently used cache limited to ``cache_size`` MB, so
+    each time step is a single weighted sum over the stations.
+
     '''
 
     def __init__(self, mx, my, GridX, GridY, mz=None, GridZ=None,
-                 power=2, zeroVal=-1):
+                 power=2, zeroVal=-1, cache_size=512):
 
         """
         Args:
@@ -32,8 +42,11 @@ class IDW:
             GridZ: Elevation values for the points to interpolate over for
                    trended data
             power: power of the inverse distance weighting
+            cache_size: memory limit in MB for the cached normalized weights
         """
 
+        self._logger = logging.getLogger(__name__)
+
         # measurement point locations
         self.mx = mx
         self.my = my
@@ -53,6 +66,9 @@ class IDW:
         self.power = power
         self.zeroVal = zeroVal
 
+        # normalized weights for each station pattern
+        self.cache = WeightCache(cache_size)
+
         # calculate the distances
         self.calculateDistances()
 
@@ -89,6 +105,45 @@ class IDW:
         # if there are Inf values, set to 1 as the distance was 0
         # self.weights[np.isinf(self.weights)] = 100
 
+    def normalizedWeights(self, nan_val):
+        '''
+        Normalized weights for the stations with data, taken from the cache
+        if the same stations have been used before
+
+        Args:
+            nan_val: boolean array of the stations with data
+
+        Returns:
+            array of the weights for the stations with data that sum to one
+            for each grid cell
+        '''
+
+        w = self.cache.get(nan_val)
+        if w is not None:
+            return w
+
+        w = self.patternWeights(nan_val)
+        self.cache.put(nan_val, w)
+        self._logger.debug('Calculated IDW weights for {} of {} stations, '
+                           '{} patterns cached'.format(np.sum(nan_val),
+                                                       self.npoints,
+                                                       len(self.cache)))
+
+        return w
+
+    def patternWeights(self, nan_val):
+        '''
+        Calculate the normalized weights for the stations with data
+
+        Args:
+            nan_val: boolean array of the stations with data
+        '''
+
+        w = self.weights[:, :, nan_val]
+        w /= np.sum(w, 2)[:, :, np.newaxis]
+
+        return w
+
     def calculateIDW(self, data, local=False):
         '''
         Calculate the IDW of the data at mx,my over GridX,GridY
@@ -96,21 +151,64 @@ class IDW:
         data    - is the same size at mx,my
         '''
         nan_val = ~np.isnan(data)
-        w = self.weights[:, :, nan_val]
-        data = data[nan_val]
+        w = self.normalizedWeights(nan_val)
+
+        return np.dot(w, data[nan_val])
+
+    def calculateIDWBlock(self, data):
+        '''
+        Calculate the IDW for a block of time steps that have the same
+        stations with data as a single matrix multiply
 
-        v = np.nansum(w * data, 2) / np.sum(w, 2)
+        Args:
+            data: (npoints, T) array of the data at mx,my
+
+        Returns:
+            (T, ny, nx) array of the distributed data
+        '''
+        nan_val = ~np.isnan(data[:, 0])
+        w = self.normalizedWeights(nan_val)
+
+        v = np.dot(w.reshape((-1, w.shape[2])), data[nan_val])
+
+        return v.T.reshape((data.shape[1],) + self.GridX.shape)
+
+    def detrendedIDWBlock(self, data, flag=0, pv=None):
+        '''
+        Calculate the detrended IDW for a block of time steps that have the
+        same stations with data
+
+        Args:
+            data: (npoints, T) array of the data at mx,my
+            flag: 1 for positive, -1 for negative, 0 for any trend imposed
+            pv: (T, 2) array of the slope and intercept for each time step,
+                calculated from the data if not given
+
+        Returns:
+            (T, ny, nx) array of the distributed data
+        '''
+        if pv is None:
+            pv = elevation_trend(self.mz, data, flag)
+
+        dtrend = data - (np.outer(self.mz, pv[:, 0]) + pv[:, 1])
+        v = self.calculateIDWBlock(dtrend)
+
+        # retrend the data
+        v += pv[:, 0, np.newaxis, np.newaxis] * self.GridZ
+        v += pv[:, 1, np.newaxis, np.newaxis]
+        self.pv = pv[-1]
 
         return v
 
-    def detrendedIDW(self, data, flag=0, zeros=None, local=False):
+    def detrendedIDW(self, data, flag=0, zeros=None, local=False, pv=None):
         '''
         Calculate the detrended IDW of the data at mx,my over GridX,GridY
         Inputs:
         data    - is the same size at mx,my
+        pv      - slope and intercept of the trend, calculated if None
         '''
 
-        self.detrendData(data, flag, zeros)
+        self.detrendData(data, flag, zeros, pv)
         v = self.calculateIDW(self.dtrend, local)
 #         vtmp = v.copy()
         v = self.retrendData(v)
@@ -119,22 +217,24 @@ class IDW:
             v[v < 0] = 0
         return v
 
-    def detrendData(self, data, flag=0, zeros=None):
+    def detrendData(self, data, flag=0, zeros=None, pv=None):
         '''
         Detrend the data in val using the heights zmeas
         data    - is the same size at mx,my
         flag     - 1 for positive, -1 for negative, 0 for any trend imposed
+        pv      - slope and intercept of the trend, calculated if None
         '''
 
-        # calculate the trend on any real data
-        nan_val = np.isnan(data)
-        pv = np.polyfit(self.mz[~nan_val], data[~nan_val], 1)
+        if pv is None:
+            # calculate the trend on any real data
+            nan_val = np.isnan(data)
+            pv = np.polyfit(self.mz[~nan_val], data[~nan_val], 1)
 
-        # apply trend constraints
-        if flag == 1 and pv[0] < 0:
-            pv = np.array([0, 0])
-        elif (flag == -1 and pv[0] > 0):
-            pv = np.array([0, 0])
+            # apply trend constraints
+            if flag == 1 and pv[0] < 0:
+                pv = np.array([0, 0])
+            elif (flag == -1 and pv[0] > 0):
+                pv = np.array([0, 0])
 
         self.pv = pv
 
@@ -152,3 +252,148 @@ class IDW:
 
         # retrend the data
         return idw + self.pv[0]*self.GridZ + self.pv[1]
+
+
+class KNNIDW(IDW):
+    '''
+    Inverse distance weighting using only the ``k`` nearest stations, or the
+    stations within ``radius``, of each grid cell. The stations are found
+    with a KD-tree and only an (ncells, k) index and float32 weight pair is
+    kept, instead of the (ny, nx, npoints) distance and weight cubes of
+    :mod:`smrf.spatial.idw.IDW`, so many stations can be used on large
+    grids.
+
+    '''
+
+    def __init__(self, mx, my, GridX, GridY, mz=None, GridZ=None,
+                 power=2, zeroVal=-1, cache_size=512, k=8, radius=None):
+        """
+        Args:
+            mx: x locations for the points
+            my: y locations for the points
+            GridX: x locations in grid to interpolate over
+            GridY: y locations in grid to interpolate over
+            mz: elevation for the points
+            GridZ: Elevation values for the points to interpolate over for
+                   trended data
+            power: power of the inverse distance weighting
+            cache_size: memory limit in MB for the cached normalized weights
+            k: number of nearest stations to use for each grid cell
+            radius: only use the stations within the radius of a grid cell,
+                cells without a station in the radius use the nearest station
+        """
+
+        self.k = int(k)
+        self.radius = radius
+        self.cells = np.column_stack((GridX.ravel(), GridY.ravel()))
+
+        IDW.__init__(self, mx, my, GridX, GridY, mz=mz, GridZ=GridZ,
+                     power=power, zeroVal=zeroVal, cache_size=cache_size)
+
+    def calculateDistances(self):
+        '''
+        The distances are found for each pattern of stations in
+        :mod:`smrf.spatial.idw.KNNIDW.patternWeights`
+        '''
+
+        self.distance = None
+
+    def calculateWeights(self):
+        '''
+        The weights are found for each pattern of stations in
+        :mod:`smrf.spatial.idw.KNNIDW.patternWeights`
+        '''
+
+        self.weights = None
+
+    def patternWeights(self, nan_val):
+        '''
+        Find the nearest stations with data for each grid cell and calculate
+        their normalized weights
+
+        Args:
+            nan_val: boolean array of the stations with data
+
+        Returns:
+            tuple of the (ncells, k) station index into the stations with data
+            and the (ncells, k) float32 weights
+        '''
+
+        npoints = np.sum(nan_val)
+        k = min(self.k, npoints)
+
+        tree = cKDTree(np.column_stack((self.mx[nan_val], self.my[nan_val])))
+
+        if self.radius is None:
+            d, idx = tree.query(self.cells, k=k)
+        else:
+            d, idx = tree.query(self.cells, k=k,
+                                distance_upper_bound=self.radius)
+
+            # use the nearest station for cells with none in the radius
+            empty = np.isinf(d[:, 0]) if k > 1 else np.isinf(d)
+            if np.any(empty):
+                self._logger.debug('{} grid cells have no stations within '
+                                   '{}, using the nearest station'
+                                   .format(np.sum(empty), self.radius))
+                de, ie = tree.query(self.cells[empty], k=1)
+                if k > 1:
+                    d[empty, 0] = de
+                    idx[empty, 0] = ie
+                else:
+                    d[empty] = de
+                    idx[empty] = ie
+
+        d = d.reshape((self.cells.shape[0], k))
+        idx = idx.reshape((self.cells.shape[0], k))
+
+        # missing neighbours from the radius search have no weight
+        missing = np.isinf(d)
+        idx[missing] = 0
+
+        # remove any zero values
+        if np.any(d == 0):
+            pos = d[(d > 0) & ~missing]
+            d[d == 0] = np.min(pos) if pos.size else 1.0
+
+        w = np.zeros(d.shape, dtype=np.float32)
+        w[~missing] = 1.0/np.power(d[~missing], self.power)
+        w /= np.sum(w, 1)[:, np.newaxis]
+
+        return idx.astype(np.int32), w
+
+    def calculateIDW(self, data, local=False):
+        '''
+        Calculate the IDW of the data at mx,my over GridX,GridY
+        Inputs:
+        data    - is the same size at mx,my
+        '''
+        nan_val = ~np.isnan(data)
+        idx, w = self.normalizedWeights(nan_val)
+
+        v = np.sum(w * data[nan_val][idx], 1)
+
+        return v.reshape(self.GridX.shape)
+
+    def calculateIDWBlock(self, data):
+        '''
+        Calculate the IDW for a block of time steps that have the same
+        stations with data as a single sparse matrix multiply
+
+        Args:
+            data: (npoints, T) array of the data at mx,my
+
+        Returns:
+            (T, ny, nx) array of the distributed data
+        '''
+        nan_val = ~np.isnan(data[:, 0])
+        idx, w = self.normalizedWeights(nan_val)
+
+        ncells, k = idx.shape
+        W = sparse.csr_matrix((w.ravel(), idx.ravel(),
+                               np.arange(0, ncells*k + 1, k)),
+                              shape=(ncells, np.sum(nan_val)))
+
+        v = W.dot(data[nan_val])
+
+        return v.T.reshape((data.shape[1],) + self.GridX.shape)
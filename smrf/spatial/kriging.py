@@ -1,14 +1,32 @@
 
+import logging
 import numpy as np
 import pandas as pd
 from pykrige.ok import OrdinaryKriging
+from scipy.linalg import inv
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist
+
+from smrf.spatial.cache import WeightCache
 
 class KRIGE:
     '''
     Kriging class based on the pykrige package
+
+    The variogram is fit with pykrige either every time step, once a day or
+    once for the run (``krig_variogram_fit``), or is fixed with
+    ``variogram_parameters``. While the variogram is the same, the kriging
+    weights of each grid cell for each pattern of stations with data are
+    cached, so each time step is a weighted sum of the station values. With
+    ``krig_n_closest_points`` only the closest stations to each grid cell,
+    found with a KD-tree, are used in the kriging system for that cell.
     '''
 
-    def __init__(self, mx, my, mz, GridX, GridY, GridZ, config):
+    # number of grid cells solved together
+    block_size = 65536
+
+    def __init__(self, mx, my, mz, GridX, GridY, GridZ, config,
+                 variance=False):
 
         """
         Args:
@@ -17,8 +35,11 @@ class KRIGE:
             GridX: x locations in grid to interpolate over
             GridY: y locations in grid to interpolate over
             power: power of the inverse distance weighting
+            variance: calculate the kriging variance
         """
 
+        self._logger = logging.getLogger(__name__)
+
         # Measurement point locations
         self.mx = mx
         self.my = my
@@ -39,7 +60,7 @@ class KRIGE:
 
         # kriging parameters for pykrige
         self.variogram_model = self.config['variogram_model'] #'linear'
-        self.variogram_parameters = None
+        self.variogram_parameters = self.config['variogram_parameters']
         self.variogram_function = None
         self.nlags = self.config['nlags']#np.min([np.round(len(mx)/2), 6])
         self.weight = self.config['krig_weight']
@@ -52,32 +73,106 @@ class KRIGE:
 
         # pykrige execution
         self.backend = 'vectorized'
-        self.n_closest_points = None
+        self.n_closest_points = self.config['krig_n_closest_points']
+        self.variance = variance
 
-    def calculate(self, data):
+        # the fitted variogram and when it was fit
+        self.variogram_fit = self.config['krig_variogram_fit']
+        if self.variogram_parameters is not None:
+            self.variogram_fit = 'once'
+        self.fit_key = None
+        self.model_function = None
+        self.model_parameters = None
+
+        # grid cells in the coordinates adjusted for anisotropy
+        self.cells = self.adjust(GridX.ravel(), GridY.ravel())
+        self.cache = WeightCache()
+
+    def calculate(self, data, date_time=None, pv=None):
         """
-        Estimate the variogram, calculate the model, then apply to the grid
+        Fit the variogram if needed, calculate the kriging weights if the
+        stations have changed, then apply to the grid
 
         Arg:
             data: numpy array same length as m*
-            config: configuration for dk
+            date_time: the date time of the time step, used to refit the
+                variogram each day
+            pv: slope and intercept of the trend, calculated if None
 
         Returns:
             v: Z-values of specified grid or at thespecified set of points.
-               If style was specified as 'masked', zvalues will
-               be a numpy masked array.
-            sigmasq: Variance at specified grid points or
-                     at the specified set of points. If style was specified as
-                     'masked', sigmasq will be a numpy masked array.
+            sigmasq: Variance at specified grid points, None if the variance
+                is not calculated
         """
 
         nan_val = pd.isnull(data)
 
         if self.config['detrend']:
-            d = self.detrendData(data)
+            d = self.detrendData(data, pv=pv)
         else:
             d = data.copy()
 
+        self.fitVariogram(d, nan_val, date_time)
+        w = self.krigingWeights(~nan_val)
+
+        z = d[~nan_val]
+        if len(w) == 3:
+            idx, lam, ss1 = w
+            v = np.sum(lam * z[idx], axis=1)
+        else:
+            lam, ss1 = w
+            v = np.dot(lam, z)
+
+        v = v.reshape(self.GridX.shape)
+        if ss1 is not None:
+            ss1 = ss1.reshape(self.GridX.shape)
+
+        if self.config['detrend']:
+            # retrend the residuals
+            v = self.retrendData(v)
+
+        return v, ss1
+
+    def adjust(self, x, y):
+        """
+        Rotate and scale the coordinates to take into account the anisotropy
+        the same as pykrige
+
+        Args:
+            x: x coordinates
+            y: y coordinates
+
+        Returns:
+            [n x 2] array of the adjusted coordinates
+        """
+
+        angle = -np.radians(self.anisotropy_angle)
+        xa = np.cos(angle)*x - np.sin(angle)*y
+        ya = (np.sin(angle)*x + np.cos(angle)*y) * self.anisotropy_scaling
+
+        return np.column_stack((xa, ya))
+
+    def fitVariogram(self, d, nan_val, date_time=None):
+        """
+        Fit the variogram with pykrige when ``krig_variogram_fit`` requires,
+        the cached kriging weights are cleared when the variogram changes
+
+        Args:
+            d: the data or detrended data
+            nan_val: stations without data
+            date_time: the date time of the time step
+        """
+
+        if self.variogram_fit == 'timestep':
+            key = None
+        elif self.variogram_fit == 'daily' and hasattr(date_time, 'date'):
+            key = date_time.date()
+        else:
+            key = 'once'
+
+        if key is not None and key == self.fit_key:
+            return
+
         OK = OrdinaryKriging(self.mx[~nan_val],
                              self.my[~nan_val],
                              d[~nan_val],
@@ -92,40 +187,124 @@ class KRIGE:
                              enable_plotting=self.enable_plotting,
                              enable_statistics=self.enable_statistics)
 
-        v, ss1 = OK.execute('grid',
-                            self.GridX[0,:],
-                            self.GridY[:,0],
-                            backend=self.backend,
-                            n_closest_points=self.n_closest_points)
+        self.model_function = OK.variogram_function
+        self.model_parameters = OK.variogram_model_parameters
+        self.fit_key = key
+        self.cache = WeightCache()
 
+        if key is not None:
+            self._logger.debug('Fit {} variogram with parameters {}'
+                               .format(self.variogram_model,
+                                       self.model_parameters))
 
-        if self.config['detrend']:
-            # retrend the residuals
-            v = self.retrendData(v)
+    def variogram(self, d):
+        """
+        Negative of the variogram for the distances, zero where the distance
+        is zero so the station values are exact
+        """
 
+        g = -self.model_function(self.model_parameters, d)
+        g[np.abs(d) <= 1e-10] = 0.0
+        return g
 
-        return v, ss1
+    def krigingWeights(self, valid):
+        """
+        Calculate the kriging weights for each grid cell, taken from the cache
+        if the same stations have been used with the same variogram
+
+        Args:
+            valid: boolean array of the stations with data
+
+        Returns:
+            tuple of the kriging weights and the variance, with the index of
+            the closest stations first if ``krig_n_closest_points`` is set
+        """
+
+        w = self.cache.get(valid)
+        if w is not None:
+            return w
+
+        xy = self.adjust(self.mx[valid], self.my[valid])
+        n = xy.shape[0]
+        ncells = self.cells.shape[0]
+        k = self.n_closest_points
+
+        self._logger.debug('Calculating kriging weights for {} stations'
+                           .format(n))
+
+        ss1 = np.empty(ncells) if self.variance else None
+
+        if k is None or k >= n:
+            # one kriging system for all the cells
+            a = np.ones((n + 1, n + 1))
+            a[:n, :n] = self.variogram(cdist(xy, xy))
+            np.fill_diagonal(a, 0.0)
+            a[n, n] = 0.0
+            a_inv = inv(a)
+
+            lam = np.empty((ncells, n))
+            for i in range(0, ncells, self.block_size):
+                c = slice(i, i + self.block_size)
+                b = np.ones((self.cells[c].shape[0], n + 1))
+                b[:, :n] = self.variogram(cdist(self.cells[c], xy))
+                x = np.dot(b, a_inv.T)
+                lam[c] = x[:, :n]
+                if self.variance:
+                    ss1[c] = np.sum(x * -b, axis=1)
+
+            w = (lam, ss1)
+
+        else:
+            # a kriging system with the closest stations for each cell
+            dist, idx = cKDTree(xy).query(self.cells, k=k)
+            ad = self.variogram(cdist(xy, xy))
+
+            lam = np.empty((ncells, k))
+            for i in range(0, ncells, self.block_size):
+                c = slice(i, i + self.block_size)
+                ic = idx[c]
+
+                a = np.ones((ic.shape[0], k + 1, k + 1))
+                a[:, :k, :k] = ad[ic[:, :, np.newaxis], ic[:, np.newaxis, :]]
+                a[:, np.arange(k), np.arange(k)] = 0.0
+                a[:, k, k] = 0.0
+
+                b = np.ones((ic.shape[0], k + 1))
+                b[:, :k] = self.variogram(dist[c])
+
+                x = np.linalg.solve(a, b[:, :, np.newaxis])[:, :, 0]
+                lam[c] = x[:, :k]
+                if self.variance:
+                    ss1[c] = np.sum(x * -b, axis=1)
+
+            w = (idx, lam, ss1)
+
+        self.cache.put(valid, w)
+
+        return w
 
-    def detrendData(self, data, flag=0, zeros=None):
+    def detrendData(self, data, flag=0, zeros=None, pv=None):
         '''
         Detrend the data in val using the heights zmeas
         Args:
             data: is the same size at mx,my
             flag: - 1 for positive, -1 for negative, 0 for any trend imposed
+            pv: slope and intercept of the trend, calculated if None
 
         Returns:
             data minus the elevation trend
         '''
 
-        # calculate the trend on any real data
-        nan_val = np.isnan(data)
-        pv = np.polyfit(self.mz[~nan_val], data[~nan_val], 1)
+        if pv is None:
+            # calculate the trend on any real data
+            nan_val = np.isnan(data)
+            pv = np.polyfit(self.mz[~nan_val], data[~nan_val], 1)
 
-        # apply trend constraints
-        if flag == 1 and pv[0] < 0:
-            pv = np.array([0, 0])
-        elif (flag == -1 and pv[0] > 0):
-            pv = np.array([0, 0])
+            # apply trend constraints
+            if flag == 1 and pv[0] < 0:
+                pv = np.array([0, 0])
+            elif (flag == -1 and pv[0] > 0):
+                pv = np.array([0, 0])
 
         self.pv = pv
 
@@ -0,0 +1,241 @@
+'''
+Distributed gridded model data over the grid by bilinear regridding
+'''
+
+import logging
+import numpy as np
+import re
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+from smrf.spatial.trend import elevation_trend
+
+
+class REGRID:
+    '''
+    Bilinear regridding of a structured model grid, i.e. the gridded data
+    from :mod:`smrf.data.loadGrid` where each model cell is a point named
+    ``grid_y<i>_x<j>``. The fractional model grid index of each grid cell is
+    found once by inverting the bilinear mapping of the model cell
+    locations, which may be curvilinear in UTM. The interpolation is then a
+    sparse (ncells x npoints) operator with four weights per cell that is
+    applied to each time step as a sparse matrix vector product.
+
+    - Standard regridding
+    - Detrended regridding
+    '''
+
+    name_re = re.compile(r'grid_y(\d+)_x(\d+)$')
+
+    def __init__(self, names, mx, my, GridX, GridY, mz=None, GridZ=None,
+                 niter=10):
+        '''
+        Args:
+            names: point names, grid_y<i>_x<j> for the model cell
+            mx: x locations for the points
+            my: y locations for the points
+            GridX: x locations in grid to interpolate over
+            GridY: y locations in grid to interpolate over
+            mz: elevation for the points
+            GridZ: elevation values to interpolate over for trended data
+            niter: number of Newton iterations to find the model grid index
+        '''
+
+        self._logger = logging.getLogger(__name__)
+
+        self.mx = mx
+        self.my = my
+        self.mz = mz
+        self.npoints = len(mx)
+
+        self.GridX = GridX
+        self.GridY = GridY
+        self.GridZ = GridZ
+
+        # model grid index of each point
+        idx = np.zeros((self.npoints, 2), dtype=int)
+        for n, name in enumerate(names):
+            m = self.name_re.match(name)
+            if m is None:
+                raise ValueError('regrid requires gridded data with points '
+                                 'named grid_y<i>_x<j>, not {}'.format(name))
+            idx[n] = [int(m.group(1)), int(m.group(2))]
+
+        idx -= idx.min(axis=0)
+        ny, nx = idx.max(axis=0) + 1
+        if ny < 2 or nx < 2:
+            raise ValueError('regrid requires at least 2x2 model grid cells')
+
+        # model grid with the point number and locations, points that are
+        # outside the model domain are -1
+        point = np.full((ny, nx), -1, dtype=int)
+        point[idx[:, 0], idx[:, 1]] = np.arange(self.npoints)
+        self.shape = (ny, nx)
+
+        self._logger.debug('Calculating the regridding operator from a '
+                           '{} by {} model grid'.format(ny, nx))
+
+        self.W = self.calculateWeights(point, idx, niter)
+
+    def calculateWeights(self, point, idx, niter):
+        '''
+        Find the bilinear weights for each grid cell
+
+        Args:
+            point: model grid of the point number, -1 for missing points
+            idx: model grid index of each point
+            niter: number of Newton iterations
+
+        Returns:
+            sparse (ncells x npoints) matrix of the weights
+        '''
+
+        ny, nx = self.shape
+        cells = np.column_stack((self.GridX.ravel(), self.GridY.ravel()))
+        ncells = cells.shape[0]
+
+        # model cell locations, fill any missing points from the nearest
+        # point so the bilinear mapping is defined everywhere
+        missing = point == -1
+        fill = point.copy()
+        if np.any(missing):
+            mi = np.argwhere(missing)
+            _, k = cKDTree(idx).query(mi)
+            fill[missing] = k
+        X = self.mx[fill]
+        Y = self.my[fill]
+
+        # first guess from the nearest model cell
+        _, k = cKDTree(np.column_stack((self.mx, self.my))).query(cells)
+        fi = idx[k, 0].astype(float)
+        fj = idx[k, 1].astype(float)
+
+        # Newton iterations on the bilinear mapping of the cell locations
+        for _ in range(niter):
+            i0 = np.clip(np.floor(fi).astype(int), 0, ny - 2)
+            j0 = np.clip(np.floor(fj).astype(int), 0, nx - 2)
+            a = fi - i0
+            b = fj - j0
+
+            def corners(Z):
+                return (Z[i0, j0], Z[i0 + 1, j0], Z[i0, j0 + 1],
+                        Z[i0 + 1, j0 + 1])
+
+            x00, x10, x01, x11 = corners(X)
+            y00, y10, y01, y11 = corners(Y)
+
+            x = (1-a)*(1-b)*x00 + a*(1-b)*x10 + (1-a)*b*x01 + a*b*x11
+            y = (1-a)*(1-b)*y00 + a*(1-b)*y10 + (1-a)*b*y01 + a*b*y11
+
+            # Jacobian of the mapping
+            dxda = (1-b)*(x10 - x00) + b*(x11 - x01)
+            dxdb = (1-a)*(x01 - x00) + a*(x11 - x10)
+            dyda = (1-b)*(y10 - y00) + b*(y11 - y01)
+            dydb = (1-a)*(y01 - y00) + a*(y11 - y10)
+            det = dxda*dydb - dxdb*dyda
+            det[det == 0] = np.finfo(float).eps
+
+            rx = cells[:, 0] - x
+            ry = cells[:, 1] - y
+            fi = np.clip(fi + (dydb*rx - dxdb*ry)/det, 0, ny - 1)
+            fj = np.clip(fj + (dxda*ry - dyda*rx)/det, 0, nx - 1)
+
+        i0 = np.clip(np.floor(fi).astype(int), 0, ny - 2)
+        j0 = np.clip(np.floor(fj).astype(int), 0, nx - 2)
+        a = fi - i0
+        b = fj - j0
+
+        cols = np.column_stack((point[i0, j0], point[i0 + 1, j0],
+                                point[i0, j0 + 1], point[i0 + 1, j0 + 1]))
+        w = np.column_stack(((1-a)*(1-b), a*(1-b), (1-a)*b, a*b))
+
+        # corners outside of the model domain have no weight
+        w[cols == -1] = 0
+        cols[cols == -1] = 0
+
+        rows = np.repeat(np.arange(ncells), 4)
+        W = sparse.csr_matrix((w.ravel(), (rows, cols.ravel())),
+                              shape=(ncells, self.npoints))
+
+        return W
+
+    def calculateRegridBlock(self, data):
+        '''
+        Regrid a block of time steps, the weights are normalized by the
+        points that have data
+
+        Args:
+            data: (npoints, T) array of the data at the points
+
+        Returns:
+            (T, ny, nx) array of the regridded data
+        '''
+
+        valid = ~np.isnan(data)
+        total = self.W.dot(valid.astype(float))
+        v = self.W.dot(np.where(valid, data, 0))
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            v /= total
+        v[total == 0] = np.nan
+
+        return v.T.reshape((data.shape[1],) + self.GridX.shape)
+
+    def calculateRegrid(self, data):
+        '''
+        Regrid the data at mx,my over GridX,GridY
+
+        Args:
+            data: data at the points
+
+        Returns:
+            the regridded data
+        '''
+
+        return self.calculateRegridBlock(data[:, np.newaxis])[0]
+
+    def detrendedRegridBlock(self, data, flag=0, pv=None):
+        '''
+        Regrid a block of time steps that have the same points with data
+        using a detrended approach
+
+        Args:
+            data: (npoints, T) array of the data at the points
+            flag: 1 for positive, -1 for negative, 0 for any trend imposed
+            pv: (T, 2) array of the slope and intercept for each time step,
+                calculated from the data if not given
+
+        Returns:
+            (T, ny, nx) array of the regridded data
+        '''
+
+        if pv is None:
+            pv = elevation_trend(self.mz, data, flag)
+
+        dtrend = data - (np.outer(self.mz, pv[:, 0]) + pv[:, 1])
+        v = self.calculateRegridBlock(dtrend)
+
+        # retrend the data
+        v += pv[:, 0, np.newaxis, np.newaxis] * self.GridZ
+        v += pv[:, 1, np.newaxis, np.newaxis]
+        self.pv = pv[-1]
+
+        return v
+
+    def detrendedRegrid(self, data, flag=0, pv=None):
+        '''
+        Regrid the data at mx,my over GridX,GridY using a detrended approach
+
+        Args:
+            data: data at the points
+            flag: 1 for positive, -1 for negative, 0 for any trend imposed
+            pv: slope and intercept of the trend, calculated if None
+
+        Returns:
+            the regridded data
+        '''
+
+        if pv is not None:
+            pv = np.atleast_2d(pv)
+
+        return self.detrendedRegridBlock(data[:, np.newaxis], flag, pv)[0]
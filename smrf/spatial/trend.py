@@ -0,0 +1,54 @@
+"""
+Elevational trends for many time steps at once
+"""
+
+import numpy as np
+
+
+def elevation_trend(mz, data, flag=0):
+    """
+    Fit a linear elevational trend to the station data for all time steps
+    at once, where the stations with data can change between time steps. The
+    trend is calculated in closed form from the sums over the stations with
+    data for each time step, which is the same as ``np.polyfit`` of order 1
+    on the stations with data. Time steps with only one station with data
+    have no slope and the intercept is the station value.
+
+    Args:
+        mz: elevation of the stations
+        data: (nsta, T) array of the station data, NaN where there is no data
+        flag: 1 for positive, -1 for negative, 0 for any trend imposed, a
+            trend that does not meet the constraint is set to zero
+
+    Returns:
+        (T, 2) array of the slope and intercept for each time step
+    """
+
+    data = np.asarray(data, dtype=np.float64)
+    if data.ndim == 1:
+        data = data[:, np.newaxis]
+
+    valid = ~np.isnan(data)
+    n = np.sum(valid, axis=0)
+    z = np.where(valid, np.asarray(mz, dtype=np.float64)[:, np.newaxis], 0)
+    y = np.where(valid, data, 0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        zbar = np.sum(z, axis=0) / n
+        ybar = np.sum(y, axis=0) / n
+
+        # centered sums for a stable slope
+        dz = np.where(valid, z - zbar, 0)
+        szz = np.sum(dz * dz, axis=0)
+        szy = np.sum(dz * (y - ybar), axis=0)
+        slope = np.where(szz > 0, szy / szz, 0)
+
+    pv = np.column_stack((slope, ybar - slope * zbar))
+
+    # apply trend constraints
+    if flag == 1:
+        pv[pv[:, 0] < 0] = 0
+    elif flag == -1:
+        pv[pv[:, 0] > 0] = 0
+
+    return pv
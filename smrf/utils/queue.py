@@ -264,3 +264,97 @@ class QueueOutput(threading.Thread):
                 self.queues['output'].put([t, True])
 
                 self._logger.debug('%s Variables output from queues' % t)
+
+
+class QueueBackgroundOutput(threading.Thread):
+    """
+    Output writer that runs in its own thread so the distribution of the next
+    time step can continue while the previous time step is written.
+
+    The data for each variable is copied into one of a fixed number of
+    preallocated buffers and the buffer is passed to the writer thread
+    through a bounded queue. When all the buffers are in use, ``put`` blocks
+    until the writer has finished with one, so the model can not run more
+    than a few time steps ahead of the output.
+    """
+
+    def __init__(self, out_func, nx, ny, max_values=2):
+        """
+        Args:
+            out_func: output class with an ``output(variable, data,
+                date_time)`` method, e.g. :mod:`smrf.output.output_netcdf`
+                or :mod:`smrf.output.output_hru`
+            nx: number of columns
+            ny: number of rows
+            max_values: number of time steps that can be waiting to be
+                written
+        """
+
+        threading.Thread.__init__(self, name='background_output')
+        self.daemon = True
+        self.out_func = out_func
+
+        nbuffers = max(max_values, 1) * max(len(out_func.variable_list), 1)
+
+        self.free = Queue()
+        for i in range(nbuffers):
+            self.free.put(np.empty((ny, nx)))
+        self.jobs = Queue(nbuffers)
+        self.error = None
+
+        self._logger = logging.getLogger(__name__)
+        self._logger.debug('Initialized background output thread with {} '
+                           'buffers'.format(nbuffers))
+
+    def put(self, variable, data, date_time):
+        """
+        Copy the data into a free buffer and queue it to be written, blocking
+        if all the buffers are waiting to be written
+
+        Args:
+            variable: variable name that will index into variable list
+            data: the variable data
+            date_time: the date time object for the time step
+        """
+
+        self._check_error()
+
+        buf = self.free.get()
+        np.copyto(buf, data)
+        self.jobs.put((variable, buf, date_time))
+
+    def run(self):
+        """
+        Write the queued buffers until the stop signal is received
+        """
+
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+
+            variable, buf, date_time = job
+            try:
+                if self.error is None:
+                    self.out_func.output(variable, buf, date_time)
+            except Exception as e:
+                self._logger.error(e)
+                self.error = e
+            finally:
+                self.free.put(buf)
+
+    def close(self):
+        """
+        Wait for all the queued time steps to be written and stop the thread
+        """
+
+        if self.is_alive():
+            self.jobs.put(None)
+            self.join()
+
+        self._check_error()
+
+    def _check_error(self):
+        if self.error is not None:
+            raise Exception('Background output failed: {}'
+                            .format(self.error))
@@ -19,7 +19,7 @@ from inicheck.checkers import CheckType
 from inicheck.output import generate_config
 from inicheck.utilities import mk_lst
 import copy
-import scipy.spatial.qhull as qhull
+from scipy.spatial import Delaunay
 
 class CheckStation(CheckType):
     """
@@ -174,6 +174,51 @@ def water_day(indate):
     return dd, wy
 
 
+def timestep_context(date_time, cosz, azimuth):
+    """
+    Build a table of the per time step values that are constant over the
+    model domain so they are only calculated once per run instead of on
+    every time step. The water day follows
+    :mod:`~smrf.utils.utils.water_day`.
+
+    Args:
+        date_time: list of time zone aware datetime objects for the run
+        cosz: array of the cosine of the zenith angle for each time step
+        azimuth: array of the solar azimuth for each time step
+
+    Returns:
+        context: Pandas dataframe indexed by ``date_time`` with the columns
+
+            * **index** - integer index of the time step
+            * **wy_day** - decimal day from start of water year
+            * **wyear** - water year
+            * **tz_min_west** - minutes west of UTC for the time zone
+            * **cosz** - cosine of the zenith angle
+            * **azimuth** - solar azimuth
+    """
+
+    # water year start is in the same time zone as the dates
+    local = pd.DatetimeIndex([d.replace(tzinfo=None) for d in date_time])
+    wyear = local.year.values + (local.month.values >= 10)
+    wy_start = pd.to_datetime(pd.DataFrame({'year': wyear - 1,
+                                            'month': 10,
+                                            'day': 1}))
+    wy_day = (local - pd.DatetimeIndex(wy_start)).total_seconds() / 86400.0
+
+    tz_min_west = [np.abs(d.utcoffset().total_seconds()/60)
+                   for d in date_time]
+
+    context = pd.DataFrame({'index': np.arange(len(date_time)),
+                            'wy_day': np.asarray(wy_day),
+                            'wyear': wyear,
+                            'tz_min_west': tz_min_west,
+                            'cosz': cosz,
+                            'azimuth': azimuth},
+                           index=date_time)
+
+    return context
+
+
 def is_leap_year(year):
     return (year % 4 == 0 and year % 100 != 0) or year % 400 == 0
 
@@ -392,7 +437,7 @@ def interp_weights(xy, uv,d=2):
         wts:
 
     """
-    tri = qhull.Delaunay(xy)
+    tri = Delaunay(xy)
     simplex = tri.find_simplex(uv)
     vertices = np.take(tri.simplices, simplex, axis=0)
     temp = np.take(tri.transform, simplex, axis=0)
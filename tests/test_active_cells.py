@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_active_cells
+----------------------------------
+
+Tests for distributing only the cells in the mask with ``active_cells``.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from smrf.data.loadTopo import topo
+from smrf.distribute.image_data import image_data
+from smrf.distribute.wind import wind
+from smrf.utils import utils
+
+
+def make_topo(mask):
+    """
+    Topo with only the attributes needed for the active cells
+    """
+
+    t = topo.__new__(topo)
+    t._logger = logging.getLogger(__name__)
+    t.ny, t.nx = mask.shape
+    t.grid_shape = mask.shape
+    t.mask = mask
+    t.x = 500000.0 + 50.0 * np.arange(t.nx)
+    t.y = 4800000.0 - 50.0 * np.arange(t.ny)
+    t.X, t.Y = np.meshgrid(t.x, t.y)
+    t.setActive()
+
+    return t
+
+
+class TestTopo(unittest.TestCase):
+    def setUp(self):
+        self.mask = np.zeros((4, 5))
+        self.mask[1:3, 1:4] = 1
+        self.mask[3, 0] = 1
+        self.topo = make_topo(self.mask)
+
+    def testCompress(self):
+        """
+        Compress takes the cells in the mask in flat order
+        """
+
+        data = np.arange(20.0).reshape(4, 5)
+        c = self.topo.compress(data)
+
+        self.assertEqual(c.shape, (1, 7))
+        np.testing.assert_array_equal(c[0], data[self.mask > 0])
+
+        # leading dimensions are kept
+        c = self.topo.compress(np.stack((data, -data)))
+        self.assertEqual(c.shape, (2, 1, 7))
+        np.testing.assert_array_equal(c[1, 0], -data[self.mask > 0])
+
+        # anything that is not a full grid is returned as is
+        self.assertEqual(self.topo.compress(3.0), 3.0)
+        self.assertIsNone(self.topo.compress(None))
+
+    def testExpand(self):
+        """
+        Expand is the inverse of compress with the fill outside of the mask
+        """
+
+        data = np.arange(20.0).reshape(4, 5)
+        e = self.topo.expand(self.topo.compress(data))
+
+        np.testing.assert_array_equal(e[self.mask > 0], data[self.mask > 0])
+        self.assertTrue(np.all(np.isnan(e[self.mask == 0])))
+
+        e = self.topo.expand(self.topo.compress(data.astype(int)), fill=-1)
+        self.assertEqual(e.dtype, np.float64)
+        self.assertTrue(np.all(e[self.mask == 0] == -1))
+
+    def testCompressed(self):
+        """
+        The compressed topo is a single row of the active cells
+        """
+
+        t = self.topo.compressed()
+
+        self.assertEqual((t.ny, t.nx), (1, 7))
+        np.testing.assert_array_equal(t.X[0], self.topo.X[self.mask > 0])
+        np.testing.assert_array_equal(t.y, self.topo.y)
+
+
+class TestWindNinja(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.date = pd.Timestamp('2017-10-01 12:00', tz='UTC')
+
+        mask = np.zeros((6, 7))
+        mask[1:5, 2:6] = 1
+        mask[0, 0] = 1
+        self.topo = make_topo(mask)
+
+        # WindNinja grid extends past the SMRF grid by one cell to the south
+        # and three to the north, so a north south flip does not match
+        wx = self.topo.x[0] - 50.0 + 50.0 * np.arange(self.topo.nx + 2)
+        wy = self.topo.y[-1] - 50.0 + 50.0 * np.arange(self.topo.ny + 4)
+        WX, WY = np.meshgrid(wx, wy[::-1])
+        self.vel = self.field(WX, WY)
+
+        d = os.path.join(self.path,
+                         'data{}'.format(self.date.strftime('%Y%m%d')),
+                         'wind_ninja_data')
+        os.makedirs(d)
+        for v in ['vel', 'ang']:
+            fname = os.path.join(d, 'test_{}_200m_{}.asc'.format(
+                self.date.strftime('%m-%d-%Y_%H%M'), v))
+            with open(fname, 'w') as f:
+                f.write('ncols {}\nnrows {}\nxllcorner {}\nyllcorner {}\n'
+                        'cellsize 50\nNODATA_value -9999\n'
+                        .format(len(wx), len(wy), wx[0], wy[0]))
+                np.savetxt(f, self.vel)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    @staticmethod
+    def field(X, Y):
+        return (X - 500000.0) / 50.0 + (Y - 4800000.0) / 5.0
+
+    def make_wind(self, t):
+        """
+        The attributes of the wind class used by convert_wind_ninja, with
+        the interpolation weights found as in initialize
+        """
+
+        w = wind.__new__(wind)
+        w.wind_ninja_dir = self.path
+        w.wind_ninja_pref = 'test'
+        w.wind_ninja_dxy = 200
+        w.wind_ninja_tz = pytz.utc
+        w.distribute_drifts = True
+        w.ln_wind_scale = 1.0
+        w.X = t.X
+        w.Y = t.Y
+
+        ts = utils.get_asc_stats(os.path.join(
+            self.path, 'data{}'.format(self.date.strftime('%Y%m%d')),
+            'wind_ninja_data',
+            'test_{}_200m_vel.asc'.format(
+                self.date.strftime('%m-%d-%Y_%H%M'))))
+        XW, YW = np.meshgrid(ts['x'], ts['y'])
+        xy = np.column_stack((XW.flatten(), YW.flatten()))
+        uv = np.column_stack((w.X.flatten(), w.Y.flatten()))
+        w.vtx, w.wts = utils.interp_weights(xy, uv, d=2)
+
+        return w
+
+    def testOrientation(self):
+        """
+        WindNinja grids are placed on the SMRF grid north side up
+        """
+
+        vel, ang = self.make_wind(self.topo).convert_wind_ninja(self.date)
+
+        np.testing.assert_allclose(vel, self.field(self.topo.X, self.topo.Y))
+        np.testing.assert_allclose(ang, vel)
+
+    def testActiveCells(self):
+        """
+        The active cells are the same as the full grid in the mask
+        """
+
+        full, _ = self.make_wind(self.topo).convert_wind_ninja(self.date)
+        active, _ = self.make_wind(
+            self.topo.compressed()).convert_wind_ninja(self.date)
+
+        self.assertEqual(active.shape, (1, len(self.topo.active)))
+        np.testing.assert_allclose(active, self.topo.compress(full))
+
+
+class TestGrid(unittest.TestCase):
+    def setUp(self):
+        mask = np.zeros((6, 7))
+        mask[1:5, 2:6] = 1
+        mask[0, 0] = 1
+        self.topo = make_topo(mask)
+        self.topo.dem = 1000.0 + 0.5 * self.topo.X - 0.5 * self.topo.Y
+
+        # two stations outside of the mask that are off the trend
+        x, y = self.topo.x, self.topo.y
+        self.metadata = pd.DataFrame({
+            'X': [x[2], x[5], x[3], x[0], x[6], x[6]],
+            'Y': [y[1], y[4], y[2], y[0], y[5], y[0]],
+            'elevation': [1200.0, 1500.0, 1300.0, 1800.0, 1100.0, 1700.0]},
+            index=['A', 'B', 'C', 'D', 'E', 'F'])
+        self.data = pd.Series([5.0, 2.0, 4.0, -1.0, 20.0, -10.0],
+                              index=self.metadata.index,
+                              name=pd.Timestamp('2017-10-01 12:00'))
+
+    def distribute(self, t):
+        d = image_data('air_temp')
+        d.getConfig({'distribution': 'grid', 'stations': None, 'min': None,
+                     'max': None, 'detrend': True, 'slope': 0,
+                     'mask': True, 'grid_method': 'linear',
+                     'grid_cache_size': 64})
+        d.stations = list(self.metadata.index)
+        d._initialize(t, self.metadata)
+        d._distribute(self.data)
+
+        return d
+
+    def testMask(self):
+        """
+        The stations in the mask are found on the full grid
+        """
+
+        full = self.distribute(self.topo)
+        active = self.distribute(self.topo.compressed())
+
+        np.testing.assert_array_equal(active.grid.mask, full.grid.mask)
+        np.testing.assert_array_equal(
+            full.grid.mask, [True, True, True, True, False, False])
+
+        self.assertEqual(active.air_temp.shape, (1, len(self.topo.active)))
+        np.testing.assert_allclose(active.air_temp,
+                                   self.topo.compress(full.air_temp))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_image_data
+----------------------------------
+
+Tests for the distribution of the time steps in `smrf.distribute.image_data`.
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from smrf.data.loadTopo import topo
+from smrf.distribute.image_data import image_data
+
+
+def make_topo():
+    """
+    Topo with only the attributes needed to distribute the stations
+    """
+
+    t = topo.__new__(topo)
+    t.ny, t.nx = 6, 7
+    t.x = 500000.0 + 50.0 * np.arange(t.nx)
+    t.y = 4800000.0 - 50.0 * np.arange(t.ny)
+    t.X, t.Y = np.meshgrid(t.x, t.y)
+    t.dem = 1000.0 + 0.5 * (t.X - t.x[0]) + 0.8 * (t.y[0] - t.Y)
+    t.mask = np.ones((t.ny, t.nx))
+
+    return t
+
+
+class TestBatch(unittest.TestCase):
+    """
+    Distributing blocks of time steps with ``batch_size`` is the same as
+    distributing each time step
+    """
+
+    def setUp(self):
+        self.topo = make_topo()
+
+        rng = np.random.RandomState(0)
+        stations = ['A', 'B', 'C', 'D', 'E']
+        self.metadata = pd.DataFrame({
+            'X': self.topo.x[0] + rng.uniform(0, 300, 5),
+            'Y': self.topo.y[-1] + rng.uniform(0, 250, 5),
+            'elevation': rng.uniform(1000, 1500, 5)},
+            index=stations)
+
+        # station D is missing for a few time steps in the middle, so the
+        # blocks are split by the stations with data
+        index = pd.date_range('2017-10-01', periods=10, freq='60min')
+        self.data = pd.DataFrame(
+            0.01 * self.metadata['elevation'].values +
+            rng.normal(size=(10, 5)),
+            index=index, columns=stations)
+        self.data.iloc[4:7, 3] = np.nan
+
+    def distribute(self, distribution, batch_size):
+        d = image_data('air_temp')
+        d.getConfig({'distribution': distribution, 'stations': None,
+                     'min': None, 'max': None, 'detrend': True, 'slope': 0,
+                     'power': 2, 'batch_size': batch_size,
+                     'idw_cache_size': 64, 'idw_neighbors': 3,
+                     'idw_radius': None, 'dk_nthreads': 1,
+                     'dk_cache_size': 64, 'dk_cache_dir': None,
+                     'regression_method': 1})
+        d.stations = list(self.metadata.index)
+        d._initialize(self.topo, self.metadata)
+        d._initialize_batch(self.data)
+        d._initialize_trend(self.data)
+
+        v = []
+        for t in self.data.index:
+            d._distribute(self.data.loc[t])
+            v.append(d.air_temp.copy())
+
+        return d, np.array(v)
+
+    def assertBatch(self, distribution):
+        d, block = self.distribute(distribution, 4)
+        self.assertIsNotNone(d.batch_data)
+
+        d, step = self.distribute(distribution, 1)
+        self.assertIsNone(d.batch_data)
+
+        np.testing.assert_allclose(block, step, rtol=1e-10, atol=1e-10)
+
+    def testIDW(self):
+        """
+        Blocks of idw
+        """
+
+        self.assertBatch('idw')
+
+    def testKNNIDW(self):
+        """
+        Blocks of idw_knn
+        """
+
+        self.assertBatch('idw_knn')
+
+    def testDK(self):
+        """
+        Blocks of dk
+        """
+
+        self.assertBatch('dk')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_ipw
+----------------------------------
+
+Tests for reading and writing IPW images with the `ipw` module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from smrf.ipw import ipw
+
+
+class TestIPW(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.fname = os.path.join(self.path, 'test.ipw')
+
+        rng = np.random.RandomState(0)
+        self.data = [rng.uniform(1000, 3000, size=(300, 7)),
+                     rng.uniform(-1, 1, size=(300, 7)),
+                     np.full((300, 7), 5.0)]
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, nbits):
+        i = ipw.IPW()
+        for d in self.data:
+            i.new_band(d)
+        i.add_geo_hdr([4800000.0, 500000.0], [-50.0, 50.0], 'm', 'UTM')
+        i.write(self.fname, nbits)
+
+    def testRoundTrip(self):
+        """
+        Bands read back within the quantization of the bits
+        """
+
+        for nbits in [8, 16]:
+            self.write(nbits)
+            i = ipw.IPW(self.fname)
+
+            self.assertEqual((i.nbands, i.nlines, i.nsamps), (3, 300, 7))
+            for b, d in zip(i.bands, self.data):
+                self.assertEqual(b.data.dtype, np.float32)
+                step = max(np.ptp(d), 1) / (2**nbits - 1)
+                self.assertTrue(np.allclose(b.data, d, rtol=1e-6,
+                                            atol=step / 2 * 1.001))
+
+            # the geo header
+            b = i.bands[0]
+            self.assertTrue(np.allclose(b.y,
+                                        4800000.0 - 50.0 * np.arange(300)))
+            self.assertTrue(np.allclose(b.x, 500000.0 + 50.0 * np.arange(7)))
+            self.assertEqual(b.geounits, 'm')
+            self.assertEqual(b.coord_sys_ID, 'UTM')
+
+    def testDtype(self):
+        """
+        Bands are decoded in blocks of rows to the dtype when accessed
+        """
+
+        self.write(16)
+
+        i32 = ipw.IPW(self.fname)
+        i64 = ipw.IPW(self.fname, dtype=np.float64)
+        self.assertEqual(i64.bands[0].data.dtype, np.float64)
+
+        for b32, b64 in zip(i32.bands, i64.bands):
+            self.assertTrue(np.array_equal(b32.data,
+                                           b64.data.astype(np.float32)))
+
+        # the blocks of rows are the same as decoding at once
+        b = ipw.IPW(self.fname, dtype=np.float64).bands[1]
+        b.decode_rows = 1000
+        self.assertTrue(np.array_equal(b.data, i64.bands[1].data))
+
+
+if __name__ == '__main__':
+    unittest.main()
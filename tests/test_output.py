@@ -0,0 +1,426 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_output
+----------------------------------
+
+Tests for the output classes in the `output` module.
+"""
+
+import gc
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import netCDF4 as nc
+import numpy as np
+import pandas as pd
+
+from smrf.output import (output_aggregate, output_hru, output_netcdf_single,
+                         output_points, output_zarr)
+from smrf.output.output_zarr import zarr
+from smrf.utils.queue import QueueBackgroundOutput
+
+
+def make_topo(ny=4, nx=5):
+    """
+    Small topo with the attributes the output classes use
+    """
+
+    return SimpleNamespace(ny=ny, nx=nx,
+                           x=500000.0 + 50.0 * np.arange(nx),
+                           y=4800000.0 - 50.0 * np.arange(ny),
+                           mask=np.ones((ny, nx)))
+
+
+def make_variables(path, names):
+    """
+    Output variable list like the framework makes
+    """
+
+    return {v: {'variable': v,
+                'module': v,
+                'out_location': '{}/{}'.format(path, v),
+                'info': {'units': 'C', 'long_name': v}} for v in names}
+
+
+def make_config(**kwargs):
+    """
+    [output] section with the defaults from CoreConfig.ini
+    """
+
+    config = {'frequency': 1,
+              'mask': False,
+              'write_buffer': 1,
+              'chunk_size': [6, 10, 10],
+              'zlib': False,
+              'complevel': 4,
+              'shuffle': True,
+              'least_significant_digit': None,
+              'zarr_nthreads': 2}
+    config.update(kwargs)
+    return config
+
+
+class OutputTestCase(unittest.TestCase):
+    time = {'time_step': 60,
+            'start_date': '2017-10-01 00:00',
+            'end_date': '2017-10-01 04:00',
+            'time_zone': 'utc'}
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.dates = pd.date_range(self.time['start_date'],
+                                   self.time['end_date'], freq='h')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    @staticmethod
+    def data(v, t, ny=4, nx=5):
+        """
+        A different grid for each variable and time step
+        """
+
+        return np.arange(ny * nx, dtype=float).reshape(ny, nx) + \
+            100.0 * t + 1000.0 * v
+
+    def write(self, out, variables):
+        """
+        Output every time step of the variables and close
+        """
+
+        for t, d in enumerate(self.dates):
+            for i, v in enumerate(variables):
+                out.output(v, self.data(i, t), d)
+        out.close()
+
+
+class TestNetcdfSingle(OutputTestCase):
+    def testRoundTrip(self):
+        """
+        All the variables are in smrf.nc with a shared time axis
+        """
+
+        variables = ['air_temp', 'precip']
+        out = output_netcdf_single(make_variables(self.path, variables),
+                                   make_topo(), self.time,
+                                   make_config(out_location=self.path,
+                                               write_buffer=2))
+        self.write(out, variables)
+
+        with nc.Dataset('{}/smrf.nc'.format(self.path)) as s:
+            np.testing.assert_allclose(s.variables['time'][:], np.arange(5))
+            np.testing.assert_allclose(s.variables['x'][:], make_topo().x)
+            for i, v in enumerate(variables):
+                self.assertEqual(s.variables[v].units, 'C')
+                for t in range(len(self.dates)):
+                    np.testing.assert_allclose(s.variables[v][t],
+                                               self.data(i, t))
+
+
+    def testPartialBuffer(self):
+        """
+        Fewer time steps than the write buffer are written on close, on
+        leaving the context and when garbage collected
+        """
+
+        variables = ['air_temp']
+
+        def make_out():
+            return output_netcdf_single(
+                make_variables(self.path, variables), make_topo(),
+                self.time, make_config(out_location=self.path,
+                                       write_buffer=8))
+
+        def check(ntimes):
+            with nc.Dataset('{}/smrf.nc'.format(self.path)) as s:
+                np.testing.assert_allclose(s.variables['time'][:],
+                                           np.arange(ntimes))
+                for t in range(ntimes):
+                    np.testing.assert_allclose(
+                        s.variables['air_temp'][t], self.data(0, t))
+
+        out = make_out()
+        for t in range(3):
+            out.output('air_temp', self.data(0, t), self.dates[t])
+        out.close()
+        check(3)
+
+        # the file is opened again and added to
+        with make_out() as out:
+            out.output('air_temp', self.data(0, 3), self.dates[3])
+        check(4)
+
+        out = make_out()
+        out.output('air_temp', self.data(0, 4), self.dates[4])
+        del out
+        gc.collect()
+        check(5)
+
+
+class TestBackgroundOutput(OutputTestCase):
+    variables = ['air_temp', 'precip']
+
+    def make_out(self, path):
+        return output_netcdf_single(make_variables(path, self.variables),
+                                    make_topo(), self.time,
+                                    make_config(out_location=path,
+                                                write_buffer=2))
+
+    def testSameOutput(self):
+        """
+        Writing in the background is the same as writing each time step
+        """
+
+        self.write(self.make_out(self.path), self.variables)
+
+        path = tempfile.mkdtemp(dir=self.path)
+        out = self.make_out(path)
+        writer = QueueBackgroundOutput(out, 5, 4, max_values=1)
+        writer.start()
+        for t, d in enumerate(self.dates):
+            for i, v in enumerate(self.variables):
+                # the buffer is copied so the data can change after put
+                data = self.data(i, t)
+                writer.put(v, data, d)
+                data[:] = np.nan
+        writer.close()
+        out.close()
+
+        with nc.Dataset('{}/smrf.nc'.format(self.path)) as s, \
+                nc.Dataset('{}/smrf.nc'.format(path)) as b:
+            for v in ['time'] + self.variables:
+                np.testing.assert_array_equal(b.variables[v][:],
+                                              s.variables[v][:])
+
+    def testError(self):
+        """
+        An error in the writer thread is raised in the main thread
+        """
+
+        out = self.make_out(self.path)
+        writer = QueueBackgroundOutput(out, 5, 4)
+        writer.start()
+
+        writer.put('not_a_variable', self.data(0, 0), self.dates[0])
+        with self.assertRaises(Exception) as e:
+            writer.close()
+        self.assertIn('Background output failed', str(e.exception))
+        self.assertFalse(writer.is_alive())
+
+        # nothing else is written after the error
+        with self.assertRaises(Exception):
+            writer.put('air_temp', self.data(0, 1), self.dates[1])
+        out.close()
+
+
+class TestHRU(OutputTestCase):
+    def setUp(self):
+        super().setUp()
+
+        # two HRUs and cells outside of any HRU
+        self.hru = np.zeros((4, 5))
+        self.hru[:2, :3] = 1
+        self.hru[2:, 1:] = 2
+
+        self.hru_file = '{}/hru.asc'.format(self.path)
+        with open(self.hru_file, 'w') as f:
+            f.write('ncols 5\nnrows 4\nxllcorner 0\nyllcorner 0\n'
+                    'cellsize 50\nNODATA_value -9999\n')
+            np.savetxt(f, self.hru, fmt='%d')
+
+    def hru_data(self, t):
+        d = self.data(0, t)
+        d[0, 0] = np.nan
+        return d
+
+    def hru_mean(self, t):
+        d = self.hru_data(t)
+        return [np.nanmean(d[self.hru == h]) for h in [1, 2]]
+
+    def make_hru(self, output_type):
+        out = output_hru(make_variables(self.path, ['air_temp']),
+                         make_topo(), self.dates,
+                         make_config(output_type=output_type,
+                                     hru_file=self.hru_file,
+                                     write_buffer=2))
+        out.func = None
+
+        for t, d in enumerate(self.dates):
+            out.output('air_temp', self.hru_data(t), d)
+        out.close()
+
+    def testCSV(self):
+        """
+        Mean of each HRU ignoring NaN values to a csv file
+        """
+
+        self.make_hru('csv')
+
+        df = pd.read_csv('{}/air_temp.csv'.format(self.path),
+                         index_col='date_time', parse_dates=True)
+        self.assertEqual(list(df.columns), ['1', '2'])
+        self.assertTrue(np.all(df.index == self.dates))
+        for t in range(len(self.dates)):
+            np.testing.assert_allclose(df.iloc[t], self.hru_mean(t),
+                                       atol=5e-4)
+
+    def testPRMS(self):
+        """
+        Mean of each HRU to a PRMS data file with the date columns
+        """
+
+        self.make_hru('prms')
+
+        with open('{}/air_temp.data'.format(self.path)) as f:
+            lines = f.read().splitlines()
+
+        self.assertEqual(lines[1], 'air_temp 2')
+        rows = np.array([r.split() for r in lines[3:]], dtype=float)
+        self.assertEqual(rows.shape, (5, 8))
+        np.testing.assert_array_equal(rows[:, 3], np.arange(5))
+        for t in range(len(self.dates)):
+            np.testing.assert_allclose(rows[t, 6:], self.hru_mean(t),
+                                       atol=5e-4)
+
+
+class TestPoints(OutputTestCase):
+    def testPointsFile(self):
+        """
+        Time series at the nearest pixels to the points file
+        """
+
+        topo = make_topo()
+        points_file = '{}/points.csv'.format(self.path)
+        pd.DataFrame({'id': ['a', 'b', 'c'],
+                      'x': [topo.x[1] + 10, topo.x[4], topo.x[0] - 5],
+                      'y': [topo.y[0], topo.y[2] - 20, topo.y[3]]}) \
+            .to_csv(points_file, index=False)
+
+        variables = ['air_temp', 'precip']
+        out = output_points(make_variables(self.path, variables), topo,
+                            self.time,
+                            make_config(out_location=self.path,
+                                        points_file=points_file,
+                                        write_buffer=2))
+        self.write(out, variables)
+
+        xi = [1, 4, 0]
+        yi = [0, 2, 3]
+        with nc.Dataset('{}/smrf_points.nc'.format(self.path)) as s:
+            self.assertEqual(s.featureType, 'timeSeries')
+            self.assertEqual(list(s.variables['station_name'][:]),
+                             ['a', 'b', 'c'])
+            np.testing.assert_allclose(s.variables['x'][:], topo.x[xi])
+            np.testing.assert_allclose(s.variables['y'][:], topo.y[yi])
+            np.testing.assert_allclose(s.variables['time'][:], np.arange(5))
+
+            for i, v in enumerate(variables):
+                for t in range(len(self.dates)):
+                    np.testing.assert_allclose(s.variables[v][t],
+                                               self.data(i, t)[yi, xi])
+
+    def testNoPoints(self):
+        """
+        Output before the points are set is an error
+        """
+
+        out = output_points(make_variables(self.path, ['air_temp']),
+                            make_topo(), self.time,
+                            make_config(out_location=self.path,
+                                        points_file=None))
+        self.assertRaises(Exception, out.output, 'air_temp',
+                          self.data(0, 0), self.dates[0])
+
+
+@unittest.skipIf(zarr is None, 'zarr is not installed')
+class TestZarr(OutputTestCase):
+    def testRoundTrip(self):
+        """
+        Full and partial time chunks read back from the stores
+        """
+
+        variables = ['air_temp', 'precip']
+        for zlib in [False, True]:
+            # an existing store keeps its compressor
+            path = tempfile.mkdtemp(dir=self.path)
+            out = output_zarr(make_variables(path, variables),
+                              make_topo(), self.time,
+                              make_config(chunk_size=[2, 3, 3], zlib=zlib))
+            self.write(out, variables)
+
+            for i, v in enumerate(variables):
+                s = zarr.open_group('{}/{}.zarr'.format(path, v), mode='r')
+                np.testing.assert_allclose(s['time'][:], np.arange(5))
+                np.testing.assert_allclose(s['y'][:], make_topo().y)
+                self.assertEqual(s[v].chunks, (2, 3, 3))
+                self.assertEqual(s[v].compressor.cname,
+                                 'zlib' if zlib else 'lz4')
+                for t in range(len(self.dates)):
+                    np.testing.assert_allclose(s[v][t], self.data(i, t))
+
+    def testLeastSignificantDigit(self):
+        """
+        Quantized variables are within the digits
+        """
+
+        out = output_zarr(make_variables(self.path, ['air_temp']),
+                          make_topo(), self.time,
+                          make_config(least_significant_digit=['air_temp:1']))
+        d = np.random.RandomState(0).normal(size=(4, 5))
+        out.output('air_temp', d, self.dates[0])
+        out.close()
+
+        s = zarr.open_group('{}/air_temp.zarr'.format(self.path), mode='r')
+        np.testing.assert_allclose(s['air_temp'][0], d, atol=0.1)
+        self.assertTrue(np.all(np.isnan(s['air_temp'][1:])))
+
+    def testBadLeastSignificantDigit(self):
+        """
+        The digits are checked the same as for the NetCDF output
+        """
+
+        for lsd in [['air_temp'], ['air_temp:1:2'], ['air_temp:one']]:
+            with self.assertRaises(ValueError):
+                output_zarr(make_variables(self.path, ['air_temp']),
+                            make_topo(), self.time,
+                            make_config(least_significant_digit=lsd))
+
+
+@unittest.skipIf(zarr is None, 'zarr is not installed')
+class TestAggregate(OutputTestCase):
+    def testDailyZarrMidDayStart(self):
+        """
+        Daily aggregate to zarr for a run that does not start at midnight
+        """
+
+        time = {'time_step': 60,
+                'start_date': '2017-10-01 06:00',
+                'end_date': '2017-10-02 05:00',
+                'time_zone': 'utc'}
+        start = pd.to_datetime(time['start_date'])
+
+        out = output_zarr(make_variables(self.path, ['air_temp']),
+                          make_topo(), time, make_config())
+        agg = output_aggregate(out, {'air_temp': ('daily', 'mean')})
+
+        for i in range(24):
+            agg.output('air_temp', np.full((4, 5), float(i)),
+                       start + pd.Timedelta(hours=i))
+        agg.close()
+
+        s = zarr.open_group('{}/air_temp.zarr'.format(self.path), mode='r')
+        d = s['air_temp'][:, 0, 0]
+
+        # first day is 06:00 to 23:00, labelled with its first time step
+        self.assertAlmostEqual(d[0], np.mean(np.arange(18)))
+        # second day starts at midnight
+        self.assertAlmostEqual(d[18], np.mean(np.arange(18, 24)))
+        self.assertEqual(np.sum(~np.isnan(d)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
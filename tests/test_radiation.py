@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_radiation
+----------------------------------
+
+Tests for the native functions in the `envphys.radiation` module.
+"""
+
+import shutil
+import unittest
+from datetime import datetime
+
+from smrf.envphys import radiation
+import numpy as np
+from scipy.linalg import expm
+
+
+def twostream_reference(mu0, S0, tau, omega, g, R0, d=False):
+    """
+    Solve the two-stream equations of Meador & Weaver (1980) with the
+    Eddington coefficients directly, with the beam as a third state so the
+    fluxes at the bottom are a matrix exponential of the fluxes at the top
+    """
+
+    if d:
+        # delta-Eddington scaling of Wiscombe & Joseph (1977)
+        f = g * g
+        tau = (1 - omega * f) * tau
+        omega = (1 - f) * omega / (1 - omega * f)
+        g = g / (1 + g)
+
+    gam1 = 0.25 * (7 - omega * (4 + 3 * g))
+    gam2 = -0.25 * (1 - omega * (4 - 3 * g))
+    gam3 = 0.25 * (2 - 3 * g * mu0)
+    gam4 = 1 - gam3
+
+    # upwelling, downwelling diffuse and the beam attenuation
+    A = np.array([[gam1, -gam2, -omega * S0 * gam3],
+                  [gam2, -gam1, omega * S0 * gam4],
+                  [0, 0, -1 / mu0]])
+    M = expm(A * tau)
+
+    # no diffuse at the top and the surface reflects the total irradiance
+    bottom = M[0] - R0 * (M[1] + mu0 * S0 * M[2])
+    up = -bottom[2] / bottom[0]
+    down = M[1, 0] * up + M[1, 2]
+
+    T = np.exp(-tau / mu0)
+    incident = mu0 * S0
+    total = down + incident * T
+
+    return [up / incident, total / incident, T, up, total, S0 * T]
+
+
+class TestClearSky(unittest.TestCase):
+    # mu0, S0, tau, omega, g, R0, delta-Eddington
+    cases = [(0.6, 1000.0, 0.2, 0.85, 0.3, 0.5, False),
+             (0.3, 1360.0, 1.0, 0.95, 0.6, 0.8, True),
+             (0.9, 500.0, 0.05, 0.5, 0.1, 0.0, False),
+             (0.45, 800.0, 2.0, 0.99, 0.85, 0.6, True)]
+
+    def testTwostreamReference(self):
+        """
+        The closed form solution is the same as solving the two-stream
+        equations
+        """
+
+        for c in self.cases:
+            R = radiation.twostream_native(*c[:6], d=c[6])
+            np.testing.assert_allclose(np.array(R, dtype=float),
+                                       twostream_reference(*c), rtol=1e-10)
+
+        # an image of incidence angles at once
+        mu0 = np.array([[0.2, 0.5], [0.7, 1.0]])
+        R = radiation.twostream_native(mu0, 1000.0, R0=0.6)
+        for i in np.ndindex(mu0.shape):
+            np.testing.assert_allclose(
+                [r[i] for r in R],
+                twostream_reference(mu0[i], 1000.0, 0.2, 0.85, 0.3, 0.6),
+                rtol=1e-10)
+
+    @unittest.skipUnless(shutil.which('twostream'),
+                         'requires the IPW twostream')
+    def testTwostreamIPW(self):
+        """
+        The same values as the IPW twostream
+        """
+
+        for c in self.cases:
+            R = radiation.twostream_native(*c[:6], d=c[6])
+            ipw = radiation.twostream(*c[:6], d=c[6])
+            np.testing.assert_allclose(np.array(R, dtype=float),
+                                       ipw.ravel(), rtol=1e-3)
+
+    def testTwostreamConservative(self):
+        """
+        Reflectance and transmittance sum to one without absorption
+        """
+
+        R = radiation.twostream_native(0.6, 1000.0, tau=0.2,
+                                       omega=1.0, g=0.3, R0=0.0)
+        self.assertAlmostEqual(R[0] + R[1], 1.0, places=5)
+
+    def testTwostreamNoAtmosphere(self):
+        """
+        With no optical depth the surface sees the full beam
+        """
+
+        R = radiation.twostream_native(0.6, 1000.0, tau=1e-10, R0=0.5)
+        self.assertAlmostEqual(R[0], 0.5, places=5)
+        self.assertAlmostEqual(R[4], 600.0, places=3)
+        self.assertAlmostEqual(R[5], 1000.0, places=3)
+
+    def testStoporadFlat(self):
+        """
+        Flat terrain with an open sky has no terrain correction
+        """
+
+        dem = np.array([[1000.0, 3000.0]])
+        zeros = np.zeros(dem.shape)
+        d = datetime(2016, 1, 15, 12)
+
+        beam, diffuse = radiation.stoporad(d, [0.28, 0.7], 0.5, 0.0, dem,
+                                           zeros, zeros, np.ones(dem.shape),
+                                           2.0, gsize=100, maxgsz=500)
+
+        S0 = radiation.solar_irradiance(d, [0.28, 0.7])
+        b, df = radiation.elevrad(dem, S0, 0.5)
+
+        self.assertTrue(np.allclose(beam, b * 0.5))
+        # less atmosphere at higher elevations
+        self.assertTrue(beam[0, 1] > beam[0, 0])
+        self.assertTrue(np.all(diffuse > 0))
+
+
+class TestSunAngle(unittest.TestCase):
+    def testSolarNoon(self):
+        """
+        Sun angle at solar noon on the summer solstice
+        """
+
+        dates = [datetime(2016, 6, 21, 19, m) for m in range(30, 60, 5)]
+        cosz, azimuth = radiation.sunang_vector(dates, 43.6, -116.2)
+
+        i = np.argmax(cosz)
+        self.assertAlmostEqual(np.degrees(np.arccos(cosz[i])),
+                               43.6 - 23.44, places=1)
+        self.assertTrue(np.abs(azimuth[i]) < 2)
+
+    def testAzimuthDirection(self):
+        """
+        Azimuth is positive to the east in the morning
+        """
+
+        dates = [datetime(2016, 3, 20, 15), datetime(2016, 3, 20, 23)]
+        cosz, azimuth = radiation.sunang_vector(dates, 43.6, -116.2)
+
+        self.assertTrue(azimuth[0] > 0)
+        self.assertTrue(azimuth[1] < 0)
+        self.assertTrue(np.all(cosz > 0))
+
+
+class TestGradient(unittest.TestCase):
+    def testPlane(self):
+        """
+        Slope and aspect of a plane facing the south west
+        """
+
+        # first row is the north, rising to the north and the east
+        x, y = np.meshgrid(np.arange(8) * 10.0, np.arange(6) * -10.0)
+        dem = 1000.0 + 0.3 * x + 0.4 * y
+
+        slope, aspect = radiation.gradient(dem, 10.0, -10.0)
+
+        self.assertTrue(np.allclose(slope, 0.5 / np.sqrt(1 + 0.5**2)))
+        self.assertTrue(np.allclose(aspect, -np.arctan2(0.3, 0.4)))
+
+    def testAspect(self):
+        """
+        Aspect is from the south and positive to the east, zero when flat
+        """
+
+        x, y = np.meshgrid(np.arange(5) * 10.0, np.arange(5) * -10.0)
+
+        for dem, a in [(y, 0), (-x, np.pi / 2), (x, -np.pi / 2),
+                       (0 * x, 0)]:
+            _, aspect = radiation.gradient(dem, 10.0, -10.0)
+            self.assertTrue(np.allclose(aspect, a))
+
+    def testBlocks(self):
+        """
+        Blocks of rows on threads are the same as the whole DEM
+        """
+
+        dem = np.random.RandomState(0).normal(size=(23, 17)).cumsum(axis=0)
+
+        s0, a0 = radiation.gradient(dem, 30.0, -30.0)
+        s1, a1 = radiation.gradient(dem, 30.0, -30.0, nthreads=3,
+                                    block_size=4)
+        s2, a2 = radiation.gradient(dem, 30.0, -30.0, dtype=np.float32)
+
+        self.assertTrue(np.array_equal(s0, s1))
+        self.assertTrue(np.array_equal(a0, a1))
+        self.assertEqual(s2.dtype, np.float32)
+        self.assertTrue(np.allclose(s0, s2, atol=1e-5))
+
+
+
+def brute_horizon(dem, dr, dc, spacing):
+    """
+    Cosine of the horizon angle from the zenith by checking every cell in
+    the direction of the (dr, dc) step
+    """
+
+    ny, nx = dem.shape
+    h = np.zeros(dem.shape)
+    for r in range(ny):
+        for c in range(nx):
+            k = 1
+            while 0 <= r + k*dr < ny and 0 <= c + k*dc < nx:
+                s = (dem[r + k*dr, c + k*dc] - dem[r, c]) / (k * spacing)
+                h[r, c] = max(h[r, c], s / np.sqrt(1 + s**2))
+                k += 1
+
+    return h
+
+
+class TestHorizon(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(1)
+        self.dem = 2000.0 + rng.normal(scale=20.0, size=(15, 12)).cumsum(
+            axis=1)
+
+    def testBruteForce(self):
+        """
+        Horizons along the rows, columns and diagonal match a brute force
+        search
+        """
+
+        # azimuth from the south, positive to the east, first row north
+        steps = {0: (1, 0), 90: (0, 1), 180: (-1, 0), -90: (0, -1),
+                 45: (1, 1), -135: (-1, -1)}
+
+        azimuths = list(steps.keys())
+        H = radiation.horizon(self.dem, 30.0, -30.0, azimuths)
+
+        for i, azm in enumerate(azimuths):
+            dr, dc = steps[azm]
+            h = brute_horizon(self.dem, dr, dc, 30.0 * np.hypot(dr, dc))
+            self.assertTrue(np.allclose(H[i], h, atol=1e-6))
+
+    def testIterHorizon(self):
+        """
+        The horizons one azimuth at a time on threads are the same
+        """
+
+        azimuths = np.linspace(-180, 180, 10, endpoint=False)
+        H = radiation.horizon(self.dem, 30.0, -30.0, azimuths)
+        Hi = list(radiation.iter_horizon(self.dem, 30.0, -30.0, azimuths,
+                                         nthreads=3))
+
+        self.assertEqual(len(Hi), len(azimuths))
+        self.assertTrue(np.array_equal(H, np.stack(Hi)))
+
+    def testSkyViewPlane(self):
+        """
+        The sky view of a plane is (1 + cos(S)) / 2 and 1 when flat
+        """
+
+        x, y = np.meshgrid(np.arange(20) * 10.0, np.arange(20) * -10.0)
+        azimuths = np.linspace(-180, 180, 72, endpoint=False)
+
+        for dem in [0 * x, 0.4 * x - 0.3 * y]:
+            slope, aspect = radiation.gradient(dem, 10.0, -10.0)
+            H = radiation.horizon(dem, 10.0, -10.0, azimuths)
+            svf = radiation.sky_view_factor(H, azimuths, slope, aspect)
+
+            # within the rounding of the profiles to the nearest cells
+            cos_s = np.sqrt(1 - slope**2)
+            self.assertTrue(np.allclose(svf, (1 + cos_s) / 2, atol=1e-2))
+
+            # the same from the horizons one azimuth at a time
+            svf_i = radiation.sky_view_factor(
+                radiation.iter_horizon(dem, 10.0, -10.0, azimuths),
+                azimuths, slope, aspect)
+            self.assertTrue(np.allclose(svf, svf_i))
+
+    def testCastShadow(self):
+        """
+        A ridge to the east shades the valley from a low morning sun
+        """
+
+        dem = np.zeros((5, 20))
+        dem[:, 15] = 100.0
+        azimuths = np.linspace(-180, 180, 36, endpoint=False)
+        H = radiation.horizon(dem, 10.0, -10.0, azimuths)
+
+        # sun 10 degrees above the east horizon, the profiles to the sun
+        # leave the DEM from the edge rows
+        shadow = radiation.cast_shadow(H, azimuths, 95.0,
+                                       np.cos(np.radians(80)))[2]
+        self.assertTrue(np.all(shadow[:15]))
+        self.assertFalse(np.any(shadow[15:]))
+
+        # a high sun only shades the cells next to the ridge
+        shadow = radiation.cast_shadow(H, azimuths, 95.0, 0.9)[2]
+        self.assertTrue(np.all(shadow[12:15]))
+        self.assertFalse(np.any(shadow[:9]))
+        self.assertFalse(np.any(shadow[15:]))
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
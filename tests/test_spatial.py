@@ -0,0 +1,631 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_spatial
+----------------------------------
+
+Tests for the interpolation classes in the `spatial` module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from pykrige.ok import OrdinaryKriging
+from scipy.interpolate import griddata
+
+from smrf.spatial import dk, grid, idw, kriging, regrid, trend
+from smrf.spatial.cache import WeightCache
+
+
+def make_points(npoints=20, seed=0):
+    """
+    Random points over a small grid
+    """
+
+    rng = np.random.RandomState(seed)
+    GridX, GridY = np.meshgrid(np.arange(0.0, 1000.0, 50.0),
+                               np.arange(0.0, 800.0, 50.0))
+    mx = rng.uniform(-50, 1050, npoints)
+    my = rng.uniform(-50, 850, npoints)
+
+    return mx, my, GridX, GridY
+
+
+class TestWeightCache(unittest.TestCase):
+    def testGetPut(self):
+        """
+        Weights are found by the station pattern
+        """
+
+        c = WeightCache()
+        a = np.array([True, False, True])
+        b = np.array([True, True, True])
+
+        self.assertIsNone(c.get(a))
+        c.put(a, (np.arange(3), np.ones(3)))
+        c.put(b, np.zeros(4))
+
+        w = c.get(a)
+        self.assertIsInstance(w, tuple)
+        np.testing.assert_array_equal(w[0], np.arange(3))
+        np.testing.assert_array_equal(c.get(b), np.zeros(4))
+        self.assertEqual(len(c), 2)
+
+    def testMemoryLimit(self):
+        """
+        The least recently used weights are removed over the memory limit
+        """
+
+        # room for two arrays of 0.4 MB
+        c = WeightCache(cache_size=1)
+        keys = [np.array([i == j for j in range(3)]) for i in range(3)]
+        w = np.zeros(50000)
+
+        c.put(keys[0], w)
+        c.put(keys[1], w)
+        c.get(keys[0])
+        c.put(keys[2], w)
+
+        self.assertEqual(len(c), 2)
+        self.assertIsNone(c.get(keys[1]))
+        self.assertIsNotNone(c.get(keys[0]))
+        self.assertIsNotNone(c.get(keys[2]))
+        self.assertEqual(c.nbytes, 2 * w.nbytes)
+
+        # weights over the limit are never kept
+        c.put(keys[1], np.zeros(200000))
+        self.assertIsNone(c.get(keys[1]))
+
+    def testDirectory(self):
+        """
+        Saved weights are read by a new cache with the same geometry only
+        """
+
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+
+        a = np.array([True, False, True])
+        geometry = [np.arange(3.0)]
+        c = WeightCache(directory=path, geometry=geometry, name='idw')
+        c.put(a, (np.arange(3), np.ones(3)))
+        c.put(~a, np.arange(4.0))
+
+        self.assertEqual(sorted(f.startswith('idw_')
+                                for f in os.listdir(path)), [True, True])
+
+        c = WeightCache(directory=path, geometry=geometry, name='idw')
+        w = c.get(a)
+        np.testing.assert_array_equal(w[1], np.ones(3))
+        np.testing.assert_array_equal(c.get(~a), np.arange(4.0))
+
+        c = WeightCache(directory=path, geometry=[np.arange(4.0)],
+                        name='idw')
+        self.assertIsNone(c.get(a))
+
+
+def baseline_idw(mx, my, GridX, GridY, data, power=2):
+    """
+    IDW of the stations with data without any cached weights
+    """
+
+    d = np.sqrt((GridX[:, :, np.newaxis] - mx)**2 +
+                (GridY[:, :, np.newaxis] - my)**2)
+    d[d == 0] = np.min(d)
+    w = 1.0 / d**power
+
+    s = ~np.isnan(data)
+    return np.sum(w[:, :, s] * data[s], 2) / np.sum(w[:, :, s], 2)
+
+
+class TestIDW(unittest.TestCase):
+    def setUp(self):
+        self.mx, self.my, self.GridX, self.GridY = make_points()
+
+        rng = np.random.RandomState(1)
+        self.mz = rng.uniform(1000, 2000, len(self.mx))
+        self.GridZ = 1000 + self.GridX + self.GridY
+        self.data = rng.normal(size=(len(self.mx), 6)) + 0.01 * \
+            self.mz[:, np.newaxis]
+
+        # a different pattern of stations with data for each time step
+        self.data[[1, 7], 1] = np.nan
+        self.data[[2, 3, 4], 2] = np.nan
+        self.data[1, 3] = np.nan
+        self.data[:-1, 4] = np.nan
+
+    def make_idw(self, cache_size=512):
+        return idw.IDW(self.mx, self.my, self.GridX, self.GridY, mz=self.mz,
+                       GridZ=self.GridZ, cache_size=cache_size)
+
+    def testBaseline(self):
+        """
+        The cached weights are the same as the baseline IDW
+        """
+
+        i = self.make_idw()
+        for t in range(self.data.shape[1]):
+            d = self.data[:, t]
+            np.testing.assert_allclose(
+                i.calculateIDW(d),
+                baseline_idw(self.mx, self.my, self.GridX, self.GridY, d),
+                rtol=1e-12)
+
+            # the normalized weights sum to one
+            w = i.normalizedWeights(~np.isnan(d))
+            np.testing.assert_allclose(np.sum(w, 2), 1, rtol=1e-12)
+
+        self.assertEqual(len(i.cache), 5)
+
+    def testCacheHit(self):
+        """
+        Weights from the cache are the same as calculated again
+        """
+
+        i = self.make_idw()
+        d = self.data[:, 2]
+        s = ~np.isnan(d)
+
+        w = i.normalizedWeights(s)
+        v = i.calculateIDW(d)
+        for t in range(self.data.shape[1]):
+            i.calculateIDW(self.data[:, t])
+
+        self.assertIs(i.normalizedWeights(s), w)
+        np.testing.assert_array_equal(i.calculateIDW(d), v)
+        np.testing.assert_allclose(w, i.patternWeights(s), rtol=1e-15)
+
+        # a cache too small for any weights
+        i = self.make_idw(cache_size=0)
+        np.testing.assert_allclose(i.calculateIDW(d), v, rtol=1e-12)
+        self.assertEqual(len(i.cache), 0)
+
+    def testDetrendedBlock(self):
+        """
+        A block of detrended time steps is the same as each time step
+        """
+
+        i = self.make_idw()
+        data = self.data[:, [0, 5]]
+        v = i.detrendedIDWBlock(data)
+
+        for t in range(data.shape[1]):
+            np.testing.assert_allclose(v[t], i.detrendedIDW(data[:, t]),
+                                       rtol=1e-10)
+
+        # the same stations are missing in the block
+        data = self.data[:, [3, 3]]
+        data[:, 1] *= 2
+        v = i.detrendedIDWBlock(data, flag=1)
+
+        for t in range(data.shape[1]):
+            np.testing.assert_allclose(
+                v[t], i.detrendedIDW(data[:, t], flag=1), rtol=1e-10)
+
+
+class TestKNNIDW(unittest.TestCase):
+    def setUp(self):
+        self.mx, self.my, self.GridX, self.GridY = make_points()
+        self.data = np.random.RandomState(1).normal(size=(len(self.mx), 4))
+        self.data[[3, 8], 2:] = np.nan
+
+    def make_idw(self, **kwargs):
+        return idw.KNNIDW(self.mx, self.my, self.GridX, self.GridY,
+                          **kwargs)
+
+    def testAllPoints(self):
+        """
+        Using every station is the same as IDW
+        """
+
+        k = self.make_idw(k=len(self.mx))
+        i = idw.IDW(self.mx, self.my, self.GridX, self.GridY)
+
+        for t in range(self.data.shape[1]):
+            np.testing.assert_allclose(k.calculateIDW(self.data[:, t]),
+                                       i.calculateIDW(self.data[:, t]),
+                                       rtol=1e-5, atol=1e-6)
+
+    def testNeighbors(self):
+        """
+        Only the k nearest stations with data are used
+        """
+
+        k = self.make_idw(k=3)
+        d = self.data[:, 2]
+        v = k.calculateIDW(d)
+
+        s = ~np.isnan(d)
+        mx, my = self.mx[s], self.my[s]
+        for r, c in [(0, 0), (5, 11), (15, 19)]:
+            dist = np.hypot(self.GridX[r, c] - mx, self.GridY[r, c] - my)
+            n = np.argsort(dist)[:3]
+            w = 1.0 / dist[n]**2
+            self.assertAlmostEqual(v[r, c], np.sum(w * d[s][n]) / np.sum(w),
+                                   places=5)
+
+    def testRadius(self):
+        """
+        Cells without a station in the radius use the nearest station
+        """
+
+        k = self.make_idw(k=4, radius=60.0)
+        d = self.data[:, 0]
+        v = k.calculateIDW(d)
+
+        dist = np.hypot(self.GridX[:, :, np.newaxis] - self.mx,
+                        self.GridY[:, :, np.newaxis] - self.my)
+        empty = np.min(dist, 2) > 60.0
+        self.assertTrue(np.any(empty))
+        self.assertTrue(np.any(~empty))
+
+        nearest = d[np.argmin(dist, 2)]
+        np.testing.assert_allclose(v[empty], nearest[empty], rtol=1e-6)
+
+        # cells with a single station in the radius only use that station
+        single = np.sum(dist <= 60.0, 2) == 1
+        np.testing.assert_allclose(v[single], nearest[single], rtol=1e-6)
+
+    def testStationOnCell(self):
+        """
+        A station on a grid cell has the largest weight without dividing
+        by zero
+        """
+
+        self.mx[0], self.my[0] = self.GridX[3, 4], self.GridY[3, 4]
+        k = self.make_idw(k=4)
+
+        idx, w = k.patternWeights(np.ones(len(self.mx), dtype=bool))
+        self.assertTrue(np.all(np.isfinite(w)))
+        np.testing.assert_allclose(np.sum(w, 1), 1, rtol=1e-6)
+
+        c = np.ravel_multi_index((3, 4), self.GridX.shape)
+        self.assertEqual(idx[c, np.argmax(w[c])], 0)
+
+        v = k.calculateIDW(self.data[:, 0])
+        self.assertTrue(np.all(np.isfinite(v)))
+
+    def testBlock(self):
+        """
+        A block of time steps is the same as each time step
+        """
+
+        for kwargs in [{'k': 5}, {'k': 1}, {'k': 4, 'radius': 60.0}]:
+            k = self.make_idw(**kwargs)
+            for data in [self.data[:, :2], self.data[:, 2:]]:
+                v = k.calculateIDWBlock(data)
+                for t in range(data.shape[1]):
+                    np.testing.assert_allclose(
+                        v[t], k.calculateIDW(data[:, t]), rtol=1e-5)
+
+
+class TestGrid(unittest.TestCase):
+    def testGriddata(self):
+        """
+        Each grid_method matches scipy.interpolate.griddata
+        """
+
+        mx, my, GridX, GridY = make_points()
+        g = grid.GRID({'mask': False}, mx, my, GridX, GridY)
+        data = np.sin(mx / 200.0) + np.cos(my / 300.0)
+
+        for method in ['nearest', 'linear', 'cubic']:
+            expected = griddata((mx, my), data, (GridX, GridY),
+                                method=method)
+            result = g.calculateInterpolation(data, method)
+            np.testing.assert_allclose(result, expected, rtol=1e-10,
+                                       atol=1e-10)
+
+    def testMissingStations(self):
+        """
+        Stations with missing data use their own cached weights
+        """
+
+        mx, my, GridX, GridY = make_points()
+        g = grid.GRID({'mask': False}, mx, my, GridX, GridY)
+        data = mx + 2.0 * my
+        data[[1, 5]] = np.nan
+        ind = ~np.isnan(data)
+
+        for _ in range(2):
+            for method in ['linear', 'cubic']:
+                expected = griddata((mx[ind], my[ind]), data[ind],
+                                    (GridX, GridY), method=method)
+                result = g.calculateInterpolation(data, method)
+                np.testing.assert_allclose(result, expected, rtol=1e-10,
+                                           atol=1e-10)
+
+    def testCacheSize(self):
+        """
+        The weights are only kept within the cache size
+        """
+
+        mx, my, GridX, GridY = make_points()
+        data = mx + 2.0 * my
+
+        g = grid.GRID({'mask': False}, mx, my, GridX, GridY, cache_size=0)
+        expected = griddata((mx, my), data, (GridX, GridY), method='linear')
+        np.testing.assert_allclose(g.calculateInterpolation(data, 'linear'),
+                                   expected, rtol=1e-10, atol=1e-10)
+        self.assertEqual(len(g.cache['linear']), 0)
+
+        g = grid.GRID({'mask': False}, mx, my, GridX, GridY, cache_size=64)
+        g.calculateInterpolation(data, 'linear')
+        self.assertEqual(len(g.cache['linear']), 1)
+
+
+class TestKriging(unittest.TestCase):
+    def setUp(self):
+        self.mx, self.my, self.GridX, self.GridY = make_points(npoints=15)
+        self.mz = np.zeros_like(self.mx)
+        self.GridZ = np.zeros_like(self.GridX)
+        self.data = np.sin(self.mx / 200.0) + np.cos(self.my / 300.0)
+
+        self.config = {'variogram_model': 'spherical',
+                       'variogram_parameters': {'sill': 1.5, 'range': 600.0,
+                                                'nugget': 0.05},
+                       'nlags': 6,
+                       'krig_weight': False,
+                       'anisotropy_scaling': 1.0,
+                       'anisotropy_angle': 0.0,
+                       'coordinates_type': 'euclidean',
+                       'krig_n_closest_points': None,
+                       'krig_variogram_fit': 'once',
+                       'detrend': False}
+
+    def execute(self, data, n_closest_points=None):
+        """
+        The kriged values and variance from pykrige
+        """
+
+        ind = ~np.isnan(data)
+        OK = OrdinaryKriging(self.mx[ind], self.my[ind], data[ind],
+                             variogram_model=self.config['variogram_model'],
+                             variogram_parameters=self.config[
+                                 'variogram_parameters'])
+
+        if n_closest_points is None:
+            z, ss = OK.execute('points', self.GridX.ravel(),
+                               self.GridY.ravel())
+        else:
+            z, ss = OK.execute('points', self.GridX.ravel(),
+                               self.GridY.ravel(), backend='loop',
+                               n_closest_points=n_closest_points)
+
+        return z.reshape(self.GridX.shape), ss.reshape(self.GridX.shape)
+
+    def krige(self, **kwargs):
+        self.config.update(kwargs)
+        return kriging.KRIGE(self.mx, self.my, self.mz, self.GridX,
+                             self.GridY, self.GridZ, self.config,
+                             variance=True)
+
+    def testExecute(self):
+        """
+        Kriging matches OrdinaryKriging.execute with missing stations
+        """
+
+        k = self.krige()
+        data = self.data.copy()
+
+        for missing in [[], [2, 7], []]:
+            data[:] = self.data
+            data[missing] = np.nan
+
+            v, ss = k.calculate(data)
+            z, zss = self.execute(data)
+            np.testing.assert_allclose(v, z, rtol=1e-8, atol=1e-10)
+            np.testing.assert_allclose(ss, zss, rtol=1e-8, atol=1e-10)
+
+        # the cached weights for each pattern of stations
+        self.assertEqual(len(k.cache), 2)
+
+    def testClosestPoints(self):
+        """
+        Kriging with the closest stations matches OrdinaryKriging.execute
+        """
+
+        v, ss = self.krige(krig_n_closest_points=5).calculate(self.data)
+        z, zss = self.execute(self.data, n_closest_points=5)
+
+        np.testing.assert_allclose(v, z, rtol=1e-8, atol=1e-10)
+        np.testing.assert_allclose(ss, zss, rtol=1e-8, atol=1e-10)
+
+
+class TestDK(unittest.TestCase):
+    @staticmethod
+    def krige_cell(ad, d, elevations):
+        """
+        Kriging weights of a single grid cell with the elimination of the
+        negative weights of the original krige.c
+        """
+
+        nsta = len(d)
+        use = np.ones(nsta, dtype=bool)
+        while True:
+            sidx = np.flatnonzero(use)
+            ns = len(sidx)
+
+            a = np.ones((ns + 1, ns + 1))
+            a[:ns, :ns] = ad[np.ix_(sidx, sidx)]
+            a[ns, ns] = 0
+            b = np.ones(ns + 1)
+            b[:ns] = d[sidx]
+            wcalc = np.linalg.solve(a, b)[:ns]
+
+            # the highest station with a negative weight
+            msave = -1
+            elevsave = 0.0
+            for m, wm in zip(sidx, wcalc):
+                if wm < 0 and elevations[m] > elevsave:
+                    msave = m
+                    elevsave = elevations[m]
+
+            if msave < 0:
+                w = np.zeros(nsta)
+                w[sidx] = wcalc
+                return w
+
+            use[msave] = False
+
+    def testSolveCells(self):
+        """
+        All the cells solved together are the same as each cell
+        """
+
+        mx, my, GridX, GridY = make_points(npoints=8)
+        mz = np.random.RandomState(1).uniform(1000, 2000, len(mx))
+
+        ad = np.sqrt((mx[:, np.newaxis] - mx)**2 +
+                     (my[:, np.newaxis] - my)**2)
+        dgrid = np.sqrt((GridX.ravel()[:, np.newaxis] - mx)**2 +
+                        (GridY.ravel()[:, np.newaxis] - my)**2)
+
+        w = dk.DK.solveCells(ad, dgrid, mz)
+        ref = np.array([self.krige_cell(ad, d, mz) for d in dgrid])
+
+        # stations were thrown out of some of the cells
+        self.assertTrue(np.any(np.sum(ref == 0, 1) > 1))
+
+        np.testing.assert_allclose(w, ref, rtol=1e-8, atol=1e-10)
+        np.testing.assert_allclose(np.sum(w, 1), 1, rtol=1e-8)
+        self.assertTrue(np.all(w >= 0))
+
+    def testWeights(self):
+        """
+        The weights for the stations with data in the grid layout
+        """
+
+        mx, my, GridX, GridY = make_points(npoints=8)
+        mz = np.random.RandomState(1).uniform(1000, 2000, len(mx))
+        config = {'dk_cache_size': 64, 'dk_cache_dir': None,
+                  'dk_nthreads': 2}
+
+        k = dk.DK(mx, my, mz, GridX, GridY, 1000 + GridX, config)
+        nan_val = np.zeros(len(mx), dtype=bool)
+        nan_val[[2, 5]] = True
+        k.setWeights(nan_val)
+
+        s = ~nan_val
+        ad = np.sqrt((mx[s, np.newaxis] - mx[s])**2 +
+                     (my[s, np.newaxis] - my[s])**2)
+        dgrid = np.sqrt((GridX.ravel()[:, np.newaxis] - mx[s])**2 +
+                        (GridY.ravel()[:, np.newaxis] - my[s])**2)
+        ref = np.array([self.krige_cell(ad, d, mz[s]) for d in dgrid])
+
+        self.assertEqual(k.weights.shape, GridX.shape + (6,))
+        np.testing.assert_allclose(k.weights.reshape((-1, 6)), ref,
+                                   rtol=1e-8, atol=1e-10)
+
+
+class TestRegrid(unittest.TestCase):
+    def setUp(self):
+        # rotated and sheared 6 x 8 model grid over a 50 m grid
+        i, j = np.meshgrid(np.arange(6), np.arange(8), indexing='ij')
+        self.names = ['grid_y{}_x{}'.format(a, b)
+                      for a, b in zip(i.ravel(), j.ravel())]
+        self.mx = 1000.0 + 300.0 * j.ravel() + 60.0 * i.ravel()
+        self.my = 500.0 + 250.0 * i.ravel() - 40.0 * j.ravel()
+        self.mz = 2000.0 + 0.3 * self.mx - 0.2 * self.my
+
+        self.GridX, self.GridY = np.meshgrid(np.arange(1500.0, 2800.0, 50.0),
+                                             np.arange(700.0, 1400.0, 50.0))
+        self.GridZ = 2000.0 + 0.3 * self.GridX - 0.2 * self.GridY
+
+    @staticmethod
+    def field(x, y):
+        return 3.0 + 0.01 * x - 0.02 * y
+
+    def testLinearField(self):
+        """
+        Bilinear regridding of a linear field is exact
+        """
+
+        r = regrid.REGRID(self.names, self.mx, self.my,
+                          self.GridX, self.GridY)
+        v = r.calculateRegrid(self.field(self.mx, self.my))
+
+        np.testing.assert_allclose(v, self.field(self.GridX, self.GridY),
+                                   rtol=1e-8, atol=1e-10)
+
+    def testBlock(self):
+        """
+        A block of time steps is the same as each time step
+        """
+
+        r = regrid.REGRID(self.names, self.mx, self.my,
+                          self.GridX, self.GridY, self.mz, self.GridZ)
+        data = np.column_stack([self.field(self.mx, self.my) * k + self.mz
+                                for k in range(1, 4)])
+        v = r.detrendedRegridBlock(data)
+
+        for t in range(data.shape[1]):
+            np.testing.assert_allclose(v[t], r.detrendedRegrid(data[:, t]),
+                                       rtol=1e-10)
+
+    def testDetrended(self):
+        """
+        Data that only depends on elevation is the trend at the grid
+        """
+
+        r = regrid.REGRID(self.names, self.mx, self.my,
+                          self.GridX, self.GridY, self.mz, self.GridZ)
+        v = r.detrendedRegrid(0.005 * self.mz - 4.0)
+
+        np.testing.assert_allclose(v, 0.005 * self.GridZ - 4.0, rtol=1e-8)
+        np.testing.assert_allclose(r.pv, [0.005, -4.0], rtol=1e-8)
+
+    def testNames(self):
+        """
+        Points must be named by the model grid index
+        """
+
+        self.assertRaises(ValueError, regrid.REGRID, ['a'] * 48,
+                          self.mx, self.my, self.GridX, self.GridY)
+
+
+class TestTrend(unittest.TestCase):
+    def testPolyfit(self):
+        """
+        Trend for each time step matches np.polyfit on the stations with data
+        """
+
+        rng = np.random.RandomState(1)
+        mz = rng.uniform(1000, 3000, 8)
+        data = 0.005 * mz[:, np.newaxis] + rng.normal(size=(8, 10))
+        data[rng.uniform(size=data.shape) < 0.3] = np.nan
+        data[:, 0] = np.nan
+        data[2, 0] = 4.0
+
+        pv = trend.elevation_trend(mz, data)
+
+        # a single station has no slope
+        np.testing.assert_allclose(pv[0], [0, 4.0])
+        for t in range(1, data.shape[1]):
+            ind = ~np.isnan(data[:, t])
+            np.testing.assert_allclose(pv[t],
+                                       np.polyfit(mz[ind], data[ind, t], 1),
+                                       rtol=1e-8, atol=1e-10)
+
+    def testConstraint(self):
+        """
+        Trends that do not meet the slope constraint are set to zero
+        """
+
+        mz = np.array([1000.0, 2000.0, 3000.0])
+        data = np.column_stack((mz * 0.01, -mz * 0.01))
+
+        pv = trend.elevation_trend(mz, data, flag=1)
+        np.testing.assert_allclose(pv[0], [0.01, 0], atol=1e-10)
+        np.testing.assert_array_equal(pv[1], [0, 0])
+
+        pv = trend.elevation_trend(mz, data, flag=-1)
+        np.testing.assert_array_equal(pv[0], [0, 0])
+        np.testing.assert_allclose(pv[1], [-0.01, 0], atol=1e-10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_topo
+----------------------------------
+
+Tests for the stoporad input file from `smrf.data.loadTopo`.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from smrf.data.loadTopo import topo
+from smrf.envphys import radiation
+
+
+def make_topo(tempDir, **kwargs):
+    """
+    Topo with a DEM of a few hills and only the attributes needed for
+    the stoporad input
+    """
+
+    t = topo.__new__(topo)
+    t._logger = logging.getLogger(__name__)
+    t.topoConfig = {'horizon_azimuths': 8}
+    t.topoConfig.update(kwargs)
+    t.tempDir = tempDir
+
+    t.ny, t.nx = 20, 25
+    t.x = 500000.0 + 50.0 * np.arange(t.nx)
+    t.y = 4800000.0 - 50.0 * np.arange(t.ny)
+    t.X, t.Y = np.meshgrid(t.x, t.y)
+
+    xx = (t.X - t.x[0]) / 1000.0
+    yy = (t.Y - t.y[-1]) / 1000.0
+    t.dem = 2000.0 + 300.0 * np.sin(3 * xx) * np.cos(4 * yy) + 100.0 * xx
+
+    return t
+
+
+class TestStoporadInput(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def assertBands(self, t):
+        """
+        The stoporad input has the DEM, the gradient and the viewf bands
+        """
+
+        bands = t.stoporad_in.bands
+        self.assertEqual(len(bands), 5)
+
+        tcf = radiation.terrain_config(t.slope, t.sky_view)
+        self.assertTrue(np.any(tcf > 0))
+
+        for b, v in zip(bands, [t.dem, t.slope, t.aspect, t.sky_view, tcf]):
+            # 16 bit linear quantization of the band range
+            atol = (np.max(v) - np.min(v)) / (2**16 - 1)
+            np.testing.assert_allclose(b.data, v, rtol=0, atol=atol)
+
+    def testBands(self):
+        """
+        Five bands in the order written by mux in the IPW version
+        """
+
+        t = make_topo(self.tempDir)
+        t.stoporadInput()
+
+        self.assertBands(t)
+
+    def testCache(self):
+        """
+        The cached stoporad input has the same bands, and a cache from
+        another version is not used
+        """
+
+        cache = tempfile.mkdtemp(dir=self.tempDir)
+
+        t = make_topo(self.tempDir, topo_cache_dir=cache)
+        t.stoporadInput()
+        cache_file = t.cacheFile()
+        self.assertTrue(os.path.isfile(cache_file))
+
+        c = make_topo(self.tempDir, topo_cache_dir=cache)
+        c.stoporadInput()
+        self.assertEqual(c.cacheFile(), cache_file)
+        np.testing.assert_array_equal(c.sky_view, t.sky_view)
+        self.assertBands(c)
+
+        c.cache_version = 'old'
+        self.assertNotEqual(c.cacheFile(), cache_file)
+
+
+if __name__ == '__main__':
+    unittest.main()
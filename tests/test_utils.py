@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_utils
+----------------------------------
+
+Tests for the time step context in `smrf.utils.utils`.
+"""
+
+import shutil
+import unittest
+from datetime import datetime
+
+import numpy as np
+import pytz
+
+from smrf.distribute.solar import solar
+from smrf.envphys import radiation
+from smrf.utils import utils
+
+
+class TestTimestepContext(unittest.TestCase):
+    lat = 43.6
+    lon = -116.2
+
+    def setUp(self):
+        # across the start of the water year and a leap day, with the time
+        # zone replaced as the framework makes the dates
+        tzinfo = pytz.timezone('UTC')
+        dates = [datetime(2015, 9, 30, 22), datetime(2015, 10, 1, 0),
+                 datetime(2015, 10, 1, 13, 30), datetime(2016, 2, 29, 12),
+                 datetime(2016, 3, 1, 6), datetime(2016, 9, 30, 23)]
+        self.date_time = [d.replace(tzinfo=tzinfo) for d in dates]
+
+        cosz, azimuth = radiation.sunang_vector(self.date_time,
+                                                self.lat, self.lon)
+        self.context = utils.timestep_context(self.date_time, cosz, azimuth)
+
+    def testRadiationDates(self):
+        """
+        The water day, water year and time zone are the same as for each
+        time step
+        """
+
+        s = solar.__new__(solar)
+        for i, d in enumerate(self.date_time):
+            c = self.context.loc[d]
+            wy_day, wyear, tz_min_west = s.radiation_dates(d)
+
+            self.assertEqual(c['index'], i)
+            self.assertAlmostEqual(c['wy_day'], wy_day, places=10)
+            self.assertEqual(c['wyear'], wyear)
+            self.assertEqual(c['tz_min_west'], tz_min_west)
+
+            # the same values as a tuple from the context
+            self.assertEqual(s.radiation_dates(d, c),
+                             (c['wy_day'], wyear, c['tz_min_west']))
+
+        np.testing.assert_array_equal(self.context['wyear'],
+                                      [2015, 2016, 2016, 2016, 2016, 2016])
+        np.testing.assert_array_equal(self.context['tz_min_west'], 0)
+
+    def testTimeZone(self):
+        """
+        The water day is in the time zone of the dates
+        """
+
+        tzinfo = pytz.FixedOffset(-420)
+        dates = [datetime(2015, 10, 1, 0, tzinfo=tzinfo),
+                 datetime(2016, 10, 2, 6, tzinfo=tzinfo)]
+        c = utils.timestep_context(dates, np.zeros(2), np.zeros(2))
+
+        np.testing.assert_array_equal(c['tz_min_west'], 420)
+        np.testing.assert_allclose(c['wy_day'], [0, 1.25])
+        np.testing.assert_array_equal(c['wyear'], [2016, 2017])
+
+    def testSunAngle(self):
+        """
+        The sun angles are the same as for each time step
+        """
+
+        for d in self.date_time:
+            cosz, azimuth = radiation.sunang_vector([d], self.lat, self.lon)
+            self.assertEqual(self.context.loc[d, 'cosz'], cosz[0])
+            self.assertEqual(self.context.loc[d, 'azimuth'], azimuth[0])
+
+    @unittest.skipUnless(shutil.which('sunang'), 'requires the IPW sunang')
+    def testIPWSunAngle(self):
+        """
+        The sun angles are close to the IPW sunang for each time step
+        """
+
+        for d in self.date_time:
+            cosz, azimuth = radiation.sunang(d.astimezone(pytz.utc),
+                                             self.lat, self.lon, zone=0)
+            self.assertAlmostEqual(self.context.loc[d, 'cosz'], cosz,
+                                   delta=5e-3)
+            if cosz > 0:
+                self.assertAlmostEqual(self.context.loc[d, 'azimuth'],
+                                       azimuth, delta=0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()